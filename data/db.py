@@ -0,0 +1,114 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# How long (seconds) a connection waits on another process's lock before giving up.
+# Kept short because retry_on_busy retries on top of it: a write gives up after at
+# most max_busy_wait() seconds (about 14 s) instead of stacking long waits.
+BUSY_TIMEOUT = 2
+# Retry schedule for writes that still hit "database is locked"
+RETRY_ATTEMPTS = 6
+RETRY_BASE_DELAY = 0.05
+# Pause (seconds) between rounds of waiting for a file lock on Windows
+LOCK_RETRY_DELAY = 0.1
+
+# Databases already switched to WAL by this process
+_wal_enabled = set()
+_wal_lock = threading.Lock()
+
+def connect(path):
+    """
+    Open a SQLite connection that is safe to share a data directory with other
+    app instances: WAL journaling (readers never block the writer), a busy
+    timeout instead of failing immediately, and NORMAL sync, which is durable
+    in WAL mode.
+    """
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+    conn.execute(f'PRAGMA busy_timeout = {int(BUSY_TIMEOUT * 1000)}')
+
+    with _wal_lock:
+        if path not in _wal_enabled:
+            try:
+                # journal_mode is stored in the database file, so this only has to succeed once
+                mode = conn.execute('PRAGMA journal_mode = WAL').fetchone()[0]
+                if mode.lower() == 'wal':
+                    _wal_enabled.add(path)
+            except sqlite3.OperationalError as e:
+                print(f"Could not enable WAL for {path} yet: {e}")
+
+    conn.execute('PRAGMA synchronous = NORMAL')
+    return conn
+
+def is_busy_error(error):
+    """True if a sqlite3 error means another connection holds the lock."""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in message or 'busy' in message)
+
+def max_busy_wait(attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY, timeout=None):
+    """Upper bound (seconds) on how long retry_on_busy blocks a write before it raises."""
+    timeout = BUSY_TIMEOUT if timeout is None else timeout
+    # Every attempt can wait out the busy timeout; the sleeps between them are at most 1.5x their base
+    backoff = sum(base_delay * (2 ** attempt) * 1.5 for attempt in range(attempts - 1))
+    return attempts * timeout + backoff
+
+def retry_on_busy(func, attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY):
+    """Call func(), retrying with jittered exponential backoff while the database is busy."""
+    for attempt in range(attempts):
+        try:
+            return func()
+        except sqlite3.OperationalError as e:
+            if not is_busy_error(e) or attempt == attempts - 1:
+                raise
+            time.sleep(base_delay * (2 ** attempt) * (0.5 + random.random()))
+
+@contextmanager
+def immediate_transaction(conn):
+    """
+    Run a block as one write transaction that takes the write lock up front.
+    Read-then-write sequences need this: a deferred transaction that tries to
+    upgrade after another process committed fails at once instead of waiting.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """
+    Hold an exclusive advisory lock on path + '.lock' across processes.
+    With blocking=False, raises BlockingIOError if another process holds it.
+    """
+    lock_file = open(path + '.lock', 'a+b')
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            lock_file.seek(0)
+            if blocking:
+                # LK_LOCK only retries for ~10 seconds, so keep trying (with a pause between rounds)
+                while True:
+                    try:
+                        msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(LOCK_RETRY_DELAY)
+            else:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+                except OSError:
+                    raise BlockingIOError(f"{path} is locked by another process")
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        yield
+
+    finally:
+        # Closing the file releases the lock on every platform
+        lock_file.close()
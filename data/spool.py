@@ -0,0 +1,196 @@
+import json
+import os
+import struct
+import threading
+import zlib
+
+from data.db import file_lock
+
+# Append-only file that failed or deferred writes are spooled to
+SPOOL_FILE = 'weather_spool.bin'
+# Every record is prefixed with its payload length and a CRC32 of the payload,
+# so a record torn by a crash or full disk is detected and never replayed
+RECORD_HEADER = struct.Struct('>II')
+
+# Serializes appends and drains within this process (file_lock covers other processes)
+_spool_lock = threading.Lock()
+
+def _draining_path(path):
+    """Path the spool is moved to while it is being replayed."""
+    return path + '.draining'
+
+def append_record(record, path=SPOOL_FILE):
+    """Durably append one JSON-serializable record to the spool. Returns True on success."""
+    payload = json.dumps(record, separators=(',', ':'), default=str).encode('utf-8')
+    frame = RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+    try:
+        with _spool_lock, file_lock(path):
+            with open(path, 'ab') as f:
+                # One write per record keeps appends from interleaving
+                f.write(frame)
+                f.flush()
+                os.fsync(f.fileno())
+        return True
+
+    except OSError as e:
+        print(f"Error appending to spool: {e}")
+        return False
+
+def _valid_record_at(buffer, offset):
+    """(record, end offset) if a complete, intact record starts at offset, else None."""
+    if offset + RECORD_HEADER.size > len(buffer):
+        return None
+    length, checksum = RECORD_HEADER.unpack_from(buffer, offset)
+    start = offset + RECORD_HEADER.size
+    payload = buffer[start:start + length]
+    if len(payload) < length or zlib.crc32(payload) != checksum:
+        return None
+    try:
+        return json.loads(payload.decode('utf-8')), start + length
+    except ValueError:
+        return None
+
+def scan_records(buffer):
+    """
+    Split spool bytes into (records, corrupt) where corrupt lists the byte
+    ranges that did not hold intact records. After a bad record the scan
+    resyncs on the next offset where an intact record starts; a short record
+    at the very end is a torn append and is dropped rather than reported.
+    """
+    records, corrupt = [], []
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(buffer):
+        found = _valid_record_at(buffer, offset)
+        if found is not None:
+            record, offset = found
+            records.append(record)
+            continue
+
+        length, _ = RECORD_HEADER.unpack_from(buffer, offset)
+        resync = next((candidate for candidate in range(offset + 1, len(buffer) - RECORD_HEADER.size + 1)
+                       if _valid_record_at(buffer, candidate) is not None), None)
+        if resync is None:
+            if offset + RECORD_HEADER.size + length > len(buffer):
+                print(f"Ignoring torn spool record at byte {offset}")
+            else:
+                print(f"Skipping corrupt spool bytes {offset}-{len(buffer)}")
+                corrupt.append((offset, len(buffer)))
+            return records, corrupt
+
+        print(f"Skipping corrupt spool bytes {offset}-{resync}")
+        corrupt.append((offset, resync))
+        offset = resync
+
+    return records, corrupt
+
+def _read_buffer(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return b''
+
+def read_records(path=SPOOL_FILE):
+    """Read all intact records from a spool file, skipping corrupt ones and a torn tail."""
+    return scan_records(_read_buffer(path))[0]
+
+def _quarantine(buffer, ranges, path):
+    """Append corrupt byte ranges to <path>.corrupt so they can be inspected instead of lost."""
+    with open(path + '.corrupt', 'ab') as f:
+        for start, end in ranges:
+            f.write(buffer[start:end])
+        f.flush()
+        os.fsync(f.fileno())
+
+def _write_records(records, path):
+    """Rewrite a spool file so it holds exactly the given records."""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        for record in records:
+            payload = json.dumps(record, separators=(',', ':'), default=str).encode('utf-8')
+            f.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def pending_count(path=SPOOL_FILE):
+    """Number of records waiting to be replayed."""
+    return len(read_records(_draining_path(path))) + len(read_records(path))
+
+def drain(apply_batch, batch_size=500, path=SPOOL_FILE):
+    """
+    Replay spooled records through apply_batch(records) in batches.
+
+    apply_batch should write a batch atomically and raise on failure. Records
+    from a failed batch onwards stay spooled for the next drain, so nothing is
+    lost and nothing already applied is replayed twice. Corrupt records are
+    skipped and their bytes moved to <path>.corrupt. Returns the number of
+    records applied.
+    """
+    try:
+        # Only one process may replay at a time, or records would be applied twice
+        with file_lock(_draining_path(path), blocking=False):
+            return _drain_locked(apply_batch, batch_size, path)
+    except BlockingIOError:
+        return 0
+
+def _drain_locked(apply_batch, batch_size, path):
+    """Body of drain(), run while holding the cross-process drain lock."""
+    draining_path = _draining_path(path)
+
+    with _spool_lock, file_lock(path):
+        # Move the live spool aside so new appends go to a fresh file while we replay
+        if not os.path.exists(draining_path) and os.path.exists(path):
+            os.replace(path, draining_path)
+
+    buffer = _read_buffer(draining_path)
+    records, corrupt = scan_records(buffer)
+    if corrupt:
+        # Keep the unreadable bytes before the file holding them is rewritten or removed
+        _quarantine(buffer, corrupt, path)
+        _write_records(records, draining_path)
+    if not records:
+        if os.path.exists(draining_path):
+            os.remove(draining_path)
+        return 0
+
+    applied = 0
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        try:
+            apply_batch(batch)
+        except Exception as e:
+            print(f"Spool replay paused after {applied} records: {e}")
+            # Keep only what has not been applied yet
+            _write_records(records[start:], draining_path)
+            return applied
+        applied += len(batch)
+
+    os.remove(draining_path)
+    return applied
+
+class SpoolDrainer(threading.Thread):
+    """Background thread that periodically replays the spool."""
+
+    def __init__(self, apply_batch, interval=30, batch_size=500, path=SPOOL_FILE):
+        super().__init__(daemon=True)
+        self.apply_batch = apply_batch
+        self.interval = interval
+        self.batch_size = batch_size
+        self.path = path
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                applied = drain(self.apply_batch, self.batch_size, self.path)
+                if applied:
+                    print(f"Replayed {applied} spooled records")
+            except Exception as e:
+                print(f"Error draining spool: {e}")
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        """Ask the drainer to exit after its current pass."""
+        self._stop_event.set()
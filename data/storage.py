@@ -1,19 +1,47 @@
 import sqlite3
 import json
 import csv
+import io
 import os
+import time
+import zlib
 from datetime import datetime
 
+from data.db import connect, retry_on_busy, file_lock
+from data.spool import append_record, drain, SpoolDrainer
+
 # Name of the SQLite database file
 DB_NAME = 'weather_data.db'
 # Name of the CSV file
 CSV_FILE = 'weather_data.csv'  # This will create the new format
+# Compressed snapshot of the last rendered view, painted on startup before any network call
+LAST_VIEW_FILE = 'last_view.bin'
+# Format of the text timestamp column
+TIMESTAMP_FORMAT = '%m-%d-%y %H:%M:%S'
+
+# Optional compressed time-series store for high-frequency history (see data/timeseries.py)
+USE_TIMESERIES_STORE = os.getenv('USE_TIMESERIES_STORE', 'False').lower() == 'true'
+# Numeric columns kept as history series
+HISTORY_METRICS = [
+    'temperature', 'feels_like', 'humidity', 'precipitation',
+    'pressure', 'wind_speed', 'visibility'
+]
+
+if USE_TIMESERIES_STORE:
+    from data import timeseries
+
+# Converts a text timestamp (mm-dd-yy hh:mm:ss) to epoch seconds, or None if unparseable
+def _parse_timestamp(timestamp):
+    try:
+        return int(datetime.strptime(timestamp, TIMESTAMP_FORMAT).timestamp())
+    except (TypeError, ValueError):
+        return None
 
 # Initializes the database and creates the weather table if it doesn't exist
 def init_db():
     """Initialize database and ensure schema is up to date."""
     # Connect to the SQLite database (creates file if it doesn't exist)
-    conn = sqlite3.connect(DB_NAME)
+    conn = connect(DB_NAME)
     c = conn.cursor()
     
     # Get existing columns
@@ -40,7 +68,8 @@ def init_db():
                 sunrise TEXT DEFAULT "",
                 sunset TEXT DEFAULT "",
                 description TEXT,
-                timestamp TEXT
+                timestamp TEXT,
+                observed_at INTEGER
             )
         ''')
     else:
@@ -54,125 +83,229 @@ def init_db():
             'visibility': 'REAL DEFAULT 0',
             'sunrise': 'TEXT DEFAULT ""',
             'sunset': 'TEXT DEFAULT ""',
-            'description': 'TEXT'
+            'description': 'TEXT',
+            'observed_at': 'INTEGER'
         }
         
         for column, data_type in required_columns.items():
             if column not in existing_columns:
                 print(f"Adding missing column: {column}")
                 c.execute(f'ALTER TABLE weather ADD COLUMN {column} {data_type}')
+        
+        # Backfill epoch times for rows saved before observed_at existed
+        c.execute('SELECT id, timestamp FROM weather WHERE observed_at IS NULL')
+        backfill = [(_parse_timestamp(timestamp), row_id) for row_id, timestamp in c.fetchall()]
+        if backfill:
+            c.executemany('UPDATE weather SET observed_at = ? WHERE id = ?', backfill)
+    
+    # History range queries go through this index
+    c.execute('CREATE INDEX IF NOT EXISTS idx_weather_city_time ON weather (city, observed_at)')
     
     conn.commit()
     conn.close()
+    
+    if USE_TIMESERIES_STORE:
+        timeseries.init_ts_db()
     print("Database initialization complete")
 
-# Saves weather data to both SQLite database and CSV file
-def save_weather_data(data):
-    try:
-        # Save to SQLite database (updated for new fields)
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        timestamp = datetime.now().strftime('%m-%d-%y %H:%M:%S')
-        
-        # Extract all data fields with defaults
-        city = data.get('city', '')
-        state = data.get('state', '')  # You may need to add state to your API response
-        country = data.get('country', '')
-        temperature = data.get('temperature', 0)
-        feels_like = data.get('feels_like', 0)
-        humidity = data.get('humidity', 0)
-        precipitation = data.get('precipitation', 0)
-        pressure = data.get('pressure', 0)
-        wind_speed = data.get('wind_speed', data.get('wind', {}).get('speed', 0))
-        wind_direction = data.get('wind_deg', data.get('wind', {}).get('deg', 0))
-        visibility = data.get('visibility', 0)
-        
-        # Format sunrise/sunset times
-        sunrise = ''
-        sunset = ''
-        if data.get('sunrise'):
-            sunrise = datetime.fromtimestamp(data['sunrise']).strftime('%H:%M:%S')
-        if data.get('sunset'):
-            sunset = datetime.fromtimestamp(data['sunset']).strftime('%H:%M:%S')
+# Column order used when inserting weather rows
+WEATHER_COLUMNS = [
+    'city', 'state', 'country', 'temperature', 'feels_like', 'humidity',
+    'precipitation', 'pressure', 'wind_speed', 'wind_direction', 'visibility',
+    'sunrise', 'sunset', 'description', 'timestamp', 'observed_at'
+]
+
+# Define fieldnames to match your exact CSV format
+CSV_FIELDNAMES = [
+    'current time (mm-dd-yy hh:mm:ss)', 'City ', 'State', 'Country', 'Temperature', 
+    'Feels Like', 'Humidity', 'Precipitation', 'Pressure', 
+    'Wind Speed', 'Wind Direction', 'Visibility', 'Sunrise', 'Sunset'
+]
+
+# Format sunrise/sunset times as HH:MM:SS strings
+def _format_sun_times(data):
+    sunrise = ''
+    sunset = ''
+    if data.get('sunrise'):
+        sunrise = datetime.fromtimestamp(data['sunrise']).strftime('%H:%M:%S')
+    if data.get('sunset'):
+        sunset = datetime.fromtimestamp(data['sunset']).strftime('%H:%M:%S')
+    return sunrise, sunset
+
+# Builds the weather table row for a snapshot (timestamped now, so replays keep the original time)
+def _weather_row(data):
+    sunrise, sunset = _format_sun_times(data)
+    now = datetime.now()
+    
+    # Extract all data fields with defaults
+    return {
+        'city': data.get('city', ''),
+        'state': data.get('state', ''),  # You may need to add state to your API response
+        'country': data.get('country', ''),
+        'temperature': data.get('temperature', 0),
+        'feels_like': data.get('feels_like', 0),
+        'humidity': data.get('humidity', 0),
+        'precipitation': data.get('precipitation', 0),
+        'pressure': data.get('pressure', 0),
+        'wind_speed': data.get('wind_speed', data.get('wind', {}).get('speed', 0)),
+        'wind_direction': data.get('wind_deg', data.get('wind', {}).get('deg', 0)),
+        'visibility': data.get('visibility', 0),
+        'sunrise': sunrise,
+        'sunset': sunset,
+        'description': data.get('description', ''),
+        'timestamp': now.strftime(TIMESTAMP_FORMAT),
+        'observed_at': int(now.timestamp())
+    }
+
+# Builds the CSV mirror row for a snapshot
+def _csv_row(data):
+    sunrise, sunset = _format_sun_times(data)
+    
+    # Extract wind data
+    wind_data = data.get('wind', {})
+    wind_speed = data.get('wind_speed', wind_data.get('speed', 0))
+    wind_direction = data.get('wind_deg', wind_data.get('deg', 0))
+    
+    # Data row with exact field names, time formatted as mm-dd-yy hh:mm:ss
+    return {
+        'current time (mm-dd-yy hh:mm:ss)': datetime.now().strftime('%m-%d-%y %H:%M:%S'),
+        'City ': data.get('city', ''),
+        'State': data.get('state', ''),
+        'Country': data.get('country', ''),
+        'Temperature': data.get('temperature', 0),
+        'Feels Like': data.get('feels_like', 0),
+        'Humidity': data.get('humidity', 0),
+        'Precipitation': data.get('precipitation', 0),
+        'Pressure': data.get('pressure', 0),
+        'Wind Speed': wind_speed,
+        'Wind Direction': wind_direction,
+        'Visibility': data.get('visibility', 0),
+        'Sunrise': sunrise,
+        'Sunset': sunset
+    }
+
+# Inserts weather rows in a single transaction
+def _insert_weather_rows(rows):
+    for row in rows:
+        # Rows spooled by older versions only carry the text timestamp
+        if row.get('observed_at') is None:
+            row['observed_at'] = _parse_timestamp(row.get('timestamp'))
+    
+    placeholders = ', '.join('?' for _ in WEATHER_COLUMNS)
+    values = [tuple(row.get(column) for column in WEATHER_COLUMNS) for row in rows]
+    
+    def insert():
+        conn = connect(DB_NAME)
+        try:
+            conn.executemany(
+                f"INSERT INTO weather ({', '.join(WEATHER_COLUMNS)}) VALUES ({placeholders})",
+                values
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    
+    # Other app instances may be writing too - back off and retry rather than fail
+    retry_on_busy(insert)
+    
+    if USE_TIMESERIES_STORE:
+        try:
+            timeseries.append_snapshots([
+                (row['city'], row['observed_at'], {metric: row.get(metric) for metric in HISTORY_METRICS})
+                for row in rows if row.get('observed_at') is not None
+            ])
+        except sqlite3.Error as e:
+            print(f"Error appending to time-series store: {e}")
+
+# Appends rows to the CSV mirror, raising on failure
+def _append_csv_rows(rows):
+    # The lock makes each batch of rows land whole even with several app instances appending
+    with file_lock(CSV_FILE):
+        file_exists = os.path.exists(CSV_FILE) and os.path.getsize(CSV_FILE) > 0
         
-        description = data.get('description', '')
+        # Format the whole batch first and append it with a single write
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDNAMES)
         
-        c.execute('''
-            INSERT INTO weather (city, state, country, temperature, feels_like, humidity, 
-                               precipitation, pressure, wind_speed, wind_direction, visibility,
-                               sunrise, sunset, description, timestamp)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (city, state, country, temperature, feels_like, humidity, precipitation,
-              pressure, wind_speed, wind_direction, visibility, sunrise, sunset, description, timestamp))
-        conn.commit()
-        conn.close()
+        # Write header if file is new
+        if not file_exists:
+            writer.writeheader()
         
-        # Also save to CSV file
-        save_to_csv(data)
+        writer.writerows(rows)
         
-    except sqlite3.Error as e:
-        print(f"Error saving weather data: {e}")
+        with open(CSV_FILE, 'a', newline='', encoding='utf-8') as csvfile:
+            csvfile.write(buffer.getvalue())
+            csvfile.flush()
+
+# Saves weather data to both SQLite database and CSV file.
+# Rows that cannot be written right now (or when defer=True) go to the spool and are replayed later.
+def save_weather_data(data, defer=False):
+    row = _weather_row(data)
+    
+    if defer:
+        append_record({'kind': 'weather', 'row': row})
+    else:
+        try:
+            _insert_weather_rows([row])
+        except sqlite3.Error as e:
+            print(f"Error saving weather data, spooling for later: {e}")
+            append_record({'kind': 'weather', 'row': row})
+    
+    # Also save to CSV file
+    save_to_csv(data, defer=defer)
 
 # Save weather data to CSV file with your specified format
-def save_to_csv(data):
+def save_to_csv(data, defer=False):
+    row = _csv_row(data)
+    
+    if defer:
+        append_record({'kind': 'csv', 'row': row})
+        return
+    
     try:
-        file_exists = os.path.exists(CSV_FILE)
-        
-        with open(CSV_FILE, 'a', newline='', encoding='utf-8') as csvfile:
-            # Define fieldnames to match your exact format
-            fieldnames = [
-                'current time (mm-dd-yy hh:mm:ss)', 'City ', 'State', 'Country', 'Temperature', 
-                'Feels Like', 'Humidity', 'Precipitation', 'Pressure', 
-                'Wind Speed', 'Wind Direction', 'Visibility', 'Sunrise', 'Sunset'
-            ]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            
-            # Write header if file is new
-            if not file_exists:
-                writer.writeheader()
-            
-            # Format current time as mm-dd-yy hh:mm:ss
-            current_time = datetime.now().strftime('%m-%d-%y %H:%M:%S')
-            
-            # Extract wind data
-            wind_data = data.get('wind', {})
-            wind_speed = data.get('wind_speed', wind_data.get('speed', 0))
-            wind_direction = data.get('wind_deg', wind_data.get('deg', 0))
-            
-            # Format sunrise/sunset times
-            sunrise = ''
-            sunset = ''
-            if data.get('sunrise'):
-                sunrise = datetime.fromtimestamp(data['sunrise']).strftime('%H:%M:%S')
-            if data.get('sunset'):
-                sunset = datetime.fromtimestamp(data['sunset']).strftime('%H:%M:%S')
-            
-            # Write data row with exact field names
-            writer.writerow({
-                'current time (mm-dd-yy hh:mm:ss)': current_time,
-                'City ': data.get('city', ''),
-                'State': data.get('state', ''),
-                'Country': data.get('country', ''),
-                'Temperature': data.get('temperature', 0),
-                'Feels Like': data.get('feels_like', 0),
-                'Humidity': data.get('humidity', 0),
-                'Precipitation': data.get('precipitation', 0),
-                'Pressure': data.get('pressure', 0),
-                'Wind Speed': wind_speed,
-                'Wind Direction': wind_direction,
-                'Visibility': data.get('visibility', 0),
-                'Sunrise': sunrise,
-                'Sunset': sunset
-            })
-            
-    except Exception as e:
-        print(f"Error saving to CSV: {e}")
+        _append_csv_rows([row])
+    except OSError as e:
+        print(f"Error saving to CSV, spooling for later: {e}")
+        append_record({'kind': 'csv', 'row': row})
+
+# Replays one batch of spooled records; raises so the spool keeps them if the DB is still unavailable
+def _replay_spooled(records):
+    weather_rows = [record['row'] for record in records if record.get('kind') == 'weather']
+    csv_rows = [record['row'] for record in records if record.get('kind') == 'csv']
+    
+    if weather_rows:
+        _insert_weather_rows(weather_rows)
+    if csv_rows:
+        try:
+            _append_csv_rows(csv_rows)
+        except OSError as e:
+            # The weather rows of this batch are already committed, so respool only the
+            # CSV rows instead of failing the batch (which would replay the weather rows)
+            print(f"Error replaying CSV rows, respooling: {e}")
+            for csv_row in csv_rows:
+                append_record({'kind': 'csv', 'row': csv_row})
+
+# Replays everything currently in the spool into SQLite and the CSV mirror
+def drain_spool(batch_size=500):
+    """Replay spooled writes in batches. Returns the number of records applied."""
+    return drain(_replay_spooled, batch_size)
+
+_spool_drainer = None
+
+# Starts the background thread that replays the spool once the database is available
+def start_spool_drainer(interval=30):
+    """Start (once) the background spool drainer and return it."""
+    global _spool_drainer
+    if _spool_drainer is None or not _spool_drainer.is_alive():
+        _spool_drainer = SpoolDrainer(_replay_spooled, interval=interval)
+        _spool_drainer.start()
+    return _spool_drainer
 
 # Loads the most recently saved weather data from the database
 def load_weather_data():
     try:
         # Connect to the database
-        conn = sqlite3.connect(DB_NAME)
+        conn = connect(DB_NAME)
         c = conn.cursor()
         # Select the most recent weather entry with all fields
         c.execute('''SELECT city, state, country, temperature, feels_like, humidity, 
@@ -211,6 +344,117 @@ def load_weather_data():
         print(f"Error loading weather data: {e}")
         return None
 
+# Converts a datetime or epoch value to epoch seconds
+def _to_epoch(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    return int(value)
+
+# Loads a city's weather history between start and end (datetimes or epoch seconds)
+def get_weather_history(city, start=None, end=None, metrics=None):
+    """
+    Return history rows as dictionaries with 'observed_at' (epoch seconds) and one
+    key per requested metric, oldest first. Served from the compressed time-series
+    store when USE_TIMESERIES_STORE is enabled, otherwise from the weather table.
+    """
+    metrics = [metric for metric in (metrics or HISTORY_METRICS) if metric in HISTORY_METRICS]
+    start = _to_epoch(start)
+    end = _to_epoch(end)
+    
+    if USE_TIMESERIES_STORE:
+        # Merge the per-metric series back into rows keyed by timestamp
+        rows = {}
+        for metric in metrics:
+            for timestamp, value in timeseries.query_range(city, metric, start, end):
+                rows.setdefault(timestamp, {'observed_at': timestamp})[metric] = value
+        return [rows[timestamp] for timestamp in sorted(rows)]
+    
+    try:
+        conn = connect(DB_NAME)
+        c = conn.cursor()
+        query = f"SELECT observed_at, {', '.join(metrics)} FROM weather WHERE city = ?"
+        params = [city]
+        if start is not None:
+            query += ' AND observed_at >= ?'
+            params.append(start)
+        if end is not None:
+            query += ' AND observed_at <= ?'
+            params.append(end)
+        c.execute(query + ' ORDER BY observed_at', params)
+        history = c.fetchall()
+        conn.close()
+        
+        return [dict(zip(['observed_at'] + metrics, row)) for row in history]
+        
+    except sqlite3.Error as e:
+        print(f"Error loading weather history: {e}")
+        return []
+
+# Copies the existing weather table into the time-series store (one-off migration)
+def backfill_timeseries():
+    """
+    Load every weather row into the compressed time-series store. Returns the number of rows.
+    Each series' backfilled time range replaces what the store holds there, so running it
+    again (or after live appends) doesn't duplicate points.
+    """
+    from data import timeseries
+    timeseries.init_ts_db()
+    
+    conn = connect(DB_NAME)
+    rows = conn.execute(
+        f"SELECT city, observed_at, {', '.join(HISTORY_METRICS)} FROM weather "
+        "WHERE observed_at IS NOT NULL ORDER BY city, observed_at"
+    ).fetchall()
+    conn.close()
+    
+    series = {}
+    for row in rows:
+        for metric, value in zip(HISTORY_METRICS, row[2:]):
+            series.setdefault((row[0], metric), []).append((row[1], value))
+    for (city, metric), points in series.items():
+        timeseries.bulk_load(city, metric, points)
+    
+    return len(rows)
+
+# Persists the last rendered view (conditions, forecast, alerts, sun times) for offline cold starts
+def save_last_view(data, alerts=None):
+    """Save the last rendered view as compressed JSON, replacing the previous snapshot atomically."""
+    view = {
+        'saved_at': time.time(),
+        'data': data,
+        'alerts': alerts or []
+    }
+    try:
+        payload = zlib.compress(json.dumps(view, separators=(',', ':'), default=str).encode('utf-8'))
+        
+        # Write to a temporary file first so a crash never leaves a half-written snapshot
+        temp_path = LAST_VIEW_FILE + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(temp_path, LAST_VIEW_FILE)
+        
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Error saving last view: {e}")
+
+# Loads the last rendered view saved by save_last_view
+def load_last_view():
+    """Return the last rendered view as {'saved_at', 'data', 'alerts'}, or None if unavailable."""
+    try:
+        with open(LAST_VIEW_FILE, 'rb') as f:
+            view = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+        
+        if not isinstance(view, dict) or not view.get('data'):
+            return None
+        return view
+        
+    except FileNotFoundError:
+        return None
+    except (OSError, zlib.error, ValueError) as e:
+        print(f"Error loading last view: {e}")
+        return None
+
 # Function to get state from coordinates (optional enhancement)
 def get_state_from_coords(lat, lon):
     """
@@ -218,6 +462,3 @@ def get_state_from_coords(lat, lon):
     For now, returns empty string - you could integrate with a geocoding service
     """
     return ""
-
-# Initialize the database when the module is imported
-init_db()
\ No newline at end of file
@@ -0,0 +1,374 @@
+import sqlite3
+import struct
+
+from data.db import connect, immediate_transaction, retry_on_busy
+
+# Database holding the compressed per-city, per-metric series
+TS_DB = 'weather_timeseries.db'
+# Points per compressed block; a block is the unit that range queries decode or skip
+BLOCK_SIZE = 240
+# A series' open tail block is kept as raw (timestamp, value) records, so an append
+# only adds 16 bytes; it is compressed (sealed) once full or when a new block starts
+_RAW_POINT = struct.Struct('>qd')
+
+# Delta-of-delta buckets as (control bits, value bits, offset), following Gorilla.
+# The offset shifts the signed range into an unsigned field, e.g. [-63, 64] -> [0, 127].
+_DOD_BUCKETS = [
+    ('10', 7, 63),
+    ('110', 9, 255),
+    ('1110', 12, 2047),
+]
+
+def _float_to_bits(value):
+    return struct.unpack('>Q', struct.pack('>d', float(value)))[0]
+
+def _bits_to_float(bits):
+    return struct.unpack('>d', struct.pack('>Q', bits))[0]
+
+class BitWriter:
+    """Accumulates variable-width bit fields and packs them into bytes."""
+
+    def __init__(self):
+        self.chunks = []
+        self.length = 0
+
+    def write(self, value, width):
+        self.chunks.append(format(value, f'0{width}b'))
+        self.length += width
+
+    def write_flags(self, flags):
+        self.chunks.append(flags)
+        self.length += len(flags)
+
+    def to_bytes(self):
+        bits = ''.join(self.chunks)
+        padding = (-len(bits)) % 8
+        bits += '0' * padding
+        return int(bits, 2).to_bytes(len(bits) // 8, 'big') if bits else b''
+
+class BitReader:
+    """Reads variable-width bit fields back out of packed bytes."""
+
+    def __init__(self, payload):
+        self.bits = format(int.from_bytes(payload, 'big'), f'0{len(payload) * 8}b') if payload else ''
+        self.position = 0
+
+    def read(self, width):
+        value = int(self.bits[self.position:self.position + width], 2)
+        self.position += width
+        return value
+
+    def read_bit(self):
+        bit = self.bits[self.position]
+        self.position += 1
+        return bit
+
+def encode_block(timestamps, values):
+    """
+    Compress a run of (timestamp, value) points.
+    Timestamps (integer epoch seconds) use delta-of-delta encoding and values use
+    XOR against the previous value, so regular polling of slowly changing metrics
+    costs a few bits per point instead of a full row.
+    """
+    writer = BitWriter()
+    if not timestamps:
+        return writer.to_bytes()
+
+    # Header: first point stored raw
+    writer.write(int(timestamps[0]), 64)
+    previous_bits = _float_to_bits(values[0])
+    writer.write(previous_bits, 64)
+
+    previous_ts = int(timestamps[0])
+    previous_delta = 0
+    previous_leading = -1
+    previous_trailing = 0
+
+    for timestamp, value in zip(timestamps[1:], values[1:]):
+        # Timestamp: delta of delta
+        delta = int(timestamp) - previous_ts
+        dod = delta - previous_delta
+        if dod == 0:
+            writer.write_flags('0')
+        else:
+            for flags, width, offset in _DOD_BUCKETS:
+                if -offset <= dod <= offset + 1:
+                    writer.write_flags(flags)
+                    writer.write(dod + offset, width)
+                    break
+            else:
+                writer.write_flags('1111')
+                writer.write(dod & 0xFFFFFFFFFFFFFFFF, 64)
+        previous_ts = int(timestamp)
+        previous_delta = delta
+
+        # Value: XOR with previous value
+        value_bits = _float_to_bits(value)
+        xor = value_bits ^ previous_bits
+        if xor == 0:
+            writer.write_flags('0')
+        else:
+            leading = min(64 - xor.bit_length(), 31)
+            trailing = (xor & -xor).bit_length() - 1
+            if previous_leading >= 0 and leading >= previous_leading and trailing >= previous_trailing:
+                # Meaningful bits fit in the previous window
+                writer.write_flags('10')
+                meaningful = 64 - previous_leading - previous_trailing
+                writer.write(xor >> previous_trailing, meaningful)
+            else:
+                writer.write_flags('11')
+                meaningful = 64 - leading - trailing
+                writer.write(leading, 5)
+                # 64 meaningful bits do not fit in 6 bits and are stored as 0
+                writer.write(meaningful % 64, 6)
+                writer.write(xor >> trailing, meaningful)
+                previous_leading = leading
+                previous_trailing = trailing
+        previous_bits = value_bits
+
+    return writer.to_bytes()
+
+def decode_block(payload, count):
+    """Decompress a block written by encode_block into (timestamps, values) lists."""
+    timestamps = []
+    values = []
+    if count == 0:
+        return timestamps, values
+
+    reader = BitReader(payload)
+    previous_ts = reader.read(64)
+    previous_bits = reader.read(64)
+    timestamps.append(previous_ts)
+    values.append(_bits_to_float(previous_bits))
+
+    previous_delta = 0
+    previous_leading = 0
+    previous_trailing = 0
+
+    for _ in range(count - 1):
+        # Timestamp
+        if reader.read_bit() == '0':
+            dod = 0
+        else:
+            for flags, width, offset in _DOD_BUCKETS:
+                if reader.read_bit() == '0':
+                    dod = reader.read(width) - offset
+                    break
+            else:
+                dod = reader.read(64)
+                if dod >= 1 << 63:
+                    dod -= 1 << 64
+        previous_delta += dod
+        previous_ts += previous_delta
+        timestamps.append(previous_ts)
+
+        # Value
+        if reader.read_bit() == '1':
+            if reader.read_bit() == '1':
+                previous_leading = reader.read(5)
+                meaningful = reader.read(6) or 64
+                previous_trailing = 64 - previous_leading - meaningful
+            meaningful = 64 - previous_leading - previous_trailing
+            previous_bits ^= reader.read(meaningful) << previous_trailing
+        values.append(_bits_to_float(previous_bits))
+
+    return timestamps, values
+
+def init_ts_db():
+    """Initialize the time-series database and create the block table if it doesn't exist."""
+    conn = connect(TS_DB)
+    c = conn.cursor()
+
+    # One row per compressed block; start/end and min/max let queries skip whole blocks.
+    # sealed = 0 marks the open tail of a series, whose payload is still raw records
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS ts_blocks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            city TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            start_ts INTEGER NOT NULL,
+            end_ts INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            min_value REAL,
+            max_value REAL,
+            payload BLOB NOT NULL,
+            sealed INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+    c.execute("PRAGMA table_info(ts_blocks)")
+    if 'sealed' not in [column[1] for column in c.fetchall()]:
+        # Stores from before raw tails: every block there is compressed
+        c.execute('ALTER TABLE ts_blocks ADD COLUMN sealed INTEGER NOT NULL DEFAULT 1')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_ts_blocks_series ON ts_blocks (city, metric, end_ts)')
+
+    conn.commit()
+    conn.close()
+
+def _block_points(payload, count, sealed):
+    """(timestamps, values) lists of a stored block, compressed or raw."""
+    if sealed:
+        return decode_block(payload, count)
+    points = list(_RAW_POINT.iter_unpack(payload))
+    return [timestamp for timestamp, _ in points], [value for _, value in points]
+
+def _seal_block(c, block_id, payload, count):
+    """Compress an open tail block in place."""
+    c.execute('UPDATE ts_blocks SET payload = ?, sealed = 1 WHERE id = ?',
+              (encode_block(*_block_points(payload, count, False)), block_id))
+
+def _append_point(c, city, metric, timestamp, value):
+    """Append one point to a series, extending its open tail block when possible."""
+    c.execute('''
+        SELECT id, end_ts, count, payload FROM ts_blocks
+        WHERE city = ? AND metric = ? AND sealed = 0
+        ORDER BY id DESC LIMIT 1
+    ''', (city, metric))
+    tail = c.fetchone()
+    point = _RAW_POINT.pack(timestamp, value)
+
+    if tail and timestamp >= tail[1]:
+        block_id, _, count, payload = tail
+        payload += point
+        c.execute('''
+            UPDATE ts_blocks
+            SET end_ts = ?, count = ?, min_value = MIN(min_value, ?), max_value = MAX(max_value, ?), payload = ?
+            WHERE id = ?
+        ''', (timestamp, count + 1, value, value, payload, block_id))
+    else:
+        # Series is new or the point is out of order - close the tail and start a new block
+        if tail:
+            _seal_block(c, tail[0], tail[3], tail[2])
+        c.execute('''
+            INSERT INTO ts_blocks (city, metric, start_ts, end_ts, count, min_value, max_value, payload, sealed)
+            VALUES (?, ?, ?, ?, 1, ?, ?, ?, 0)
+        ''', (city, metric, timestamp, timestamp, value, value, point))
+        block_id, count, payload = c.lastrowid, 0, point
+
+    if count + 1 >= BLOCK_SIZE:
+        _seal_block(c, block_id, payload, count + 1)
+
+def append_snapshot(city, timestamp, metrics):
+    """Append one reading of several metrics (dict of metric -> value) for a city."""
+    append_snapshots([(city, timestamp, metrics)])
+
+def append_snapshots(snapshots):
+    """Append many (city, timestamp, {metric: value}) readings in one transaction."""
+    def append():
+        conn = connect(TS_DB)
+        try:
+            # Tail blocks are read then rewritten, so take the write lock before reading
+            with immediate_transaction(conn):
+                c = conn.cursor()
+                for city, timestamp, metrics in snapshots:
+                    for metric, value in metrics.items():
+                        if value is None:
+                            continue
+                        _append_point(c, city, metric, int(timestamp), float(value))
+        finally:
+            conn.close()
+    
+    retry_on_busy(append)
+
+def bulk_load(city, metric, points):
+    """
+    Write already-collected (timestamp, value) points as full blocks (used for backfills).
+    Whatever the series already holds between the first and last loaded timestamp is
+    replaced, so loading the same history twice, or over live appends, stores each
+    timestamp once. Blocks straddling that range are rewritten with their outside points.
+    """
+    # One value per timestamp (the last one given)
+    loaded = {int(ts): float(value) for ts, value in points if value is not None}
+    if not loaded:
+        return
+    first, last = min(loaded), max(loaded)
+
+    def load():
+        conn = connect(TS_DB)
+        try:
+            # Overlapping blocks are read then replaced, so take the write lock before reading
+            with immediate_transaction(conn):
+                overlapping = conn.execute('''
+                    SELECT id, count, payload, sealed FROM ts_blocks
+                    WHERE city = ? AND metric = ? AND end_ts >= ? AND start_ts <= ?
+                ''', (city, metric, first, last)).fetchall()
+
+                merged = {}
+                for _, count, payload, sealed in overlapping:
+                    timestamps, values = _block_points(payload, count, sealed)
+                    merged.update((ts, value) for ts, value in zip(timestamps, values) if ts < first or ts > last)
+                merged.update(loaded)
+                conn.executemany('DELETE FROM ts_blocks WHERE id = ?', [(row[0],) for row in overlapping])
+
+                merged = sorted(merged.items())
+                rows = []
+                for start in range(0, len(merged), BLOCK_SIZE):
+                    chunk = merged[start:start + BLOCK_SIZE]
+                    timestamps = [ts for ts, _ in chunk]
+                    values = [value for _, value in chunk]
+                    rows.append((city, metric, timestamps[0], timestamps[-1], len(chunk),
+                                 min(values), max(values), encode_block(timestamps, values)))
+                conn.executemany('''
+                    INSERT INTO ts_blocks (city, metric, start_ts, end_ts, count, min_value, max_value, payload)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+        finally:
+            conn.close()
+
+    retry_on_busy(load)
+
+def query_range(city, metric, start=None, end=None, min_value=None, max_value=None):
+    """
+    Return sorted (timestamp, value) points of one series within [start, end].
+    Blocks entirely outside the time range, or whose min/max cannot satisfy the
+    value bounds, are skipped without being decoded.
+    """
+    conditions = ['city = ?', 'metric = ?']
+    params = [city, metric]
+    if start is not None:
+        conditions.append('end_ts >= ?')
+        params.append(int(start))
+    if end is not None:
+        conditions.append('start_ts <= ?')
+        params.append(int(end))
+    if min_value is not None:
+        conditions.append('max_value >= ?')
+        params.append(min_value)
+    if max_value is not None:
+        conditions.append('min_value <= ?')
+        params.append(max_value)
+
+    try:
+        conn = connect(TS_DB)
+        blocks = conn.execute(
+            f"SELECT start_ts, end_ts, count, payload, sealed FROM ts_blocks WHERE {' AND '.join(conditions)}",
+            params
+        ).fetchall()
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"Error querying time series: {e}")
+        return []
+
+    points = []
+    for start_ts, end_ts, count, payload, sealed in blocks:
+        timestamps, values = _block_points(payload, count, sealed)
+        # Blocks fully inside the range need no per-point time filtering
+        inside = (start is None or start_ts >= start) and (end is None or end_ts <= end)
+        for timestamp, value in zip(timestamps, values):
+            if not inside and ((start is not None and timestamp < start) or (end is not None and timestamp > end)):
+                continue
+            if (min_value is not None and value < min_value) or (max_value is not None and value > max_value):
+                continue
+            points.append((timestamp, value))
+
+    points.sort()
+    return points
+
+def storage_stats():
+    """Return block count, point count and compressed payload bytes for the whole store."""
+    conn = connect(TS_DB)
+    blocks, points, payload_bytes = conn.execute(
+        'SELECT COUNT(*), COALESCE(SUM(count), 0), COALESCE(SUM(LENGTH(payload)), 0) FROM ts_blocks'
+    ).fetchone()
+    conn.close()
+    return {'blocks': blocks, 'points': points, 'payload_bytes': payload_bytes}
+
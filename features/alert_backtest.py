@@ -0,0 +1,221 @@
+import argparse
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+
+from data.db import connect
+from data.storage import DB_NAME, HISTORY_METRICS, init_db
+from features.alert_expression import compile_expression
+from features.weather_alert import (
+    ALERT_EVALUATORS, SEVERITY_LEVELS, AlertSeverity, AlertType, evaluate_rules_batch, get_indexed_rules_all,
+    init_alerts_db
+)
+from features.weather_enrichment import DERIVED_INPUTS, enrich_columns
+
+# Weather rows evaluated per vectorized pass; bounds memory however long the history is
+CHUNK_SIZE = 250000
+
+def _epoch(value):
+    """Epoch seconds for a datetime or a number."""
+    return int(value.timestamp()) if isinstance(value, datetime) else int(value)
+
+def proposed_rule(city, country, alert_type, threshold_value=None, condition=">=",
+                  expression=None, severity=AlertSeverity.MEDIUM):
+    """
+    A rule that exists only for a backtest (nothing is saved), in the same
+    shape get_alert_rules returns. Pass an expression for an AlertType.CUSTOM rule;
+    raises ValueError if it doesn't parse.
+    """
+    if expression:
+        # A broken expression never matches, which would read as "0 hits" rather than an error
+        compile_expression(expression)
+    return {
+        'id': None,
+        'city': city,
+        'country': country,
+        'alert_type': AlertType.CUSTOM.value if expression else alert_type.value,
+        'threshold_value': threshold_value,
+        'condition': condition,
+        'expression': expression,
+        'severity': severity.value
+    }
+
+def metrics_read_by(rules):
+    """
+    History metrics the rules' evaluators look at, found by running each rule
+    once against an accessor that records what it is asked for. Derived
+    metrics (heat index, ...) pull in their inputs. Falls back to every metric
+    if a rule can't be probed.
+    """
+    fields = set()
+
+    def get(name, default):
+        fields.add(name)
+        return default
+
+    for rule in rules:
+        evaluator = ALERT_EVALUATORS.get(rule['alert_type'])
+        if evaluator is None:
+            continue
+        try:
+            evaluator.predicate(get, rule)
+            evaluator.severity(get, rule)
+        except (TypeError, ValueError):
+            return list(HISTORY_METRICS)
+    for name, inputs in DERIVED_INPUTS.items():
+        if name in fields:
+            fields.update(inputs)
+    return [metric for metric in HISTORY_METRICS if metric in fields]
+
+def iter_history_columns(start=None, end=None, cities=None, metrics=None, chunk_size=CHUNK_SIZE):
+    """
+    Stream the weather table as columnar chunks (dicts of NumPy arrays) for
+    batch evaluation, in storage order. start/end are datetimes or epoch
+    seconds; metrics limits which value columns are read (default: all).
+    """
+    metrics = HISTORY_METRICS if metrics is None else metrics
+    columns = ['city', 'country', 'observed_at'] + list(metrics)
+    conditions = ['observed_at IS NOT NULL']
+    params = []
+    if start is not None:
+        conditions.append('observed_at >= ?')
+        params.append(_epoch(start))
+    if end is not None:
+        conditions.append('observed_at <= ?')
+        params.append(_epoch(end))
+    if cities:
+        # From a temporary table rather than one bound variable per city, which could pass SQLite's limit
+        conditions.append('city IN (SELECT city FROM backtest_cities)')
+
+    conn = connect(DB_NAME)
+    try:
+        if cities:
+            conn.execute('CREATE TEMP TABLE backtest_cities (city TEXT PRIMARY KEY)')
+            conn.executemany('INSERT OR IGNORE INTO backtest_cities VALUES (?)', [(city,) for city in cities])
+        c = conn.execute(
+            f"SELECT {', '.join(columns)} FROM weather WHERE {' AND '.join(conditions)}",
+            params
+        )
+        while True:
+            rows = c.fetchmany(chunk_size)
+            if not rows:
+                break
+            values = list(zip(*rows))
+            chunk = {
+                'city': np.array(values[0], dtype=object),
+                'country': np.array(values[1], dtype=object),
+                'observed_at': np.array(values[2], dtype=np.int64)
+            }
+            for name, column in zip(metrics, values[3:]):
+                # NULLs become NaN, which evaluators treat as missing
+                chunk[name] = np.array(column, dtype=float)
+            yield chunk
+    finally:
+        conn.close()
+
+def _split_columns(columns, chunk_size):
+    """Slice an in-memory columnar history into chunks."""
+    size = len(columns['city'])
+    for start in range(0, size, chunk_size):
+        yield {name: np.asarray(values)[start:start + chunk_size] for name, values in columns.items()}
+
+def backtest(rules=None, start=None, end=None, columns=None, chunk_size=CHUNK_SIZE):
+    """
+    Replay weather history through the alert engine and report what each rule
+    would have matched. Nothing is written and rule state is left untouched.
+
+    rules defaults to the active rules; use proposed_rule() to try thresholds
+    that don't exist yet. History comes from the weather table (limited to the
+    rules' cities and the start/end range) unless columns - imported history
+    in the columnar form evaluate_rules_batch takes, with an 'observed_at'
+    column of epoch seconds - is given.
+
+    Returns one report per rule, in order: {'rule', 'hits', 'first_triggered',
+    'last_triggered', 'severity'} where hits counts matching readings (cooldown
+    and "for N readings" are not simulated), trigger times are datetimes or
+    None, and severity maps each severity value to its hit count.
+    """
+    if rules is None:
+        rules = get_indexed_rules_all()
+    rule_count = len(rules)
+    hits = np.zeros(rule_count, dtype=np.int64)
+    first = np.full(rule_count, np.iinfo(np.int64).max, dtype=np.int64)
+    last = np.full(rule_count, np.iinfo(np.int64).min, dtype=np.int64)
+    levels = np.zeros((rule_count, len(SEVERITY_LEVELS)), dtype=np.int64)
+
+    if columns is None:
+        # Reading rows dominates, so only fetch the cities and columns the rules use
+        chunks = iter_history_columns(start, end, sorted({rule['city'] for rule in rules}),
+                                      metrics_read_by(rules), chunk_size)
+    else:
+        chunks = _split_columns(columns, chunk_size)
+
+    for chunk in chunks if rule_count else ():
+        observed_at = np.asarray(chunk['observed_at'], dtype=np.int64)
+        if columns is not None and (start is not None or end is not None):
+            keep = np.ones(len(observed_at), dtype=bool)
+            if start is not None:
+                keep &= observed_at >= _epoch(start)
+            if end is not None:
+                keep &= observed_at <= _epoch(end)
+            chunk = {name: np.asarray(values)[keep] for name, values in chunk.items()}
+            observed_at = observed_at[keep]
+
+        _, chunk_hits = evaluate_rules_batch(enrich_columns(chunk), rules)
+        rule_index = chunk_hits['rule']
+        if not len(rule_index):
+            continue
+        times = observed_at[chunk_hits['row']]
+        hits += np.bincount(rule_index, minlength=rule_count)
+        np.minimum.at(first, rule_index, times)
+        np.maximum.at(last, rule_index, times)
+        np.add.at(levels, (rule_index, chunk_hits['level']), 1)
+
+    return [
+        {
+            'rule': rule,
+            'hits': int(hits[position]),
+            'first_triggered': datetime.fromtimestamp(first[position]) if hits[position] else None,
+            'last_triggered': datetime.fromtimestamp(last[position]) if hits[position] else None,
+            'severity': {
+                severity.value: int(count)
+                for severity, count in zip(SEVERITY_LEVELS, levels[position]) if count
+            }
+        }
+        for position, rule in enumerate(rules)
+    ]
+
+def _describe(rule):
+    if rule.get('expression'):
+        return f"{rule['city']}: {rule['expression']}"
+    return f"{rule['city']}: {rule['alert_type']} {rule['condition'] or ''} {rule['threshold_value']}"
+
+# Backtest the active rules (or one proposed expression) from the command line:
+# python -m features.alert_backtest --days 90 [--city Denver --expression "humidity <= 30"]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report how often alert rules would have fired.")
+    parser.add_argument('--days', type=float, help="only replay the last N days")
+    parser.add_argument('--city', help="city for a proposed --expression rule")
+    parser.add_argument('--expression', help="proposed custom rule expression")
+    args = parser.parse_args()
+    if args.expression and not args.city:
+        # Rules only match history of their own city, so a cityless rule would report 0 hits
+        parser.error("--expression requires --city")
+
+    init_db()
+    init_alerts_db()
+    start = datetime.now().timestamp() - args.days * 86400 if args.days else None
+    try:
+        rules = [proposed_rule(args.city, None, AlertType.CUSTOM, expression=args.expression)] if args.expression else None
+    except ValueError as e:
+        parser.error(f"invalid --expression: {e}")
+
+    try:
+        for report in backtest(rules, start=start):
+            first = report['first_triggered'].strftime('%Y-%m-%d %H:%M') if report['hits'] else '-'
+            last = report['last_triggered'].strftime('%Y-%m-%d %H:%M') if report['hits'] else '-'
+            print(f"{_describe(report['rule'])}: {report['hits']} hits, first {first}, last {last}, "
+                  f"{report['severity'] or 'no severities'}")
+    except sqlite3.Error as e:
+        print(f"Error reading weather history: {e}")
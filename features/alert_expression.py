@@ -0,0 +1,225 @@
+import operator
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+# Comparison operators allowed in expressions
+_OPERATORS = {
+    ">=": operator.ge,
+    "<=": operator.le,
+    ">": operator.gt,
+    "<": operator.lt,
+    "==": operator.eq,
+    "!=": operator.ne
+}
+# Operator to use when the operands of a comparison are swapped (30 >= humidity -> humidity <= 30)
+_MIRRORED = {">=": "<=", "<=": ">=", ">": "<", "<": ">", "==": "==", "!=": "!="}
+_KEYWORDS = {'and', 'or', 'not', 'for', 'reading', 'readings'}
+
+_TOKEN_PATTERN = re.compile(r'\s*(?:(\d+(?:\.\d*)?|\.\d+)|([A-Za-z_][A-Za-z0-9_]*)|(>=|<=|==|!=|>|<|\(|\)|-))')
+
+# A compiled rule: predicate(get, margin=0) plus how many consecutive readings must match
+CompiledExpression = namedtuple('CompiledExpression', ['predicate', 'readings', 'fields'])
+
+def _tokenize(text):
+    """Split an expression into (kind, value, position) tokens."""
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN_PATTERN.match(text, position)
+        if not match:
+            position += len(text[position:]) - len(text[position:].lstrip())
+            raise ValueError(f"Unexpected character {text[position]!r} at position {position}")
+        number, name, symbol = match.groups()
+        start = match.start(match.lastindex)
+        if number is not None:
+            tokens.append(('number', float(number), start))
+        elif name is not None:
+            lowered = name.lower()
+            tokens.append(('keyword', lowered, start) if lowered in _KEYWORDS else ('field', name, start))
+        else:
+            tokens.append(('symbol', symbol, start))
+        position = match.end()
+    tokens.append(('end', None, len(text)))
+    return tokens
+
+class _Parser:
+    """
+    Recursive-descent parser for the rule grammar:
+
+        rule       := or_expr ['for' NUMBER ('reading' | 'readings')]
+        or_expr    := and_expr ('or' and_expr)*
+        and_expr   := not_expr ('and' not_expr)*
+        not_expr   := 'not' not_expr | '(' or_expr ')' | comparison
+        comparison := operand [OPERATOR operand]      (a lone field is a flag)
+        operand    := FIELD | ['-'] NUMBER
+
+    Nodes are tuples: ('and', left, right), ('or', left, right), ('not', node),
+    ('compare', op, field, number), ('fields', op, left, right), ('flag', field).
+    """
+
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position]
+
+    def take(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def expect(self, kind, value=None):
+        token = self.take()
+        if token[0] != kind or (value is not None and token[1] != value):
+            expected = value or kind
+            found = token[1] if token[1] is not None else 'end of expression'
+            raise ValueError(f"Expected {expected} at position {token[2]}, found {found!r}")
+        return token
+
+    def parse(self):
+        node = self.or_expr()
+        readings = 1
+        if self.peek()[:2] == ('keyword', 'for'):
+            self.take()
+            count = self.expect('number')
+            if count[1] < 1 or count[1] != int(count[1]):
+                raise ValueError(f"Reading count must be a positive whole number at position {count[2]}")
+            readings = int(count[1])
+            token = self.take()
+            if token[:2] not in (('keyword', 'reading'), ('keyword', 'readings')):
+                raise ValueError(f"Expected 'readings' at position {token[2]}")
+        self.expect('end')
+        return node, readings
+
+    def or_expr(self):
+        node = self.and_expr()
+        while self.peek()[:2] == ('keyword', 'or'):
+            self.take()
+            node = ('or', node, self.and_expr())
+        return node
+
+    def and_expr(self):
+        node = self.not_expr()
+        while self.peek()[:2] == ('keyword', 'and'):
+            self.take()
+            node = ('and', node, self.not_expr())
+        return node
+
+    def not_expr(self):
+        token = self.peek()
+        if token[:2] == ('keyword', 'not'):
+            self.take()
+            return ('not', self.not_expr())
+        if token[:2] == ('symbol', '('):
+            self.take()
+            node = self.or_expr()
+            self.expect('symbol', ')')
+            return node
+        return self.comparison()
+
+    def operand(self):
+        token = self.take()
+        if token[0] == 'field':
+            return token
+        if token[:2] == ('symbol', '-'):
+            number = self.expect('number')
+            return ('number', -number[1], token[2])
+        if token[0] == 'number':
+            return token
+        found = token[1] if token[1] is not None else 'end of expression'
+        raise ValueError(f"Expected a field or number at position {token[2]}, found {found!r}")
+
+    def comparison(self):
+        left = self.operand()
+        token = self.peek()
+        if not (token[0] == 'symbol' and token[1] in _OPERATORS):
+            if left[0] != 'field':
+                raise ValueError(f"Expected a comparison operator at position {token[2]}")
+            return ('flag', left[1])
+
+        op = self.take()[1]
+        right = self.operand()
+        if left[0] == 'field' and right[0] == 'number':
+            return ('compare', op, left[1], right[1])
+        if left[0] == 'number' and right[0] == 'field':
+            return ('compare', _MIRRORED[op], right[1], left[1])
+        if left[0] == 'field' and right[0] == 'field':
+            return ('fields', op, left[1], right[1])
+        raise ValueError(f"Comparison at position {left[2]} has no field")
+
+def _loosened(op, threshold, margin):
+    """
+    Move a threshold by margin percent of itself so the comparison is easier to
+    meet (harder for negative margins). Being relative, one margin moves every
+    field of a compound expression by an amount that fits its units.
+    """
+    offset = np.abs(threshold) * margin / 100
+    if op in (">=", ">"):
+        return threshold - offset
+    if op in ("<=", "<"):
+        return threshold + offset
+    return threshold
+
+def _compile_node(node, fields):
+    """
+    Turn a parse tree node into a closure predicate(get, margin).
+    Every closure works on scalars from one snapshot and on NumPy columns
+    from a batch alike, so an expression is vectorized for free.
+    """
+    kind = node[0]
+    if kind == 'and':
+        left, right = _compile_node(node[1], fields), _compile_node(node[2], fields)
+        return lambda get, margin: np.logical_and(left(get, margin), right(get, margin))
+    if kind == 'or':
+        left, right = _compile_node(node[1], fields), _compile_node(node[2], fields)
+        return lambda get, margin: np.logical_or(left(get, margin), right(get, margin))
+    if kind == 'not':
+        inner = _compile_node(node[1], fields)
+        # Loosening the negated condition means tightening the inner one
+        return lambda get, margin: np.logical_not(inner(get, -margin))
+    if kind == 'compare':
+        _, op, field, threshold = node
+        fields.add(field)
+        compare = _OPERATORS[op]
+        # Missing values read as NaN, which fails every comparison except !=
+        return lambda get, margin: compare(np.asarray(get(field, np.nan), dtype=float),
+                                           _loosened(op, threshold, margin))
+    if kind == 'fields':
+        _, op, left, right = node
+        fields.update((left, right))
+        compare = _OPERATORS[op]
+        return lambda get, margin: compare(np.asarray(get(left, np.nan), dtype=float),
+                                           _loosened(op, np.asarray(get(right, np.nan), dtype=float), margin))
+    if kind == 'flag':
+        field = node[1]
+        fields.add(field)
+        return lambda get, margin: np.asarray(get(field, False), dtype=bool)
+    raise ValueError(f"Unknown expression node {kind!r}")
+
+@lru_cache(maxsize=1024)
+def compile_expression(text):
+    """
+    Parse and compile a rule expression such as
+    "humidity <= 30 and wind_speed >= 20 for 2 readings".
+
+    Returns a CompiledExpression whose predicate(get, margin=0) takes the same
+    get(field, default) accessor as the built-in alert evaluators; margin
+    loosens every threshold by that percentage of itself. Compiled
+    expressions are cached by text, so each distinct rule is parsed once.
+    Raises ValueError for malformed expressions.
+    """
+    if not text or not text.strip():
+        raise ValueError("Expression is empty")
+    tree, readings = _Parser(text).parse()
+    fields = set()
+    compiled = _compile_node(tree, fields)
+
+    def predicate(get, margin=0):
+        return compiled(get, margin)
+
+    return CompiledExpression(predicate, readings, frozenset(fields))
@@ -0,0 +1,157 @@
+import argparse
+import math
+import random
+import threading
+import time
+
+from src.weather_api import fetch_weather_data
+from features.weather_alert import (
+    check_weather_alerts_batch, flush_alert_state, get_indexed_rules_all, init_alerts_db, invalidate_rule_index,
+    snapshots_to_columns
+)
+from features.weather_enrichment import enrich_snapshot
+from features.notifications import start_notifications, stop_notifications
+
+# Seconds between two polls of the same city
+DEFAULT_POLL_INTERVAL = 15 * 60
+# Cities fetched together and evaluated in one batch
+DEFAULT_BATCH_SIZE = 10
+# Fraction of a batch's slot its start may be shifted by, so instances don't poll in lockstep
+DEFAULT_JITTER = 0.5
+
+def get_monitored_cities():
+    """Distinct (city, country) pairs that have at least one active rule."""
+    cities = {(rule['city'], rule['country'] or None) for rule in get_indexed_rules_all()}
+    return sorted(cities, key=lambda city: (city[0], city[1] or ''))
+
+class AlertMonitor(threading.Thread):
+    """
+    Background thread that polls every city with active alert rules.
+
+    Each cycle the cities are split into batches whose start times are spread
+    evenly (with jitter) across the interval. A batch is fetched through the
+    shared, rate-limited fetch cache, evaluated in one vectorized pass, and any
+    triggered alerts are passed to every subscriber.
+    """
+
+    def __init__(self, interval=DEFAULT_POLL_INTERVAL, batch_size=DEFAULT_BATCH_SIZE,
+                 jitter=DEFAULT_JITTER, fetch=fetch_weather_data):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.jitter = jitter
+        self.fetch = fetch
+        self._subscribers = []
+        self._subscribers_lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def subscribe(self, callback):
+        """Call callback(alert) for every alert the monitor triggers (from the monitor thread)."""
+        with self._subscribers_lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._subscribers_lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def publish(self, alerts):
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for alert in alerts:
+            for callback in subscribers:
+                try:
+                    callback(alert)
+                except Exception as e:
+                    print(f"Error in alert subscriber: {e}")
+
+    def poll_batch(self, cities):
+        """Fetch and evaluate one batch of (city, country) pairs. Returns the triggered alerts."""
+        snapshots = []
+        for city, country in cities:
+            if self._stop_event.is_set():
+                break
+            data = self.fetch(f"{city},{country}" if country else city)
+            if not data:
+                continue
+            # Geocoding may return a different spelling; rules are keyed by the name they were added with
+            data['city'] = city
+            snapshots.append(enrich_snapshot(data))
+
+        if not snapshots:
+            return []
+        alerts = check_weather_alerts_batch(snapshots_to_columns(snapshots))
+        self.publish(alerts)
+        return alerts
+
+    def run_cycle(self):
+        """Poll every monitored city once, spread over one interval. Returns the triggered alerts."""
+        cycle_start = time.monotonic()
+        # Rules may have been added, removed or toggled by another process (e.g. the GUI)
+        invalidate_rule_index()
+        cities = get_monitored_cities()
+        batches = [cities[i:i + self.batch_size] for i in range(0, len(cities), self.batch_size)]
+        slot = self.interval / max(len(batches), 1)
+
+        alerts = []
+        for position, batch in enumerate(batches):
+            start_at = cycle_start + slot * (position + random.uniform(0, self.jitter))
+            if self._stop_event.wait(max(0, start_at - time.monotonic())):
+                break
+            try:
+                alerts.extend(self.poll_batch(batch))
+            except Exception as e:
+                print(f"Error polling {', '.join(city for city, _ in batch)}: {e}")
+
+        # Suppressed repeats are only counted in memory until written
+        flush_alert_state()
+        return alerts
+
+    def run(self):
+        while not self._stop_event.is_set():
+            cycle_start = time.monotonic()
+            self.run_cycle()
+            self._stop_event.wait(max(0, cycle_start + self.interval - time.monotonic()))
+
+    def stop(self):
+        """Ask the monitor to exit; it finishes the city it is fetching first."""
+        self._stop_event.set()
+
+def start_alert_monitor(interval=DEFAULT_POLL_INTERVAL, subscribers=()):
+    """Start the alert monitor in the background and return it."""
+    monitor = AlertMonitor(interval=interval)
+    for callback in subscribers:
+        monitor.subscribe(callback)
+    monitor.start()
+    return monitor
+
+def _print_alert(alert):
+    print(f"[{time.strftime('%H:%M:%S')}] {alert['city']}: {alert['message']} "
+          f"(Severity: {alert['severity'].value})")
+
+# Run headless: python -m features.alert_monitor
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Poll every city with alert rules and print triggered alerts.")
+    parser.add_argument('--interval', type=float, default=DEFAULT_POLL_INTERVAL / 60,
+                        help="minutes between polls of the same city")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--once', action='store_true', help="poll every city once, without spreading, and exit")
+    args = parser.parse_args()
+
+    init_alerts_db()
+    cities = get_monitored_cities()
+    monitor = AlertMonitor(interval=0 if args.once else args.interval * 60, batch_size=args.batch_size)
+    monitor.subscribe(_print_alert)
+    start_notifications()
+    print(f"Monitoring {len(cities)} cities with active alert rules"
+          f" ({math.ceil(len(cities) / args.batch_size)} batches)")
+
+    if args.once:
+        monitor.run_cycle()
+    else:
+        try:
+            monitor.run()
+        except KeyboardInterrupt:
+            monitor.stop()
+            flush_alert_state()
+    stop_notifications()
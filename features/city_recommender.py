@@ -0,0 +1,223 @@
+import argparse
+import sqlite3
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from data.db import connect
+from data.storage import DB_NAME
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    # Brute-force search over the normalized vectors is used instead
+    cKDTree = None
+
+# Features a city is compared on, and their default weights
+FEATURES = ['temperature', 'humidity', 'wind_speed', 'precipitation', 'latitude', 'longitude']
+DEFAULT_WEIGHTS = {
+    'temperature': 2.0,
+    'humidity': 1.0,
+    'wind_speed': 1.0,
+    'precipitation': 1.0,
+    'latitude': 0.5,
+    'longitude': 0.5
+}
+# Cities added or changed since the last build are searched separately; past this
+# many the index (and its normalization) is rebuilt
+MAX_PENDING = 256
+
+def history_profiles():
+    """Average temperature, humidity, wind and precipitation per city from the weather table."""
+    metrics = ['temperature', 'humidity', 'wind_speed', 'precipitation']
+    conn = connect(DB_NAME)
+    try:
+        rows = conn.execute(
+            f"SELECT city, {', '.join(f'AVG({metric})' for metric in metrics)} FROM weather "
+            "WHERE city IS NOT NULL AND city != '' GROUP BY city"
+        ).fetchall()
+    finally:
+        conn.close()
+    return pd.DataFrame(rows, columns=['city'] + metrics).set_index('city').astype('float32')
+
+def build_city_profiles(city_table=None, include_history=True):
+    """
+    One row of FEATURES per city (NaN where unknown), averaged over the
+    suggestion datasets (a load_city_table() frame) and our weather history.
+    """
+    frames = []
+    if city_table is not None and not city_table.empty:
+        columns = [feature for feature in FEATURES if feature in city_table.columns]
+        frames.append(city_table.groupby('city', observed=True)[columns].mean())
+    if include_history:
+        try:
+            frames.append(history_profiles())
+        except sqlite3.Error as e:
+            print(f"Error reading weather history for recommendations: {e}")
+
+    if not frames:
+        return pd.DataFrame(columns=FEATURES, dtype='float32')
+    profiles = pd.concat(frames)
+    profiles.index = profiles.index.astype(str)
+    return profiles.groupby(level=0).mean().reindex(columns=FEATURES).astype('float32')
+
+class CityRecommender:
+    """
+    Nearest-neighbour search over cities described by FEATURES.
+
+    Each feature is standardized (z-score) and weighted, with unknown values
+    at the mean so they neither help nor hurt a match. Vectors are indexed in
+    a KD-tree (scipy) or, without scipy, searched by brute force in NumPy.
+    update() takes effect immediately: changed cities are searched alongside
+    the index until enough pile up to rebuild it.
+    """
+
+    def __init__(self, profiles, weights=None):
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        profiles = profiles.reindex(columns=FEATURES)
+        self._raw = dict(zip(profiles.index, profiles.to_numpy(dtype=np.float32)))
+        self._build()
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __contains__(self, city):
+        return city in self._raw
+
+    def _build(self):
+        """(Re)compute normalization and the index from every known city."""
+        self._pending = {}
+        self.cities = np.array(list(self._raw), dtype=object)
+        matrix = np.array(list(self._raw.values()), dtype=np.float32).reshape(len(self._raw), len(FEATURES))
+        with warnings.catch_warnings():
+            # Features no city has yet (all NaN) are expected
+            warnings.simplefilter('ignore', RuntimeWarning)
+            self.mean = np.nan_to_num(np.nanmean(matrix, axis=0)) if len(matrix) else np.zeros(len(FEATURES))
+            std = np.nanstd(matrix, axis=0) if len(matrix) else np.ones(len(FEATURES))
+        # Constant or unknown features carry no information
+        self.scale = np.where(np.nan_to_num(std) > 0, np.nan_to_num(std), 1).astype(np.float32)
+        self._weight_vector = np.array([self.weights.get(feature, 1.0) for feature in FEATURES], dtype=np.float32)
+        self.vectors = self._normalize(matrix)
+        # Squared norms, so brute-force distances are one matrix-vector product
+        self._norms = np.einsum('ij,ij->i', self.vectors, self.vectors)
+        self._position = {city: position for position, city in enumerate(self.cities)}
+        self._stale = np.zeros(len(self.cities), dtype=bool)
+        self._stale_count = 0
+        self.tree = cKDTree(self.vectors) if cKDTree is not None and len(self.vectors) else None
+
+    def _normalize(self, matrix):
+        vectors = (matrix - self.mean) / self.scale * self._weight_vector
+        return np.nan_to_num(vectors).astype(np.float32)
+
+    def update(self, city, values):
+        """
+        Add or change one city. values maps feature names to numbers; features
+        left out keep their previous value (or stay unknown for a new city).
+        """
+        current = self._raw.get(city, np.full(len(FEATURES), np.nan, dtype=np.float32)).copy()
+        for position, feature in enumerate(FEATURES):
+            if values.get(feature) is not None:
+                current[position] = values[feature]
+        self._raw[city] = current
+
+        if city in self._position and not self._stale[self._position[city]]:
+            self._stale[self._position[city]] = True
+            self._stale_count += 1
+        self._pending[city] = self._normalize(current[np.newaxis])[0]
+        if len(self._pending) > MAX_PENDING:
+            self._build()
+
+    def vector(self, profile):
+        """Normalized vector for a profile dict (missing features count as average)."""
+        raw = np.array([np.nan if profile.get(feature) is None else profile[feature] for feature in FEATURES],
+                       dtype=np.float32)
+        return self._normalize(raw[np.newaxis])[0]
+
+    def _search_index(self, vector, count):
+        """(distances, positions) of up to count nearest indexed cities, closest first."""
+        count = min(count, len(self.vectors))
+        if count == 0:
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        if self.tree is not None:
+            distances, positions = self.tree.query(vector, k=count)
+            return np.atleast_1d(distances), np.atleast_1d(positions)
+
+        # |v - q|^2 = |v|^2 - 2 v.q + |q|^2 (clipped: rounding can make it slightly negative)
+        squared = self._norms - 2 * (self.vectors @ vector) + vector @ vector
+        distances = np.sqrt(np.clip(squared, 0, None))
+        if count < len(distances):
+            positions = np.argpartition(distances, count - 1)[:count]
+        else:
+            positions = np.arange(len(distances))
+        positions = positions[np.argsort(distances[positions], kind='stable')]
+        return distances[positions], positions
+
+    def nearest(self, vector, k=5, exclude=()):
+        """[(city, distance)] for the k cities closest to a normalized vector."""
+        # Over-fetch to make up for changed (stale) and excluded cities
+        extra = self._stale_count + len(exclude)
+        distances, positions = self._search_index(vector, k + extra)
+
+        results = [(self.cities[position], float(distance)) for distance, position in zip(distances, positions)
+                   if not self._stale[position] and self.cities[position] not in exclude]
+        if self._pending:
+            pending = np.array(list(self._pending.values()))
+            distances = np.sqrt(np.square(pending - vector).sum(axis=1))
+            results.extend((city, float(distance)) for city, distance in zip(self._pending, distances)
+                           if city not in exclude)
+        results.sort(key=lambda result: result[1])
+        return results[:k]
+
+    def recommend(self, profile, k=5):
+        """Cities closest to an ideal profile, e.g. {'temperature': 72, 'humidity': 40}."""
+        return self.nearest(self.vector(profile), k)
+
+    def similar_to(self, city, k=5):
+        """Cities most like a known city (not including it). Raises KeyError for unknown cities."""
+        if city in self._pending:
+            vector = self._pending[city]
+        else:
+            vector = self.vectors[self._position[city]]
+        return self.nearest(vector, k, exclude={city})
+
+def build_recommender(city_table=None, include_history=True, weights=None):
+    """A CityRecommender over the suggestion datasets and/or our weather history."""
+    return CityRecommender(build_city_profiles(city_table, include_history), weights)
+
+def _parse_profile(text):
+    """'temperature=72,humidity=40' -> {'temperature': 72.0, 'humidity': 40.0}"""
+    profile = {}
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        name, _, value = item.partition('=')
+        if name.strip() not in FEATURES:
+            raise ValueError(f"Unknown feature {name.strip()!r} (choose from {', '.join(FEATURES)})")
+        profile[name.strip()] = float(value)
+    return profile
+
+# Recommend cities from the command line:
+# python -m features.city_recommender --like Denver  |  --ideal temperature=72,humidity=40
+if __name__ == "__main__":
+    from data.storage import init_db
+    from features.suggestion_data import fetch_archive, load_city_table
+
+    parser = argparse.ArgumentParser(description="Recommend cities by weather profile.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--like', help="city to find similar cities for")
+    group.add_argument('--ideal', help="comma separated feature=value pairs")
+    parser.add_argument('-k', type=int, default=5, help="number of cities")
+    parser.add_argument('--history-only', action='store_true', help="don't download the suggestion datasets")
+    args = parser.parse_args()
+
+    init_db()
+    table = None if args.history_only else load_city_table(fetch_archive())
+    recommender = build_recommender(table)
+    try:
+        results = recommender.similar_to(args.like, args.k) if args.like else \
+            recommender.recommend(_parse_profile(args.ideal), args.k)
+    except KeyError:
+        raise SystemExit(f"Unknown city: {args.like}")
+    except ValueError as e:
+        raise SystemExit(str(e))
+    for rank, (city, distance) in enumerate(results, 1):
+        print(f"#{rank} {city} (distance {distance:.2f})")
@@ -2,12 +2,14 @@ import sqlite3
 import os
 import tkinter as tk
 
+from data.db import connect
+
 # Database name for favorite cities
 FAVORITES_DB = 'favorites.db'
 
 def init_favorites_db():
     """Initialize the favorites database and create the table if it doesn't exist."""
-    conn = sqlite3.connect(FAVORITES_DB)
+    conn = connect(FAVORITES_DB)
     c = conn.cursor()
     # Create the favorites table with city name and optional country
     c.execute('''
@@ -25,7 +27,7 @@ def init_favorites_db():
 def add_favorite_city(city, country=None):
     """Add a city to favorites list."""
     try:
-        conn = sqlite3.connect(FAVORITES_DB)
+        conn = connect(FAVORITES_DB)
         c = conn.cursor()
         from datetime import datetime
         added_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -53,7 +55,7 @@ def add_favorite_city(city, country=None):
 def remove_favorite_city(city, country=None):
     """Remove a city from favorites list."""
     try:
-        conn = sqlite3.connect(FAVORITES_DB)
+        conn = connect(FAVORITES_DB)
         c = conn.cursor()
         
         # Remove the favorite city
@@ -79,7 +81,7 @@ def remove_favorite_city(city, country=None):
 def get_favorite_cities():
     """Get all favorite cities from the database."""
     try:
-        conn = sqlite3.connect(FAVORITES_DB)
+        conn = connect(FAVORITES_DB)
         c = conn.cursor()
         
         # Get all favorite cities ordered by when they were added
@@ -105,7 +107,7 @@ def get_favorite_cities():
 def is_favorite_city(city, country=None):
     """Check if a city is in the favorites list."""
     try:
-        conn = sqlite3.connect(FAVORITES_DB)
+        conn = connect(FAVORITES_DB)
         c = conn.cursor()
         
         # Check if the city exists in favorites
@@ -126,7 +128,7 @@ def is_favorite_city(city, country=None):
 def clear_all_favorites():
     """Clear all favorite cities (use with caution!)."""
     try:
-        conn = sqlite3.connect(FAVORITES_DB)
+        conn = connect(FAVORITES_DB)
         c = conn.cursor()
         
         # Delete all favorites
@@ -232,13 +234,12 @@ def show_favorites_window(parent, callback=None):
     # Force rendering of buttons immediately
     favorites_window.update_idletasks()
 
-# Initialize the favorites database when this module is imported
-init_favorites_db()
 
 # Example usage functions for testing
 if __name__ == "__main__":
     # Test the favorite cities functionality
     print("Testing favorite cities...")
+    init_favorites_db()
     
     # Add some favorite cities
     add_favorite_city("New York", "US")
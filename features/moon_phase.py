@@ -1,16 +1,203 @@
-import requests
-from datetime import datetime, timedelta  # Add timedelta here
-import math
+import bisect
+import calendar
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import numpy as np
 
-# 
-# 
 # Constants for moon phase calculations
 
 LUNAR_CYCLE = 29.53059  # Average length of a lunar cycle
 
-LUNAR_CYCLE = 29.53059  # Average length of a lunar cycle           
+# Years covered by the precomputed table of principal phases (others are computed on demand)
+TABLE_START_YEAR = 1900
+TABLE_END_YEAR = 2100
+
+# Principal phases, in the order they occur within a lunation
+NEW_MOON, FIRST_QUARTER, FULL_MOON, LAST_QUARTER = 0, 1, 2, 3
+PHASE_EVENT_NAMES = ["New Moon", "First Quarter", "Full Moon", "Last Quarter"]
+
+# Names and emoji for the eight phase segments (each 1/8 of a lunation, centred on its phase)
+PHASE_NAMES = ["New Moon", "Waxing Crescent", "First Quarter", "Waxing Gibbous",
+               "Full Moon", "Waning Gibbous", "Last Quarter", "Waning Crescent"]
+PHASE_EMOJIS = ["🌑", "🌒", "🌓", "🌔", "🌕", "🌖", "🌗", "🌘"]
+
+# Julian day of the Unix epoch (1970-01-01 00:00 UTC)
+_UNIX_EPOCH_JD = 2440587.5
+_SECONDS_PER_YEAR = 365.2425 * 86400
+
+# Periodic terms of Meeus, Astronomical Algorithms ch. 49: (coefficient, power of E, M, M', F, Omega multipliers)
+_NEW_MOON_TERMS = [
+    (-0.40720, 0, 0, 1, 0, 0), (0.17241, 1, 1, 0, 0, 0), (0.01608, 0, 0, 2, 0, 0), (0.01039, 0, 0, 0, 2, 0),
+    (0.00739, 1, -1, 1, 0, 0), (-0.00514, 1, 1, 1, 0, 0), (0.00208, 2, 2, 0, 0, 0), (-0.00111, 0, 0, 1, -2, 0),
+    (-0.00057, 0, 0, 1, 2, 0), (0.00056, 1, 1, 2, 0, 0), (-0.00042, 0, 0, 3, 0, 0), (0.00042, 1, 1, 0, 2, 0),
+    (0.00038, 1, 1, 0, -2, 0), (-0.00024, 1, -1, 2, 0, 0), (-0.00017, 0, 0, 0, 0, 1), (-0.00007, 0, 2, 1, 0, 0),
+    (0.00004, 0, 0, 2, -2, 0), (0.00004, 0, 3, 0, 0, 0), (0.00003, 0, 1, 1, -2, 0), (0.00003, 0, 0, 2, 2, 0),
+    (-0.00003, 0, 1, 1, 2, 0), (0.00003, 0, -1, 1, 2, 0), (-0.00002, 0, -1, 1, -2, 0), (-0.00002, 0, 1, 3, 0, 0),
+    (0.00002, 0, 0, 4, 0, 0)
+]
+_FULL_MOON_TERMS = [
+    (-0.40614, 0, 0, 1, 0, 0), (0.17302, 1, 1, 0, 0, 0), (0.01614, 0, 0, 2, 0, 0), (0.01043, 0, 0, 0, 2, 0),
+    (0.00734, 1, -1, 1, 0, 0), (-0.00515, 1, 1, 1, 0, 0), (0.00209, 2, 2, 0, 0, 0), (-0.00111, 0, 0, 1, -2, 0),
+    (-0.00057, 0, 0, 1, 2, 0), (0.00056, 1, 1, 2, 0, 0), (-0.00042, 0, 0, 3, 0, 0), (0.00042, 1, 1, 0, 2, 0),
+    (0.00038, 1, 1, 0, -2, 0), (-0.00024, 1, -1, 2, 0, 0), (-0.00017, 0, 0, 0, 0, 1), (-0.00007, 0, 2, 1, 0, 0),
+    (0.00004, 0, 0, 2, -2, 0), (0.00004, 0, 3, 0, 0, 0), (0.00003, 0, 1, 1, -2, 0), (0.00003, 0, 0, 2, 2, 0),
+    (-0.00003, 0, 1, 1, 2, 0), (0.00003, 0, -1, 1, 2, 0), (-0.00002, 0, -1, 1, -2, 0), (-0.00002, 0, 1, 3, 0, 0),
+    (0.00002, 0, 0, 4, 0, 0)
+]
+_QUARTER_TERMS = [
+    (-0.62801, 0, 0, 1, 0, 0), (0.17172, 1, 1, 0, 0, 0), (-0.01183, 1, 1, 1, 0, 0), (0.00862, 0, 0, 2, 0, 0),
+    (0.00804, 0, 0, 0, 2, 0), (0.00454, 1, -1, 1, 0, 0), (0.00204, 2, 2, 0, 0, 0), (-0.00180, 0, 0, 1, -2, 0),
+    (-0.00070, 0, 0, 1, 2, 0), (-0.00040, 0, 0, 3, 0, 0), (-0.00034, 1, -1, 2, 0, 0), (0.00032, 1, 1, 0, 2, 0),
+    (0.00032, 1, 1, 0, -2, 0), (-0.00028, 2, 2, 1, 0, 0), (0.00027, 1, 1, 2, 0, 0), (-0.00017, 0, 0, 0, 0, 1),
+    (-0.00005, 0, -1, 1, -2, 0), (0.00004, 0, 0, 2, 2, 0), (-0.00004, 0, 1, 1, 2, 0), (0.00004, 0, -2, 1, 0, 0),
+    (0.00003, 0, 1, 1, -2, 0), (0.00003, 0, 3, 0, 0, 0), (0.00002, 0, 0, 2, -2, 0), (0.00002, 0, -1, 1, 2, 0),
+    (-0.00002, 0, 1, 3, 0, 0)
+]
+# Planetary arguments shared by every phase: (coefficient, A at k=0, A per lunation)
+_PLANETARY_TERMS = [
+    (0.000325, 299.77, 0.107408), (0.000165, 251.88, 0.016321), (0.000164, 251.83, 26.651886),
+    (0.000126, 349.42, 36.412478), (0.000110, 84.66, 18.206239), (0.000062, 141.74, 53.303771),
+    (0.000060, 207.14, 2.453732), (0.000056, 154.84, 7.306860), (0.000047, 34.52, 27.261239),
+    (0.000042, 207.19, 0.121824), (0.000040, 291.34, 1.844379), (0.000037, 161.72, 24.198154),
+    (0.000035, 239.56, 25.513099), (0.000023, 331.55, 3.592518)
+]
+
+def _periodic(terms, e, m, mp, f, omega):
+    return sum(coefficient * e ** power * np.sin(a * m + b * mp + c * f + d * omega)
+               for coefficient, power, a, b, c, d in terms)
+
+def _delta_t_days(jde):
+    """Approximate TT - UT (Espenak & Meeus polynomial around 2000), in days."""
+    years = (jde - 2451545.0) / 365.25
+    return (62.92 + 0.32217 * years + 0.005589 * years ** 2) / 86400
 
+def phase_instants(k):
+    """
+    Moments of principal phases as Unix timestamps (UTC), vectorized over k:
+    lunation numbers counted from the new moon of 2000-01-06, where the
+    fraction selects the phase (.0 new, .25 first quarter, .5 full, .75 last
+    quarter). Uses the lunation series of Meeus (Astronomical Algorithms,
+    ch. 49), accurate to about a minute.
+    """
+    k = np.asarray(k, dtype=float)
+    t = k / 1236.85
+    jde = (2451550.09766 + 29.530588861 * k + 0.00015437 * t ** 2
+           - 0.000000150 * t ** 3 + 0.00000000073 * t ** 4)
+    e = 1 - 0.002516 * t - 0.0000074 * t ** 2
+    m = np.radians(2.5534 + 29.10535670 * k - 0.0000014 * t ** 2 - 0.00000011 * t ** 3)
+    mp = np.radians(201.5643 + 385.81693528 * k + 0.0107582 * t ** 2 + 0.00001238 * t ** 3
+                    - 0.000000058 * t ** 4)
+    f = np.radians(160.7108 + 390.67050284 * k - 0.0016118 * t ** 2 - 0.00000227 * t ** 3
+                   + 0.000000011 * t ** 4)
+    omega = np.radians(124.7746 - 1.56375588 * k + 0.0020672 * t ** 2 + 0.00000215 * t ** 3)
+
+    quarter = np.round((k - np.floor(k)) * 4).astype(int) % 4
+    correction = np.select(
+        [quarter == NEW_MOON, quarter == FULL_MOON],
+        [_periodic(_NEW_MOON_TERMS, e, m, mp, f, omega), _periodic(_FULL_MOON_TERMS, e, m, mp, f, omega)],
+        _periodic(_QUARTER_TERMS, e, m, mp, f, omega)
+    )
+    w = (0.00306 - 0.00038 * e * np.cos(m) + 0.00026 * np.cos(mp) - 0.00002 * np.cos(mp - m)
+         + 0.00002 * np.cos(mp + m) + 0.00002 * np.cos(2 * f))
+    correction = correction + np.where(quarter == FIRST_QUARTER, w, 0) - np.where(quarter == LAST_QUARTER, w, 0)
+    correction = correction + sum(
+        coefficient * np.sin(np.radians(start + step * k - (0.009173 * t ** 2 if start == 299.77 else 0)))
+        for coefficient, start, step in _PLANETARY_TERMS
+    )
+
+    jde = jde + correction
+    return (jde - _delta_t_days(jde) - _UNIX_EPOCH_JD) * 86400
+
+class LunationTable:
+    """
+    Every principal phase between two years, sorted by time: times (Unix
+    timestamps) and kinds (NEW_MOON ... LAST_QUARTER) as NumPy arrays, plus
+    per-kind lists for bisect lookups.
+    """
+
+    def __init__(self, start_year, end_year):
+        # One lunation of margin either side, so every date in range has events around it
+        first = np.floor((start_year - 2000) * 12.3685) - 1
+        last = np.ceil((end_year + 1 - 2000) * 12.3685) + 1
+        k = np.arange(first * 4, last * 4 + 1) / 4
+        self.start_year = start_year
+        self.end_year = end_year
+        self.times = phase_instants(k)
+        # k starts on a new moon and steps a quarter at a time
+        self.kinds = np.arange(len(k)) % 4
+        self.by_kind = [self.times[self.kinds == kind].tolist() for kind in range(4)]
+        self._all = self.times.tolist()
+
+    def covers(self, timestamp):
+        return self._all[0] <= timestamp < self._all[-1]
+
+    def next_event(self, timestamp, kind=None):
+        """(timestamp, kind) of the first phase (of a kind) strictly after timestamp."""
+        times = self._all if kind is None else self.by_kind[kind]
+        position = bisect.bisect_right(times, timestamp)
+        if position == len(times):
+            return None
+        return times[position], kind if kind is not None else int(self.kinds[position])
+
+    def previous_event(self, timestamp, kind=None):
+        """(timestamp, kind) of the last phase (of a kind) at or before timestamp."""
+        times = self._all if kind is None else self.by_kind[kind]
+        position = bisect.bisect_right(times, timestamp) - 1
+        if position < 0:
+            return None
+        return times[position], kind if kind is not None else int(self.kinds[position])
+
+    def phases(self, timestamps):
+        """
+        Phase (0 new .. 0.25 first quarter .. 0.5 full .. 0.75 last quarter) for
+        an array of timestamps, interpolated between the surrounding events.
+        """
+        timestamps = np.asarray(timestamps, dtype=float)
+        position = np.clip(np.searchsorted(self.times, timestamps, side='right') - 1, 0, len(self.times) - 2)
+        start = self.times[position]
+        span = self.times[position + 1] - start
+        fraction = np.clip((timestamps - start) / span, 0, 1)
+        return ((self.kinds[position] + fraction) / 4) % 1
+
+@lru_cache(maxsize=8)
+def lunation_table(start_year=TABLE_START_YEAR, end_year=TABLE_END_YEAR):
+    """The (cached) table of principal phases for a range of years."""
+    return LunationTable(start_year, end_year)
+
+def _table_for(timestamps):
+    """A table covering every timestamp given: the default one, or one built for their decades."""
+    table = lunation_table()
+    low, high = float(np.min(timestamps)), float(np.max(timestamps))
+    if table.covers(low) and table.covers(high):
+        return table
+    # Whole decades, so nearby lookups share one cached table
+    start = int(1970 + low / _SECONDS_PER_YEAR) // 10 * 10 - 10
+    end = int(1970 + high / _SECONDS_PER_YEAR) // 10 * 10 + 10
+    return lunation_table(start, end)
+
+def _timestamps(dates):
+    """Unix timestamps for a datetime, a sequence of datetimes/dates, or numpy datetime64 values."""
+    if isinstance(dates, np.ndarray) and np.issubdtype(dates.dtype, np.datetime64):
+        return dates.astype('datetime64[s]').astype(np.int64).astype(float)
+    return np.array([
+        (date if isinstance(date, datetime) else datetime(date.year, date.month, date.day, 12)).timestamp()
+        for date in dates
+    ])
+
+def moon_phases(dates):
+    """
+    Phases (0-1, as calculate_moon_phase) for many dates at once: datetimes,
+    dates (taken at noon) or a numpy datetime64 array (UTC).
+    """
+    timestamps = _timestamps(dates)
+    if not len(timestamps):
+        return np.empty(0)
+    return _table_for(timestamps).phases(timestamps)
 
+def phase_indices(phases):
+    """Index into PHASE_NAMES / PHASE_EMOJIS for phases (scalar or array)."""
+    return np.floor(np.asarray(phases) * 8 + 0.5).astype(int) % 8
 
 def calculate_moon_phase(date=None):
     """
@@ -23,62 +210,20 @@ def calculate_moon_phase(date=None):
     """
     if date is None:
         date = datetime.now()
-    
-    # Known new moon date: January 6, 2000, 18:14 UTC
-    known_new_moon = datetime(2000, 1, 6, 18, 14)
-    
-    # Lunar cycle is approximately 29.53059 days
-    lunar_cycle = 29.53059
-    
-    # Calculate days since known new moon
-    days_since = (date - known_new_moon).total_seconds() / (24 * 3600)
-    
-    # Calculate moon phase (0 to 1)
-    phase = (days_since % lunar_cycle) / lunar_cycle
-    
-    return phase
+
+    return float(moon_phases([date])[0])
 
 def get_moon_phase_name(phase):
     """
     Convert moon phase number to descriptive name.
     """
-    if phase < 0.0625 or phase >= 0.9375:
-        return "New Moon"
-    elif phase < 0.1875:
-        return "Waxing Crescent"
-    elif phase < 0.3125:
-        return "First Quarter"
-    elif phase < 0.4375:
-        return "Waxing Gibbous"
-    elif phase < 0.5625:
-        return "Full Moon"
-    elif phase < 0.6875:
-        return "Waning Gibbous"
-    elif phase < 0.8125:
-        return "Last Quarter"
-    else:
-        return "Waning Crescent"
+    return PHASE_NAMES[int(phase_indices(phase))]
 
 def get_moon_phase_emoji(phase):
     """
     Convert moon phase number to emoji representation.
     """
-    if phase < 0.0625 or phase >= 0.9375:
-        return "🌑"  # New Moon
-    elif phase < 0.1875:
-        return "🌒"  # Waxing Crescent
-    elif phase < 0.3125:
-        return "🌓"  # First Quarter
-    elif phase < 0.4375:
-        return "🌔"  # Waxing Gibbous
-    elif phase < 0.5625:
-        return "🌕"  # Full Moon
-    elif phase < 0.6875:
-        return "🌖"  # Waning Gibbous
-    elif phase < 0.8125:
-        return "🌗"  # Last Quarter
-    else:
-        return "🌘"  # Waning Crescent
+    return PHASE_EMOJIS[int(phase_indices(phase))]
 
 def get_moon_illumination(phase):
     """
@@ -89,7 +234,7 @@ def get_moon_illumination(phase):
         illumination = phase * 2
     else:
         illumination = (1 - phase) * 2
-    
+
     return int(illumination * 100)
 
 def get_moon_data(date=None):
@@ -98,9 +243,9 @@ def get_moon_data(date=None):
     """
     if date is None:
         date = datetime.now()
-    
+
     phase = calculate_moon_phase(date)
-    
+
     return {
         'phase': phase,
         'phase_name': get_moon_phase_name(phase),
@@ -109,45 +254,99 @@ def get_moon_data(date=None):
         'date': date.strftime('%Y-%m-%d')
     }
 
+def next_phase_event(date=None, kind=None):
+    """
+    (datetime, kind) of the next principal phase after date, or of the next
+    one of a kind (NEW_MOON, FIRST_QUARTER, FULL_MOON or LAST_QUARTER).
+    """
+    timestamp = (date or datetime.now()).timestamp()
+    event = _table_for([timestamp, timestamp + 40 * 86400]).next_event(timestamp, kind)
+    return datetime.fromtimestamp(event[0]), event[1]
+
+def previous_phase_event(date=None, kind=None):
+    """(datetime, kind) of the last principal phase (of a kind) at or before date."""
+    timestamp = (date or datetime.now()).timestamp()
+    event = _table_for([timestamp - 40 * 86400, timestamp]).previous_event(timestamp, kind)
+    return datetime.fromtimestamp(event[0]), event[1]
+
+def phase_events(start, end):
+    """[(datetime, kind)] for every principal phase from start up to (not including) end."""
+    low, high = start.timestamp(), end.timestamp()
+    table = _table_for([low, high])
+    first, last = np.searchsorted(table.times, [low, high])
+    return [(datetime.fromtimestamp(timestamp), int(kind))
+            for timestamp, kind in zip(table.times[first:last], table.kinds[first:last])]
+
 def get_next_full_moon(date=None):
     """
     Calculate the date of the next full moon.
     """
-    if date is None:
-        date = datetime.now()
-    
-    current_phase = calculate_moon_phase(date)
-    
-    # Days until next full moon
-    if current_phase <= 0.5:
-        days_until_full = (0.5 - current_phase) * 29.53059
-    else:
-        days_until_full = (1.0 - current_phase + 0.5) * 29.53059
-    
-    next_full_moon = date + timedelta(days=days_until_full)
-    return next_full_moon
+    return next_phase_event(date, FULL_MOON)[0]
 
 def get_next_new_moon(date=None):
     """
     Calculate the date of the next new moon.
     """
-    if date is None:
-        date = datetime.now()
-    
-    current_phase = calculate_moon_phase(date)
-    
-    # Days until next new moon
-    if current_phase == 0:
-        days_until_new = 29.53059
+    return next_phase_event(date, NEW_MOON)[0]
+
+def moon_calendar(year, month=None):
+    """
+    Moon data for every day of a month (or a whole year), computed in one
+    vectorized pass: a list of {'date', 'phase', 'phase_name', 'emoji',
+    'illumination', 'event'} where event names a principal phase falling on
+    that day (else None). Phases are taken at noon.
+    """
+    if month is None:
+        first, last = datetime(year, 1, 1), datetime(year + 1, 1, 1)
     else:
-        days_until_new = (1.0 - current_phase) * 29.53059
-    
-    next_new_moon = date + timedelta(days=days_until_new)
-    return next_new_moon
+        first = datetime(year, month, 1)
+        last = first + timedelta(days=calendar.monthrange(year, month)[1])
+    days = [first + timedelta(days=offset) for offset in range((last - first).days)]
+
+    phases = moon_phases([day.replace(hour=12) for day in days])
+    indices = phase_indices(phases)
+    illumination = (np.where(phases <= 0.5, phases * 2, (1 - phases) * 2) * 100).astype(int)
+    events = {moment.date(): PHASE_EVENT_NAMES[kind] for moment, kind in phase_events(first, last)}
+
+    return [
+        {
+            'date': day.date(),
+            'phase': float(phase),
+            'phase_name': PHASE_NAMES[index],
+            'emoji': PHASE_EMOJIS[index],
+            'illumination': int(percent),
+            'event': events.get(day.date())
+        }
+        for day, phase, index, percent in zip(days, phases, indices, illumination)
+    ]
 
-# Example usage and testing
+def format_month_calendar(year, month):
+    """A month's moon calendar as text: weeks of 'day emoji' cells, Monday first."""
+    days = moon_calendar(year, month)
+    lines = [f"{calendar.month_name[month]} {year}".center(7 * 6), " ".join(f"{name:<5}" for name in calendar.day_abbr)]
+    week = ["     "] * days[0]['date'].weekday()
+    for day in days:
+        week.append(f"{day['date'].day:>2} {day['emoji']}")
+        if len(week) == 7:
+            lines.append(" ".join(week))
+            week = []
+    if week:
+        lines.append(" ".join(week))
+    events = [f"{day['date'].day:>2}: {day['event']}" for day in days if day['event']]
+    return "\n".join(lines + [""] + events)
+
+# Example usage and testing: python -m features.moon_phase [year [month]]
 if __name__ == "__main__":
-    moon_data = get_moon_data()
-    print(f"Current Moon Phase: {moon_data['phase_name']} {moon_data['emoji']}")
-    print(f"Illumination: {moon_data['illumination']}%")
-    print(f"Phase Value: {moon_data['phase']:.3f}")
\ No newline at end of file
+    import sys
+
+    if len(sys.argv) > 1:
+        year = int(sys.argv[1])
+        months = [int(sys.argv[2])] if len(sys.argv) > 2 else range(1, 13)
+        print("\n\n".join(format_month_calendar(year, month) for month in months))
+    else:
+        moon_data = get_moon_data()
+        print(f"Current Moon Phase: {moon_data['phase_name']} {moon_data['emoji']}")
+        print(f"Illumination: {moon_data['illumination']}%")
+        print(f"Phase Value: {moon_data['phase']:.3f}")
+        print(f"Next Full Moon: {get_next_full_moon():%Y-%m-%d %H:%M}")
+        print(f"Next New Moon: {get_next_new_moon():%Y-%m-%d %H:%M}")
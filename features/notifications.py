@@ -0,0 +1,276 @@
+import json
+import os
+import queue
+import shutil
+import smtplib
+import subprocess
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from email.message import EmailMessage
+
+import requests
+
+from features.weather_alert import add_alert_listener, remove_alert_listener
+
+# Sinks enabled by start_notifications() when none are passed (comma separated: desktop, log, smtp, webhook).
+# None by default: popups and log files are opt-in
+NOTIFY_SINKS = os.getenv('ALERT_NOTIFY_SINKS', '')
+# Local stand-ins for delivery services
+SMTP_HOST = os.getenv('ALERT_SMTP_HOST', 'localhost')
+SMTP_PORT = int(os.getenv('ALERT_SMTP_PORT', 1025))
+SMTP_TO = os.getenv('ALERT_SMTP_TO', 'alerts@localhost')
+WEBHOOK_URL = os.getenv('ALERT_WEBHOOK_URL', 'http://localhost:8080/alerts')
+ALERT_LOG_FILE = 'alerts.log'
+
+# Alerts waiting to be dispatched; when full, new alerts are dropped rather than block evaluation
+QUEUE_SIZE = 1000
+# Alerts arriving within this many seconds of each other are delivered as one digest
+DIGEST_WINDOW = 2.0
+DIGEST_MAX = 50
+# Delivery attempts per sink and the delay before the first retry (doubles each time)
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 1.0
+
+def alert_payload(alert):
+    """JSON-friendly view of a triggered alert (no weather snapshot)."""
+    return {
+        'rule_id': alert.get('rule_id'),
+        'city': alert.get('city'),
+        'alert_type': alert.get('alert_type'),
+        'severity': getattr(alert.get('severity'), 'value', alert.get('severity')),
+        'message': alert.get('message')
+    }
+
+def _summary(alerts):
+    """Title and body for one alert or a digest of several."""
+    if len(alerts) == 1:
+        alert = alerts[0]
+        return f"Weather alert: {alert['city']}", alert['message']
+    cities = sorted({alert['city'] for alert in alerts if alert['city']})
+    title = f"{len(alerts)} weather alerts: {', '.join(cities[:3])}{' ...' if len(cities) > 3 else ''}"
+    body = '\n'.join(f"{alert['city']}: {alert['message']}" for alert in alerts)
+    return title, body
+
+class NotificationSink(ABC):
+    """
+    A delivery target. send(alerts) gets a list of alert payloads (one alert or
+    a digest) and raises on failure so the dispatcher can retry.
+    """
+    name = 'sink'
+    # Worker threads delivering to this sink in parallel
+    workers = 1
+
+    @abstractmethod
+    def send(self, alerts):
+        """Deliver alert payloads, raising on failure."""
+
+class DesktopSink(NotificationSink):
+    """Desktop notification via plyer if installed, else notify-send / osascript."""
+    name = 'desktop'
+
+    def send(self, alerts):
+        title, body = _summary(alerts)
+        try:
+            from plyer import notification
+            notification.notify(title=title, message=body[:256], app_name='Weather App')
+            return
+        except ImportError:
+            pass
+
+        if sys.platform == 'darwin':
+            script = f'display notification {json.dumps(body[:256])} with title {json.dumps(title)}'
+            subprocess.run(['osascript', '-e', script], check=True, timeout=10)
+        elif shutil.which('notify-send'):
+            subprocess.run(['notify-send', title, body[:256]], check=True, timeout=10)
+        else:
+            print(f"{title}\n{body}")
+
+class LogFileSink(NotificationSink):
+    """Appends one JSON line per alert to a log file."""
+    name = 'log'
+
+    def __init__(self, path=ALERT_LOG_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def send(self, alerts):
+        logged_at = time.strftime('%Y-%m-%d %H:%M:%S')
+        lines = ''.join(json.dumps(dict(alert, logged_at=logged_at)) + '\n' for alert in alerts)
+        with self.lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+
+class SmtpSink(NotificationSink):
+    """Emails alerts through an SMTP server (a local stand-in by default)."""
+    name = 'smtp'
+    workers = 2
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, to=SMTP_TO, sender='weather-app@localhost'):
+        self.host = host
+        self.port = port
+        self.to = to
+        self.sender = sender
+
+    def send(self, alerts):
+        title, body = _summary(alerts)
+        message = EmailMessage()
+        message['Subject'] = title
+        message['From'] = self.sender
+        message['To'] = self.to
+        message.set_content(body)
+        with smtplib.SMTP(self.host, self.port, timeout=10) as server:
+            server.send_message(message)
+
+class WebhookSink(NotificationSink):
+    """POSTs alerts as JSON to a webhook (localhost by default)."""
+    name = 'webhook'
+    workers = 2
+
+    def __init__(self, url=WEBHOOK_URL):
+        self.url = url
+
+    def send(self, alerts):
+        response = requests.post(self.url, json={'alerts': alerts}, timeout=10)
+        response.raise_for_status()
+
+SINK_TYPES = {
+    'desktop': DesktopSink,
+    'log': LogFileSink,
+    'smtp': SmtpSink,
+    'webhook': WebhookSink
+}
+
+class NotificationDispatcher:
+    """
+    Fans triggered alerts out to sinks without ever blocking the caller.
+
+    submit() drops alerts into a bounded queue. A dispatcher thread gathers
+    bursts into digests (everything arriving within DIGEST_WINDOW, up to
+    DIGEST_MAX) and hands each digest to every sink's own bounded queue,
+    served by that sink's worker threads with retries, so one slow or broken
+    sink never holds up the others.
+    """
+
+    def __init__(self, sinks, queue_size=QUEUE_SIZE, digest_window=DIGEST_WINDOW, digest_max=DIGEST_MAX,
+                 retry_attempts=RETRY_ATTEMPTS, retry_base_delay=RETRY_BASE_DELAY):
+        self.sinks = list(sinks)
+        self.digest_window = digest_window
+        self.digest_max = digest_max
+        self.retry_attempts = retry_attempts
+        self.retry_base_delay = retry_base_delay
+        self.intake = queue.Queue(maxsize=queue_size)
+        self.sink_queues = {sink: queue.Queue(maxsize=queue_size) for sink in self.sinks}
+        # Alerts dropped because a queue was full; counted from the submitting and dispatcher threads
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._dispatch_thread = threading.Thread(target=self._dispatch, daemon=True)
+        self._threads = [self._dispatch_thread]
+        for sink in self.sinks:
+            for _ in range(sink.workers):
+                self._threads.append(threading.Thread(target=self._deliver, args=(sink,), daemon=True))
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        """Stop after delivering what is already queued (waits up to timeout seconds per thread)."""
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def submit(self, alerts):
+        """Queue triggered alerts for delivery. Never blocks; alerts are dropped if the queue is full."""
+        for alert in alerts:
+            try:
+                self.intake.put_nowait(alert_payload(alert))
+            except queue.Full:
+                self._count_dropped(1)
+                print(f"Notification queue full, dropped alert for {alert.get('city')}")
+
+    def _count_dropped(self, count):
+        with self._dropped_lock:
+            self.dropped += count
+
+    def _dispatch(self):
+        while not (self._stop_event.is_set() and self.intake.empty()):
+            try:
+                digest = [self.intake.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+
+            # Let a burst settle into one digest
+            deadline = time.monotonic() + self.digest_window
+            while len(digest) < self.digest_max:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    digest.append(self.intake.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            for sink, sink_queue in self.sink_queues.items():
+                try:
+                    sink_queue.put_nowait(digest)
+                except queue.Full:
+                    self._count_dropped(len(digest))
+                    print(f"Notification sink {sink.name} is backed up, dropped {len(digest)} alerts")
+
+    def _deliver(self, sink):
+        sink_queue = self.sink_queues[sink]
+        # Keep going after stop() until the dispatcher has handed over everything
+        while not (self._stop_event.is_set() and sink_queue.empty() and not self._dispatch_thread.is_alive()):
+            try:
+                digest = sink_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            for attempt in range(self.retry_attempts):
+                try:
+                    sink.send(digest)
+                    break
+                except Exception as e:
+                    if attempt == self.retry_attempts - 1:
+                        print(f"Giving up on {sink.name} notification after {self.retry_attempts} attempts: {e}")
+                    else:
+                        self._stop_event.wait(self.retry_base_delay * (2 ** attempt))
+
+_dispatcher = None
+
+def start_notifications(sinks=None):
+    """
+    Start delivering triggered alerts to sinks (default: the ALERT_NOTIFY_SINKS
+    setting) and subscribe to alert evaluation. Returns the dispatcher, or
+    None when no sinks are enabled.
+    """
+    global _dispatcher
+    if _dispatcher is not None:
+        return _dispatcher
+
+    if sinks is None:
+        sinks = []
+        for name in NOTIFY_SINKS.split(','):
+            name = name.strip().lower()
+            if name in SINK_TYPES:
+                sinks.append(SINK_TYPES[name]())
+            elif name:
+                print(f"Unknown notification sink: {name}")
+    if not sinks:
+        return None
+
+    _dispatcher = NotificationDispatcher(sinks).start()
+    add_alert_listener(_dispatcher.submit)
+    return _dispatcher
+
+def stop_notifications():
+    """Unsubscribe from alert evaluation and flush queued notifications."""
+    global _dispatcher
+    if _dispatcher is None:
+        return
+    remove_alert_listener(_dispatcher.submit)
+    _dispatcher.stop()
+    _dispatcher = None
@@ -0,0 +1,534 @@
+import csv
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import pickle
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+import requests
+
+from data.db import file_lock
+
+# Repository archive the city suggestion CSVs come from
+SUGGESTION_DATA_URL = "https://github.com/SNoeCode/group_8_weather_capstone/archive/refs/heads/main.zip"
+# Downloaded archives (and what is derived from them) live here
+CACHE_DIR = os.getenv('SUGGESTION_CACHE_DIR', 'suggestion_cache')
+# Seconds a cached archive is used before asking the server whether it changed
+ARCHIVE_TTL = int(os.getenv('SUGGESTION_CACHE_TTL', 24 * 60 * 60))
+# Older copies are evicted (least recently used first) once the cache grows past this
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+# Seconds before an unanswered download is abandoned
+DOWNLOAD_TIMEOUT = 60
+# Bump when the parsed table changes shape, so cached copies are rebuilt
+TABLE_VERSION = 4
+# Archives with at least this many CSVs are parsed in a process pool (fewer aren't worth starting one)
+PARALLEL_MIN_FILES = 8
+# Parser processes; 0 means one per CPU core
+PARSE_WORKERS = int(os.getenv('SUGGESTION_PARSE_WORKERS', 0))
+# Rows read to work out which columns of a CSV are usable
+SCHEMA_SAMPLE_ROWS = 200
+# Bytes read from the start of a CSV to guess its delimiter, and the delimiters considered
+SNIFF_BYTES = 16 * 1024
+CSV_DELIMITERS = ',;\t|'
+# Detected column layouts, by member content fingerprint (shared by every archive in the cache)
+SCHEMA_CACHE_FILE = 'csv_schemas.json'
+SCHEMA_CACHE_MAX = 10000
+
+# Column name keywords used to find the city and temperature columns of a CSV, in order of preference
+TEMPERATURE_KEYWORDS = ['temp', 'temperature', 'high', 'low']
+CITY_KEYWORDS = ['city', 'location', 'place', 'name']
+# Extra columns kept when a CSV has them (NaN otherwise): name keywords in order of preference,
+# and for coordinates the exact column names, since 'lat'/'lon' are parts of other words
+OPTIONAL_KEYWORDS = {
+    'humidity': ['humidity', 'humid'],
+    'wind_speed': ['wind speed', 'wind_speed', 'windspeed', 'wind'],
+    'precipitation': ['precipitation', 'precip', 'rain']
+}
+OPTIONAL_NAMES = {
+    'latitude': {'lat', 'latitude'},
+    'longitude': {'lon', 'lng', 'long', 'longitude'}
+}
+# Recorded with cached schemas and tables, which are ignored under any other version: changes with
+# TABLE_VERSION (bump it when detection logic changes) and with the keyword lists above
+LAYOUT_VERSION = f"{TABLE_VERSION}-" + hashlib.blake2b(json.dumps(
+    [TEMPERATURE_KEYWORDS, CITY_KEYWORDS, OPTIONAL_KEYWORDS,
+     {name: sorted(names) for name, names in OPTIONAL_NAMES.items()}], sort_keys=True
+).encode('utf-8'), digest_size=6).hexdigest()
+
+class LoadCancelled(Exception):
+    """Raised inside a download or parse when its cancel event is set."""
+
+def _url_key(url):
+    return hashlib.blake2b(url.encode('utf-8'), digest_size=8).hexdigest()
+
+def _meta_path(cache_dir, url):
+    return os.path.join(cache_dir, f"{_url_key(url)}.json")
+
+def _read_meta(cache_dir, url):
+    try:
+        with open(_meta_path(cache_dir, url), encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # A copy removed by hand (or by eviction elsewhere) means there is nothing cached
+    return meta if os.path.exists(os.path.join(cache_dir, meta.get('file', ''))) else None
+
+def _write_meta(cache_dir, url, meta):
+    path = _meta_path(cache_dir, url)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(path + '.tmp', path)
+
+def _download(url, cache_dir, meta, progress=None, cancel=None):
+    """
+    Conditional GET of url into the cache. Returns the new metadata, or the
+    old metadata (re-stamped) when the server answers 304 Not Modified.
+    """
+    headers = {}
+    if meta and meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta and meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+
+    with requests.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        if response.status_code == 304 and meta:
+            return dict(meta, checked_at=time.time())
+        response.raise_for_status()
+
+        digest = hashlib.blake2b(digest_size=16)
+        partial = os.path.join(cache_dir, f"{_url_key(url)}.part")
+        total = int(response.headers.get('Content-Length') or 0) or None
+        downloaded = 0
+        with open(partial, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                if cancel is not None and cancel.is_set():
+                    raise LoadCancelled()
+                digest.update(chunk)
+                f.write(chunk)
+                downloaded += len(chunk)
+                if progress:
+                    progress('download', downloaded, total)
+
+    # Content-addressed, so a copy another caller is still reading is never overwritten
+    name = f"{_url_key(url)}-{digest.hexdigest()}.zip"
+    os.replace(partial, os.path.join(cache_dir, name))
+    return {
+        'url': url,
+        'file': name,
+        'hash': digest.hexdigest(),
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'checked_at': time.time()
+    }
+
+def _entry_files(path):
+    """A cached archive and everything derived from it (same name, other suffixes)."""
+    return glob.glob(glob.escape(os.path.splitext(path)[0]) + '.*')
+
+def evict_archives(cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, keep=()):
+    """
+    Delete least recently used archives (and files derived from them) until the
+    cache fits in max_bytes. Archives named in keep are never deleted.
+    Returns the number of archives removed.
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.endswith('.zip') and os.path.isfile(path):
+            size = sum(os.path.getsize(entry) for entry in _entry_files(path))
+            entries.append((os.path.getmtime(path), path, size))
+
+    total = sum(size for _, _, size in entries)
+    removed = 0
+    for _, path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if os.path.basename(path) in keep:
+            continue
+        try:
+            for entry in _entry_files(path):
+                os.remove(entry)
+        except OSError as e:
+            print(f"Error evicting cached archive {path}: {e}")
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+def fetch_archive(url=SUGGESTION_DATA_URL, cache_dir=CACHE_DIR, ttl=ARCHIVE_TTL, max_bytes=CACHE_MAX_BYTES,
+                  progress=None, cancel=None):
+    """
+    Local path of the zip archive at url, downloading it only when needed.
+
+    A cached copy is used as is for ttl seconds; after that the server is asked
+    (by ETag / Last-Modified) whether it changed, and only a changed archive
+    is downloaded again. If the server can't be reached, a stale copy is used.
+    Raises requests.RequestException when there is no copy at all.
+
+    progress('download', bytes_done, total_bytes_or_None) is called as a
+    download proceeds; setting the cancel event (threading.Event) aborts it
+    with LoadCancelled.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    # Another process (or thread) may be downloading the same archive
+    with file_lock(_meta_path(cache_dir, url)):
+        meta = _read_meta(cache_dir, url)
+        if meta is None or time.time() - meta.get('checked_at', 0) >= ttl:
+            try:
+                meta = _download(url, cache_dir, meta, progress, cancel)
+                _write_meta(cache_dir, url, meta)
+            except requests.RequestException as e:
+                if meta is None:
+                    raise
+                print(f"Could not revalidate {url}, using cached copy: {e}")
+
+        path = os.path.join(cache_dir, meta['file'])
+        # Mark as recently used, so eviction drops the copies nobody reads any more
+        os.utime(path)
+        evict_archives(cache_dir, max_bytes, keep={meta['file']})
+    return path
+
+def list_csv_members(path):
+    """Names of the CSV files inside a zip archive, in archive order."""
+    with zipfile.ZipFile(path) as archive:
+        return [info.filename for info in archive.infolist()
+                if not info.is_dir() and info.filename.lower().endswith('.csv')]
+
+def _numeric_share(values):
+    """Fraction of a sample column that parses as numbers."""
+    return pd.to_numeric(values, errors='coerce').notna().mean() if len(values) else 0.0
+
+def _best_column(sample, keywords, numeric, exact=False):
+    """
+    First column (by keyword preference, then file order) whose name matches
+    a keyword and whose sample values are mostly numbers (numeric=True) or
+    mostly text (numeric=False).
+    """
+    lowered = {column: str(column).strip().lower() for column in sample.columns}
+    for keyword in keywords:
+        for column in sample.columns:
+            name = lowered[column]
+            if (name == keyword if exact else keyword in name) and \
+                    (_numeric_share(sample[column]) >= 0.5) == numeric:
+                return column
+    return None
+
+def detect_schema(sample):
+    """
+    Which column holds each field, judged from a CSV's header and a sample of
+    rows: {'city', 'temperature', <optional fields>: column name or None}.
+    Returns {} when the file has no usable city and temperature columns.
+    """
+    schema = {
+        'city': _best_column(sample, CITY_KEYWORDS, numeric=False),
+        'temperature': _best_column(sample, TEMPERATURE_KEYWORDS, numeric=True)
+    }
+    if schema['city'] is None or schema['temperature'] is None:
+        return {}
+    for name, keywords in OPTIONAL_KEYWORDS.items():
+        schema[name] = _best_column(sample, keywords, numeric=True)
+    for name, names in OPTIONAL_NAMES.items():
+        schema[name] = _best_column(sample, sorted(names), numeric=True, exact=True)
+    return schema
+
+def normalize_city_frame(data, source, schema=None):
+    """
+    (city, temperature, source) rows from one parsed CSV, plus humidity,
+    wind_speed, precipitation, latitude and longitude where the file has them,
+    or None when it has no city or temperature column. Rows without a city or
+    temperature are dropped. schema (from detect_schema) is detected from the
+    data when not given.
+    """
+    schema = detect_schema(data.head(SCHEMA_SAMPLE_ROWS)) if schema is None else schema
+    if not schema:
+        return None
+
+    city = data[schema['city']]
+    frame = pd.DataFrame({
+        'city': city.astype(str),
+        'temperature': pd.to_numeric(data[schema['temperature']], errors='coerce').astype('float32'),
+        'source': source
+    })
+    for name in list(OPTIONAL_KEYWORDS) + list(OPTIONAL_NAMES):
+        column = schema.get(name)
+        frame[name] = np.nan if column is None else pd.to_numeric(data[column], errors='coerce')
+        frame[name] = frame[name].astype('float32')
+    return frame[frame['temperature'].notna() & city.notna().to_numpy()]
+
+def member_fingerprint(info):
+    """Identifies a member's content across archive versions: CRC-32 and size from the zip directory."""
+    return f"{info.CRC:08x}:{info.file_size}"
+
+def sniff_delimiter(head):
+    """Delimiter of a CSV judged from its first lines (text), or ',' when it can't be told."""
+    try:
+        return csv.Sniffer().sniff(head, delimiters=CSV_DELIMITERS).delimiter
+    except csv.Error:
+        return ','
+
+def _read_member(archive, member, schema=None):
+    """
+    (frame, schema) for one CSV member of an open archive. The delimiter is
+    sniffed from the first lines and the schema detected from the header and a
+    sample unless known; only its columns are then parsed, with their dtypes.
+    A member known to be unusable (schema {}) is not read at all. Returns
+    (None, {}) for unusable members and (None, None) when the member can't be read.
+    """
+    if schema == {}:
+        return None, schema
+    try:
+        with archive.open(member) as csv_file:
+            head = csv_file.read(SNIFF_BYTES)
+        if len(head) == SNIFF_BYTES and b'\n' in head:
+            # A line cut off mid-way would throw the sniffer's counts off
+            head = head[:head.rindex(b'\n')]
+        sep = sniff_delimiter(head.decode('utf-8', errors='replace'))
+        if schema is None:
+            with archive.open(member) as csv_file:
+                schema = detect_schema(pd.read_csv(csv_file, sep=sep, nrows=SCHEMA_SAMPLE_ROWS))
+            if not schema:
+                return None, schema
+
+        columns = sorted({column for column in schema.values() if column is not None})
+        numeric = {column: 'float32' for field, column in schema.items() if column is not None and field != 'city'}
+        try:
+            with archive.open(member) as csv_file:
+                data = pd.read_csv(csv_file, sep=sep, usecols=columns, dtype=dict(numeric, **{schema['city']: str}))
+        except ValueError:
+            # A stray non-numeric value past the sample; parse as text and coerce instead
+            with archive.open(member) as csv_file:
+                data = pd.read_csv(csv_file, sep=sep, usecols=columns, dtype={schema['city']: str})
+        return normalize_city_frame(data, os.path.basename(member), schema), schema
+    except (OSError, ValueError, KeyError, pd.errors.ParserError) as e:
+        print(f"Error processing file {member}: {e}")
+        return None, None
+
+def _schema_cache_path(path):
+    return os.path.join(os.path.dirname(path) or '.', SCHEMA_CACHE_FILE)
+
+def _read_schema_file(cache_path):
+    try:
+        with open(cache_path, encoding='utf-8') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # Schemas detected under other keywords or detection logic may be wrong now
+    if not isinstance(cached, dict) or cached.get('version') != LAYOUT_VERSION:
+        return {}
+    return cached.get('schemas', {})
+
+def _load_schemas(path):
+    """{fingerprint: schema} detected for earlier archives in the same directory."""
+    cache_path = _schema_cache_path(path)
+    try:
+        with file_lock(cache_path):
+            return _read_schema_file(cache_path)
+    except OSError:
+        return {}
+
+def _save_schemas(path, new_schemas):
+    """
+    Add detected schemas to the cache, keeping the most recent SCHEMA_CACHE_MAX.
+    The file is re-read under the lock, so schemas saved by another process
+    meanwhile are merged rather than overwritten.
+    """
+    cache_path = _schema_cache_path(path)
+    try:
+        with file_lock(cache_path):
+            schemas = _read_schema_file(cache_path)
+            schemas.update(new_schemas)
+            schemas = dict(list(schemas.items())[-SCHEMA_CACHE_MAX:])
+            with open(cache_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({'version': LAYOUT_VERSION, 'schemas': schemas}, f)
+            os.replace(cache_path + '.tmp', cache_path)
+    except OSError as e:
+        print(f"Error saving CSV schema cache: {e}")
+
+# Archives opened by a parser process, kept open for the next member it is handed
+_worker_archives = {}
+
+def _parse_member(path, member, schema):
+    """_read_member for a parser process; the frame travels back pickled."""
+    if path not in _worker_archives:
+        _worker_archives[path] = zipfile.ZipFile(path)
+    return _read_member(_worker_archives[path], member, schema)
+
+def _parse_parallel(path, members, schemas, workers, progress, cancel, frames, detected):
+    """
+    Parse members across a pool of processes into frames ({member: frame} for
+    the usable ones) and detected ({member: schema}), filled as files finish
+    so a caller can carry on from there if the pool breaks. schemas holds the
+    already known ones.
+    """
+    # Spawned, not forked: the app forks from a worker thread while other threads
+    # (spool drainer, notifications, alert monitor) may hold locks a child would inherit
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        pending = {pool.submit(_parse_member, path, member, schemas.get(member)): member for member in members}
+        done_count = len(detected)
+        while pending:
+            # Wake up regularly so a cancel doesn't wait for a slow file
+            finished, _ = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            if cancel is not None and cancel.is_set():
+                raise LoadCancelled()
+            for future in finished:
+                member = pending.pop(future)
+                frame, detected[member] = future.result()
+                done_count += 1
+                if frame is not None:
+                    frames[member] = frame
+                if progress:
+                    progress('parse', done_count, len(members), frame)
+    finally:
+        # Drop files not started yet when cancelled or failed (cancel_futures needs Python 3.9)
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
+
+def parse_city_table(path, members=None, progress=None, cancel=None, workers=None):
+    """
+    Parse CSV members of an archive (default: all of them) into one
+    (city, temperature, source, ...optional metrics) table with compact
+    dtypes: categorical city and source, float32 numbers. Unusable files are
+    skipped.
+
+    With PARALLEL_MIN_FILES or more members the files are parsed in a pool
+    of workers processes (default PARSE_WORKERS, else one per core). Each
+    file's layout is detected from a sample and cached by content fingerprint
+    next to the archive, so unchanged files in a new archive version skip
+    detection, and files known to be unusable are not read.
+
+    progress('parse', files_done, file_count, frame) is called after each
+    file (frame is None for unusable ones), so callers can show partial
+    results; setting the cancel event aborts with LoadCancelled.
+    """
+    members = list_csv_members(path) if members is None else members
+    workers = workers or PARSE_WORKERS or os.cpu_count() or 1
+    with zipfile.ZipFile(path) as archive:
+        fingerprints = {member: member_fingerprint(archive.getinfo(member)) for member in members}
+    cached_schemas = _load_schemas(path)
+    known = {member: cached_schemas[fingerprint] for member, fingerprint in fingerprints.items()
+             if fingerprint in cached_schemas}
+
+    frames = {}
+    detected = {}
+    if workers > 1 and len(members) >= PARALLEL_MIN_FILES:
+        try:
+            _parse_parallel(path, members, known, min(workers, len(members)), progress, cancel, frames, detected)
+        except BrokenProcessPool as e:
+            print(f"Parallel parsing failed, parsing the remaining files one by one: {e}")
+
+    # Everything when not parsing in parallel; what the pool didn't finish otherwise
+    remaining = [member for member in members if member not in detected]
+    if remaining:
+        with zipfile.ZipFile(path) as archive:
+            for member in remaining:
+                if cancel is not None and cancel.is_set():
+                    raise LoadCancelled()
+                frame, detected[member] = _read_member(archive, member, known.get(member))
+                if frame is not None:
+                    frames[member] = frame
+                if progress:
+                    progress('parse', len(detected), len(members), frame)
+
+    new_schemas = {fingerprints[member]: schema for member, schema in detected.items()
+                   if schema is not None and member not in known}
+    if new_schemas:
+        _save_schemas(path, new_schemas)
+
+    if frames:
+        # One concatenation at the end (in archive order, however the files finished)
+        table = pd.concat([frames[member] for member in members if member in frames], ignore_index=True)
+    else:
+        table = pd.DataFrame({'city': pd.Series(dtype=str), 'temperature': pd.Series(dtype='float32'),
+                              'source': pd.Series(dtype=str)})
+        for name in list(OPTIONAL_KEYWORDS) + list(OPTIONAL_NAMES):
+            table[name] = pd.Series(dtype='float32')
+    return table.astype({'city': 'category', 'source': 'category'})
+
+def load_city_table(path, progress=None, cancel=None):
+    """
+    The parsed (city, temperature, source) table for a cached archive, built
+    once per archive version and pickled next to it (so it is evicted with
+    it). Later calls just unpickle it. progress and cancel are passed on to
+    parse_city_table when the table has to be built.
+    """
+    table_path = f"{os.path.splitext(path)[0]}.table.pkl"
+    with file_lock(path):
+        try:
+            with open(table_path, 'rb') as f:
+                cached = pickle.load(f)
+            if cached.get('version') == LAYOUT_VERSION:
+                return cached['table']
+        except FileNotFoundError:
+            pass
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+            print(f"Rebuilding suggestion table cache: {e}")
+
+        table = parse_city_table(path, progress=progress, cancel=cancel)
+        with open(table_path + '.tmp', 'wb') as f:
+            pickle.dump({'version': LAYOUT_VERSION, 'table': table}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(table_path + '.tmp', table_path)
+    return table
+
+class TemperatureIndex:
+    """
+    Cities sorted by temperature for range and closest-match queries.
+
+    Built once per loaded table (O(n log n)); a range is two searchsorted
+    lookups and the k cities closest to a temperature only look at the 2k
+    neighbours of its insertion point, so queries don't slow down as the
+    dataset grows.
+    """
+
+    def __init__(self, frame):
+        temperatures = frame['temperature'].to_numpy(dtype=np.float32)
+        order = np.argsort(temperatures, kind='stable')
+        self.temperatures = temperatures[order]
+        self.frame = frame.iloc[order].reset_index(drop=True)
+
+    def __len__(self):
+        return len(self.temperatures)
+
+    def range_bounds(self, low=None, high=None):
+        """(start, stop) positions of the cities with low <= temperature <= high."""
+        # Bounds are cast to the array's dtype; a Python float would make NumPy convert the whole array
+        start = 0 if low is None else int(np.searchsorted(self.temperatures, np.float32(low), side='left'))
+        stop = len(self) if high is None else int(np.searchsorted(self.temperatures, np.float32(high), side='right'))
+        return start, max(start, stop)
+
+    def in_range(self, low=None, high=None):
+        """Cities with low <= temperature <= high (either bound optional), coldest first."""
+        start, stop = self.range_bounds(low, high)
+        return self.frame.iloc[start:stop]
+
+    def closest(self, target, k=3, low=None, high=None):
+        """
+        The k cities whose temperature is closest to target, optionally limited
+        to low..high, closest first, with their distance as 'relevance'.
+        """
+        start, stop = self.range_bounds(low, high)
+        if k <= 0 or start == stop:
+            return self.frame.iloc[0:0].assign(relevance=np.float32())
+
+        # The k closest values of a sorted array lie within k places of the insertion point
+        position = int(np.searchsorted(self.temperatures, np.float32(target)))
+        # A target outside low..high is closest to the near end of the range
+        position = min(max(position, start), stop)
+        window_start = max(start, position - k)
+        window_stop = min(stop, position + k)
+        distance = np.abs(self.temperatures[window_start:window_stop] - np.float32(target))
+
+        if k < len(distance):
+            nearest = np.argpartition(distance, k - 1)[:k]
+        else:
+            nearest = np.arange(len(distance))
+        nearest = nearest[np.argsort(distance[nearest], kind='stable')]
+        return self.frame.iloc[window_start + nearest].assign(relevance=distance[nearest])
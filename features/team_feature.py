@@ -1,125 +1,192 @@
 import os
+import queue
 import random
+import threading
 import pandas as pd
 import tkinter as tk
-from tkinter import messagebox
+from tkinter import messagebox, ttk
 import requests
-import tempfile
 import zipfile
 
+from features.city_recommender import build_recommender
+from features.suggestion_data import (
+    SUGGESTION_DATA_URL, LoadCancelled, TemperatureIndex, fetch_archive, list_csv_members, load_city_table
+)
+
+# Temperature ranges for preferences (in Fahrenheit)
+TEMPERATURE_RANGES = {
+    "cold": (-20, 50),    # Cold weather: below 50°F
+    "cool": (50, 75),     # Cool weather: 50-75°F
+    "hot": (75, 120)      # Hot weather: above 75°F
+}
+# Cities shown per suggestion unless the user asks for more
+DEFAULT_SUGGESTION_COUNT = 3
+# As many as fit in the results dialog on a 1080p screen (190px + 155px per city card,
+# which grew a "similar climates" line; 6 would need 1120px)
+MAX_SUGGESTION_COUNT = 5
+# How often (ms) the Tk thread checks on a background load
+LOADING_POLL_MS = 100
+
 class CitySuggestionApp:
     def __init__(self, parent):
         """Initialize the CitySuggestionApp."""
         self.parent = parent
         self.preference_var = tk.StringVar()
-        self.repo_url = "https://github.com/SNoeCode/group_8_weather_capstone/archive/refs/heads/main.zip"
-        
-    def download_csv_files(self):
-        """Download CSV files from the remote repository."""
-        try:
-            # Create a temporary directory
-            temp_dir = tempfile.mkdtemp()
-            
-            # Download the repository zip file
-            response = requests.get(self.repo_url, stream=True)
-            response.raise_for_status()
-            
-            zip_path = os.path.join(temp_dir, "repo.zip")
-            with open(zip_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-        
-            # Extract the zip file
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
+        self.repo_url = SUGGESTION_DATA_URL
+        self.archive_path = None
+        # The loaded city data and its TemperatureIndex, built once per load (on the loading thread)
+        self.city_data = None
+        self.city_index = None
+        # Climate recommender over the cached table and weather history, and the archive it was built from
+        self.recommender = None
+        self.recommender_archive = None
+        self.min_temp_var = tk.StringVar()
+        self.max_temp_var = tk.StringVar()
+        self.count_var = tk.StringVar(value=str(DEFAULT_SUGGESTION_COUNT))
         
-            # Find CSV files in the extracted directory
-            csv_files = []
-            for root, dirs, files in os.walk(temp_dir):
-                for file in files:
-                    if file.endswith('.csv'):
-                        csv_files.append(os.path.join(root, file))
-        
-            return csv_files  # Return ALL CSV files, not just first 3
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to download repository: {e}")
+    def download_csv_files(self, progress=None, cancel=None):
+        """
+        CSV files in the remote repository, as member names of its zip archive
+        (downloaded once and cached on disk; see self.archive_path).
+        Raises requests.RequestException, OSError or zipfile.BadZipFile on failure.
+        """
+        # Reuses the cached archive; only revalidated with the server after its TTL
+        self.archive_path = fetch_archive(self.repo_url, progress=progress, cancel=cancel)
+        return list_csv_members(self.archive_path)  # Return ALL CSV files, not just first 3
+
+    def similar_cities(self, city, k=3):
+        """
+        Names of the k cities with the most similar climate (temperature,
+        humidity, wind, precipitation, location) across every dataset and our
+        own weather history. Empty until load_combined_city_data has built the
+        recommender, which is too slow for the Tk thread.
+        """
+        if self.recommender is None:
             return []
-
-    def pick_random_csv_files(self, count=3):
-        """Pick random CSV files from the downloaded repository."""
         try:
-            csv_files = self.download_csv_files()
-            if not csv_files:
-                raise FileNotFoundError("No CSV files found in the repository.")
-            
-            # Pick random files (up to the specified count)
-            selected_files = random.sample(csv_files, min(count, len(csv_files)))
-            return selected_files
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to pick random CSV files: {e}")
+            return [name for name, _ in self.recommender.similar_to(str(city), k)]
+        except KeyError:
             return []
-
-    def load_combined_city_data(self):
-        """Load and combine city data from 3 random CSV files."""
-        try:
-            # Show loading message
-            loading_dialog = self.show_loading_dialog()
-            self.parent.update()
-            
-            # Get 3 random CSV files
-            csv_files = self.pick_random_csv_files(3)
-            if not csv_files:
-                loading_dialog.destroy()
-                return None
-
-            combined_data = pd.DataFrame()
-            
-            for file_path in csv_files:
-                try:
-                    # Load each CSV file
-                    data = pd.read_csv(file_path)
-                    
-                    # Try to identify temperature and city columns
-                    temp_cols = [col for col in data.columns if any(word in col.lower() for word in ['temp', 'temperature', 'high', 'low'])]
-                    city_cols = [col for col in data.columns if any(word in col.lower() for word in ['city', 'location', 'place', 'name'])]
-                    
-                    if temp_cols and city_cols:
-                        # Create standardized DataFrame
-                        standardized_data = pd.DataFrame({
-                            'city': data[city_cols[0]],
-                            'temperature': pd.to_numeric(data[temp_cols[0]], errors='coerce')
-                        })
-                        
-                        # Add source file info
-                        standardized_data['source'] = os.path.basename(file_path)
-                        
-                        # Append to combined data
-                        combined_data = pd.concat([combined_data, standardized_data], ignore_index=True)
-                        
-                except Exception as e:
-                    print(f"Error processing file {file_path}: {e}")
-                    continue
-            
-            loading_dialog.destroy()
-            
-            # Remove duplicates and NaN values
-            combined_data = combined_data.dropna().drop_duplicates(subset=['city'])
-            
-            return combined_data if not combined_data.empty else None
-            
         except Exception as e:
-            if 'loading_dialog' in locals():
-                loading_dialog.destroy()
-            messagebox.showerror("Error", f"Failed to load city data: {e}")
-            return None
+            print(f"Error finding cities similar to {city}: {e}")
+            return []
 
-    def show_loading_dialog(self):
-        """Show a loading dialog while processing data."""
+    def pick_random_csv_files(self, count=3, progress=None, cancel=None):
+        """Pick random CSV files from the downloaded repository."""
+        csv_files = self.download_csv_files(progress, cancel)
+        if not csv_files:
+            raise FileNotFoundError("No CSV files found in the repository.")
+        
+        # Pick random files (up to the specified count)
+        return random.sample(csv_files, min(count, len(csv_files)))
+
+    def load_combined_city_data(self, progress=None, cancel=None):
+        """
+        Load and combine city data from 3 random CSV files.
+
+        Shows no dialogs, so it can run on a worker thread: errors are raised,
+        and setting cancel (a threading.Event) stops it with LoadCancelled.
+        progress(stage, done, total, frame=None) reports the download and each
+        parsed file; frame holds that file's rows if it is one of the 3 chosen.
+        """
+        csv_files = self.pick_random_csv_files(3, progress, cancel)
+        sources = {os.path.basename(file_path) for file_path in csv_files}
+
+        def parse_progress(stage, done, total, frame=None):
+            if frame is not None:
+                frame = frame[frame['source'].isin(sources)]
+            progress(stage, done, total, frame if frame is not None and not frame.empty else None)
+
+        # Parsed once per dataset version; later loads just read the cached table
+        city_table = load_city_table(self.archive_path, parse_progress if progress else None, cancel)
+        combined_data = city_table[city_table['source'].isin(sources)]
+
+        # Built here (usually on the loading thread): it groups the whole table and the weather history
+        if self.recommender is None or self.recommender_archive != self.archive_path:
+            try:
+                self.recommender = build_recommender(city_table)
+                self.recommender_archive = self.archive_path
+            except Exception as e:
+                print(f"Error building city recommender: {e}")
+        
+        # Remove duplicates and NaN values
+        combined_data = combined_data.dropna(subset=['city', 'temperature']).drop_duplicates(subset=['city'])
+        
+        return combined_data if not combined_data.empty else None
+
+    def load_city_data_async(self, on_loaded, preview=None):
+        """
+        Run load_combined_city_data on a worker thread behind a cancelable
+        loading dialog, so the app stays responsive. Progress comes back through
+        a queue the Tk thread polls with after(). preview(candidates) is given
+        each newly parsed file plus the previous best rows and returns (a line
+        of text, the best rows to keep); on_loaded(city_data) is called when
+        loading finishes (not when it is cancelled or fails).
+        """
+        events = queue.Queue()
+        cancel = threading.Event()
+        loading_dialog = self.show_loading_dialog(cancel)
+
+        def worker():
+            try:
+                city_data = self.load_combined_city_data(lambda *event: events.put(('progress',) + event), cancel)
+                if city_data is not None:
+                    # Sorting is the O(n log n) part; do it here so queries on the Tk thread are lookups
+                    self.temperature_index(city_data)
+                events.put(('done', city_data))
+            except LoadCancelled:
+                events.put(('cancelled',))
+            except Exception as e:
+                events.put(('error', e))
+
+        threading.Thread(target=worker, daemon=True).start()
+        self.parent.after(LOADING_POLL_MS, self._poll_loading, events, cancel, loading_dialog, on_loaded, preview, [])
+
+    def _poll_loading(self, events, cancel, loading_dialog, on_loaded, preview, best):
+        """Apply progress events from the loading worker on the Tk main thread."""
+        if cancel.is_set():
+            # Cancelled from the dialog, which is already gone; the worker stops on its own
+            return
+
+        while True:
+            try:
+                event = events.get_nowait()
+            except queue.Empty:
+                self.parent.after(LOADING_POLL_MS, self._poll_loading, events, cancel, loading_dialog,
+                                  on_loaded, preview, best)
+                return
+
+            if event[0] != 'progress':
+                break
+            _, stage, done, total, *frame = event
+            if stage == 'download':
+                size = f"{done / 1e6:.1f} MB" + (f" of {total / 1e6:.1f} MB" if total else "")
+                self.loading_status.config(text=f"🔄 Downloading weather datasets... {size}")
+                self.loading_progress['value'] = 100 * done / total if total else 0
+            else:
+                self.loading_status.config(text=f"📊 Analyzing weather data... file {done} of {total}")
+                self.loading_progress['value'] = 100 * done / total
+                if frame and frame[0] is not None and preview:
+                    # Best results so far: only the new file is ranked, together with the previous best
+                    candidates = pd.concat(best + [frame[0]], ignore_index=True).drop_duplicates(subset=['city'])
+                    text, ranked = preview(candidates)
+                    best[:] = [ranked]
+                    self.loading_preview.config(text=text)
+
+        loading_dialog.destroy()
+        if event[0] == 'done':
+            on_loaded(event[1])
+        elif event[0] == 'error':
+            messagebox.showerror("Error", f"Failed to load city data: {event[1]}")
+
+    def show_loading_dialog(self, cancel=None):
+        """
+        Show a loading dialog while processing data, with progress, partial
+        results and (given a cancel event) a Cancel button.
+        """
         loading_dialog = tk.Toplevel(self.parent)
         loading_dialog.title("Loading...")
-        loading_dialog.geometry("350x220")
+        loading_dialog.geometry("380x240")
         loading_dialog.configure(bg="#2c3e50")
         loading_dialog.resizable(False, False)
         
@@ -127,53 +194,80 @@ class CitySuggestionApp:
         loading_dialog.transient(self.parent)
         loading_dialog.grab_set()
         
-        tk.Label(loading_dialog, text="🔄 Downloading and analyzing weather data...", 
-                 font=("Helvetica", 12, "bold"), bg="#2c3e50", fg="white").pack(expand=True)
+        self.loading_status = tk.Label(loading_dialog, text="🔄 Downloading and analyzing weather data...",
+                                       font=("Helvetica", 12, "bold"), bg="#2c3e50", fg="white")
+        self.loading_status.pack(pady=(30, 10))
+
+        self.loading_progress = ttk.Progressbar(loading_dialog, length=300, mode="determinate", maximum=100)
+        self.loading_progress.pack(pady=5)
+
+        self.loading_preview = tk.Label(loading_dialog, text="", font=("Helvetica", 10), bg="#2c3e50",
+                                        fg="#bdc3c7", wraplength=340, justify="center")
+        self.loading_preview.pack(pady=10)
+
+        if cancel is not None:
+            def cancel_loading():
+                cancel.set()
+                loading_dialog.destroy()
+
+            tk.Button(loading_dialog, text="Cancel", command=cancel_loading).pack(pady=(0, 15))
+            loading_dialog.protocol("WM_DELETE_WINDOW", cancel_loading)
         
         return loading_dialog
 
-    def suggest_cities_by_preference(self, preference):
-        """Suggest cities based on weather preference (hot, cool, cold)."""
-        city_data = self.load_combined_city_data()
+    def temperature_index(self, city_data):
+        """The TemperatureIndex of city_data, built once per loaded table and reused by every query on it."""
+        index = self.city_index
+        if index is None or self.city_data is not city_data:
+            index = TemperatureIndex(city_data)
+            self.city_data, self.city_index = city_data, index
+        return index
+
+    def rank_cities(self, city_data, temp_range, k=DEFAULT_SUGGESTION_COUNT, index=None):
+        """
+        The k cities of city_data closest to the middle of a (min, max) °F range.
+        Uses the cached index of the loaded table unless index is given.
+        """
+        # Closest to the middle of the range, looked up in the sorted temperature index
+        min_temp, max_temp = temp_range
+        if index is None:
+            index = self.temperature_index(city_data)
+        return index.closest((min_temp + max_temp) / 2, k, min_temp, max_temp)
+
+    def suggest_cities_by_preference(self, preference, k=DEFAULT_SUGGESTION_COUNT, temp_range=None, city_data=None):
+        """
+        Suggest the k cities closest to the middle of a temperature range:
+        a preference's range (hot, cool, cold) or a custom (min, max) in °F.
+        city_data is loaded (on this thread) when not given.
+        """
+        if city_data is None:
+            try:
+                city_data = self.load_combined_city_data()
+            except (requests.RequestException, OSError, zipfile.BadZipFile) as e:
+                messagebox.showerror("Error", f"Failed to load city data: {e}")
+                return []
         if city_data is None or city_data.empty:
             messagebox.showwarning("Warning", "No city data available for suggestions.")
             return []
 
-        # Define temperature ranges for preferences (in Fahrenheit)
-        temp_ranges = {
-            "cold": (-20, 50),    # Cold weather: below 50°F
-            "cool": (50, 75),     # Cool weather: 50-75°F
-            "hot": (75, 120)      # Hot weather: above 75°F
-        }
+        if temp_range is None:
+            if preference not in TEMPERATURE_RANGES:
+                messagebox.showerror("Error", "Invalid preference. Choose 'hot', 'cool', or 'cold'.")
+                return []
+            temp_range = TEMPERATURE_RANGES[preference]
 
-        if preference not in temp_ranges:
-            messagebox.showerror("Error", "Invalid preference. Choose 'hot', 'cool', or 'cold'.")
-            return []
-
-        # Filter cities based on preference
-        min_temp, max_temp = temp_ranges[preference]
-        filtered_cities = city_data[
-            (city_data["temperature"] >= min_temp) & 
-            (city_data["temperature"] <= max_temp)
-        ]
-
-        if filtered_cities.empty:
+        sorted_cities = self.rank_cities(city_data, temp_range, k)
+        if sorted_cities.empty:
             messagebox.showinfo("Info", f"No cities found for {preference} weather preference.\nTry a different preference!")
             return pd.DataFrame()
 
-        # Sort cities by relevance (closest to the middle of the range)
-        mid_temp = (min_temp + max_temp) / 2
-        filtered_cities = filtered_cities.copy()
-        filtered_cities["relevance"] = abs(filtered_cities["temperature"] - mid_temp)
-        sorted_cities = filtered_cities.sort_values(by="relevance").head(3)
-
         return sorted_cities
 
     def show_preference_dialog(self):
         """Show dialog to get user's weather preference."""
         dialog = tk.Toplevel(self.parent)
         dialog.title("Weather Preference")
-        dialog.geometry("450x500")
+        dialog.geometry("450x590")
         dialog.configure(bg="#34495e")
         dialog.resizable(False, False)
 
@@ -215,9 +309,22 @@ class CitySuggestionApp:
         # Set default selection
         self.preference_var.set("cool")
 
+        # Optional custom range (overrides the preference's range) and number of results
+        custom_frame = tk.Frame(dialog, bg="#34495e")
+        custom_frame.pack(pady=(12, 0), padx=30, fill="x")
+
+        tk.Label(custom_frame, text="Custom range (°F):", font=("Helvetica", 10),
+                 bg="#34495e", fg="#ecf0f1").pack(side=tk.LEFT)
+        tk.Entry(custom_frame, textvariable=self.min_temp_var, width=5).pack(side=tk.LEFT, padx=(5, 2))
+        tk.Label(custom_frame, text="to", font=("Helvetica", 10), bg="#34495e", fg="#ecf0f1").pack(side=tk.LEFT)
+        tk.Entry(custom_frame, textvariable=self.max_temp_var, width=5).pack(side=tk.LEFT, padx=(2, 15))
+        tk.Label(custom_frame, text="Cities:", font=("Helvetica", 10),
+                 bg="#34495e", fg="#ecf0f1").pack(side=tk.LEFT)
+        tk.Spinbox(custom_frame, from_=1, to=MAX_SUGGESTION_COUNT, textvariable=self.count_var, width=4).pack(side=tk.LEFT, padx=5)
+
         # Buttons frame
         button_frame = tk.Frame(dialog, bg="#34495e")
-        button_frame.pack(pady=40)
+        button_frame.pack(pady=30)
 
         # Custom button function
         def create_custom_button(parent, text, bg_color, fg_color, command):
@@ -250,9 +357,35 @@ class CitySuggestionApp:
         # Use the custom button function
         def suggest_cities():
             preference = self.preference_var.get()
+            try:
+                count = min(MAX_SUGGESTION_COUNT, max(1, int(self.count_var.get() or DEFAULT_SUGGESTION_COUNT)))
+                temp_range = None
+                if self.min_temp_var.get().strip() or self.max_temp_var.get().strip():
+                    temp_range = (float(self.min_temp_var.get()), float(self.max_temp_var.get()))
+                    if temp_range[0] > temp_range[1]:
+                        raise ValueError
+                    preference = f"{temp_range[0]:g}-{temp_range[1]:g}°F"
+            except ValueError:
+                messagebox.showerror("Error", "Enter a custom range as two numbers (min and max °F) and a whole number of cities.")
+                return
             dialog.destroy()
-            suggested_cities = self.suggest_cities_by_preference(preference)
-            self.show_results(suggested_cities, preference)
+
+            def preview(candidates):
+                # A throwaway index over one file's rows, so the loaded table's cached index is kept
+                ranked = self.rank_cities(candidates, temp_range or TEMPERATURE_RANGES[preference], count,
+                                          TemperatureIndex(candidates))
+                found = ', '.join(f"{city} ({temperature:.0f}°F)"
+                                  for city, temperature in zip(ranked['city'], ranked['temperature']))
+                return (f"Best so far: {found}" if found else ""), ranked.drop(columns='relevance')
+
+            def show_suggestions(city_data):
+                if city_data is None:
+                    messagebox.showwarning("Warning", "No city data available for suggestions.")
+                    return
+                suggested_cities = self.suggest_cities_by_preference(preference, count, temp_range, city_data)
+                self.show_results(suggested_cities, preference)
+
+            self.load_city_data_async(show_suggestions, preview)
 
         suggest_btn = create_custom_button(button_frame, "Suggest Cities", "#27ae60", "white", suggest_cities)
         suggest_btn.pack(side=tk.LEFT, padx=10)
@@ -264,7 +397,9 @@ class CitySuggestionApp:
         """Display the suggested cities in a dialog."""
         result_dialog = tk.Toplevel(self.parent)
         result_dialog.title("City Suggestions")
-        result_dialog.geometry("550x500")
+        # Room for every suggested city (about 155px each) below the title and above the close button
+        result_count = 0 if cities is None else len(cities)
+        result_dialog.geometry(f"550x{max(500, 190 + 155 * result_count)}")
         result_dialog.configure(bg="#2c3e50")
         result_dialog.resizable(False, False)
 
@@ -305,7 +440,7 @@ class CitySuggestionApp:
             
             return button_frame
 
-        if cities is None or cities.empty:
+        if cities is None or len(cities) == 0:
             # No results found
             no_data_frame = tk.Frame(result_dialog, bg="#e74c3c", relief="raised", bd=3)
             no_data_frame.pack(pady=30, padx=30, fill="x")
@@ -342,7 +477,13 @@ class CitySuggestionApp:
                 # Source information
                 source_label = tk.Label(city_frame, text=f"📊 Data Source: {city['source']}", 
                                         font=("Helvetica", 10), bg="#34495e", fg="#bdc3c7")
-                source_label.pack(pady=(0, 15))
+                source_label.pack(pady=(0, 5))
+
+                # Cities with a similar climate overall, not just temperature
+                similar = self.similar_cities(city['city'])
+                similar_label = tk.Label(city_frame, text=f"🔗 Similar climates: {', '.join(similar) if similar else '-'}",
+                                         font=("Helvetica", 10), bg="#34495e", fg="#bdc3c7")
+                similar_label.pack(pady=(0, 15))
 
         # Close button - UPDATED TO USE CUSTOM BUTTON
         close_btn = create_custom_button(result_dialog, "Close", "#95a5a6", "white", result_dialog.destroy)
@@ -1,11 +1,43 @@
 import sqlite3
+import hashlib
 import json
+import operator
+import threading
+import time
+import zlib
+from collections import namedtuple
 from datetime import datetime, timedelta
 from enum import Enum
 
+import numpy as np
+
+from data.db import connect, immediate_transaction, retry_on_busy
+from features.alert_expression import compile_expression
+
 # Database name for weather alerts
 ALERTS_DB = 'weather_alerts.db'
 
+# In-memory index of active rules: {city: {country: {alert_type: [rule, ...]}}}.
+# Built once from the database and rebuilt only after rules change.
+_rule_index = None
+_rule_index_lock = threading.Lock()
+
+# Format of the human-readable triggered_date/last_triggered columns
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Rows removed per transaction by clear_old_alerts, so retention never holds the write lock for long
+RETENTION_CHUNK_SIZE = 1000
+
+# Default re-notification window for a rule whose condition stays true
+DEFAULT_COOLDOWN_MINUTES = 60
+# Rules whose in-memory state (suppressed counts) has not been written back yet
+_dirty_rules = {}
+# Guards rule state and _dirty_rules: the Tk thread, the alert monitor and refresh
+# workers all evaluate rules (re-entrant, since state updates mark rules dirty)
+_rule_state_lock = threading.RLock()
+
+# Callbacks given each list of newly triggered alerts (e.g. the notification queue)
+_alert_listeners = []
+
 class AlertType(Enum):
     """Types of weather alerts available."""
     TEMPERATURE_HIGH = "temperature_high"
@@ -24,6 +56,7 @@ class AlertType(Enum):
     FLOOD = "flood"
     FIRE_WEATHER = "fire_weather"
     AIR_QUALITY = "air_quality"
+    CUSTOM = "custom"
 
 class AlertSeverity(Enum):
     """Severity levels for alerts."""
@@ -34,7 +67,7 @@ class AlertSeverity(Enum):
 
 def init_alerts_db():
     """Initialize the alerts database and create necessary tables."""
-    conn = sqlite3.connect(ALERTS_DB)
+    conn = connect(ALERTS_DB)
     c = conn.cursor()
     
     # Create alerts configuration table
@@ -65,23 +98,225 @@ def init_alerts_db():
         )
     ''')
     
+    # Weather snapshots referenced by alert history, stored once per distinct content
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS alert_snapshots (
+            hash TEXT PRIMARY KEY,
+            payload BLOB NOT NULL
+        )
+    ''')
+    # Searchable text pulled out of each snapshot (the payload itself is compressed)
+    c.execute("PRAGMA table_info(alert_snapshots)")
+    snapshot_columns = [column[1] for column in c.fetchall()]
+    for column in ('alert_text', 'weather_description'):
+        if column not in snapshot_columns:
+            c.execute(f'ALTER TABLE alert_snapshots ADD COLUMN {column} TEXT')
+    
+    c.execute("PRAGMA table_info(alert_history)")
+    history_columns = [column[1] for column in c.fetchall()]
+    if 'snapshot_hash' not in history_columns:
+        c.execute('ALTER TABLE alert_history ADD COLUMN snapshot_hash TEXT')
+    _migrate_history_snapshots(c)
+    
+    # Epoch seconds alongside triggered_date, so history can be ordered and ranged through an index
+    if 'triggered_at' not in history_columns:
+        c.execute('ALTER TABLE alert_history ADD COLUMN triggered_at INTEGER')
+    c.execute('SELECT id, triggered_date FROM alert_history WHERE triggered_at IS NULL')
+    backfill = [(_parse_date(triggered_date), history_id) for history_id, triggered_date in c.fetchall()]
+    if backfill:
+        c.executemany('UPDATE alert_history SET triggered_at = ? WHERE id = ?', backfill)
+    
+    # History is browsed newest first, overall or by city/type; snapshots are checked for references
+    c.execute('CREATE INDEX IF NOT EXISTS idx_alert_history_time ON alert_history (triggered_at, id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_alert_history_city ON alert_history (city, triggered_at, id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_alert_history_type ON alert_history (alert_type, triggered_at, id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_alert_history_snapshot ON alert_history (snapshot_hash)')
+    
+    _backfill_snapshot_text(c)
+    _init_search_index(c)
+    
+    # Add cooldown/hysteresis state to rule tables created by older versions
+    c.execute("PRAGMA table_info(alert_rules)")
+    existing_columns = [column[1] for column in c.fetchall()]
+    required_columns = {
+        'cooldown_minutes': f'REAL DEFAULT {DEFAULT_COOLDOWN_MINUTES}',
+        'hysteresis': 'REAL DEFAULT 0',
+        'armed': 'INTEGER DEFAULT 1',
+        'suppressed_count': 'INTEGER DEFAULT 0',
+        'last_triggered_at': 'REAL',
+        # Custom rules: expression text, chosen severity, and consecutive matching readings so far
+        'expression': 'TEXT',
+        'severity': 'TEXT',
+        'streak': 'INTEGER DEFAULT 0',
+        # observed_at of the last reading counted in streak, so re-checking one reading doesn't count twice
+        'streak_observed_at': 'REAL'
+    }
+    for column, data_type in required_columns.items():
+        if column not in existing_columns:
+            c.execute(f'ALTER TABLE alert_rules ADD COLUMN {column} {data_type}')
+    
+    # Rules are looked up by city
+    c.execute('CREATE INDEX IF NOT EXISTS idx_alert_rules_city ON alert_rules (city, is_active)')
+    
     conn.commit()
     conn.close()
 
-def add_alert_rule(city, country, alert_type, threshold_value, condition=">="):
-    """Add a new weather alert rule."""
+def _parse_date(value):
+    """Epoch seconds for a DATE_FORMAT string, or None if it doesn't parse."""
+    try:
+        return int(datetime.strptime(value, DATE_FORMAT).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+def encode_snapshot(snapshot):
+    """
+    Encode a weather snapshot for the snapshot store.
+    Returns (hash, payload): a digest of the canonical JSON, so identical
+    snapshots share one row, and the zlib-compressed JSON itself.
+    """
+    encoded = json.dumps(snapshot, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest(), zlib.compress(encoded)
+
+def snapshot_text(snapshot):
+    """
+    Searchable text of a snapshot: (alert_text, weather_description), where
+    alert_text joins the One Call alert events, descriptions and senders.
+    """
+    parts = []
+    for alert in snapshot.get('alerts') or []:
+        if isinstance(alert, dict):
+            parts.extend(str(alert[key]) for key in ('event', 'sender_name', 'description') if alert.get(key))
+    return '\n'.join(parts), snapshot.get('description') or ''
+
+def _snapshot_row(snapshot):
+    """(hash, payload, alert_text, weather_description) for the alert_snapshots table."""
+    return encode_snapshot(snapshot) + snapshot_text(snapshot)
+
+_INSERT_SNAPSHOT = '''
+    INSERT OR IGNORE INTO alert_snapshots (hash, payload, alert_text, weather_description)
+    VALUES (?, ?, ?, ?)
+'''
+
+def _backfill_snapshot_text(c):
+    """Extract search text for snapshots stored before it was kept."""
+    c.execute('SELECT hash, payload FROM alert_snapshots WHERE alert_text IS NULL')
+    rows = [snapshot_text(decode_snapshot(payload)) + (snapshot_hash,) for snapshot_hash, payload in c.fetchall()]
+    if rows:
+        c.executemany('UPDATE alert_snapshots SET alert_text = ?, weather_description = ? WHERE hash = ?', rows)
+
+def _init_search_index(c):
+    """
+    Create the FTS5 index over alert messages, alert event text and weather
+    descriptions, kept in step with alert_history by triggers. Builds it from
+    existing history the first time. Returns False if FTS5 is unavailable.
+    """
+    c.execute("SELECT 1 FROM sqlite_master WHERE name = 'alert_search'")
+    exists = c.fetchone() is not None
+    try:
+        c.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS alert_search USING fts5(
+                message, alert_text, weather_description, tokenize = 'porter unicode61'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"Full-text search unavailable, falling back to LIKE: {e}")
+        return False
+    
+    # Rows are keyed by alert_history.id; the text comes from the row and its snapshot
+    indexed_row = '''
+        SELECT new.id, new.message, s.alert_text, s.weather_description
+        FROM (SELECT 1) LEFT JOIN alert_snapshots s ON s.hash = new.snapshot_hash
+    '''
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS alert_search_insert AFTER INSERT ON alert_history BEGIN
+            INSERT INTO alert_search (rowid, message, alert_text, weather_description) {indexed_row};
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS alert_search_delete AFTER DELETE ON alert_history BEGIN
+            DELETE FROM alert_search WHERE rowid = old.id;
+        END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS alert_search_update AFTER UPDATE OF message, snapshot_hash ON alert_history BEGIN
+            DELETE FROM alert_search WHERE rowid = old.id;
+            INSERT INTO alert_search (rowid, message, alert_text, weather_description) {indexed_row};
+        END
+    ''')
+    
+    if not exists:
+        c.execute('''
+            INSERT INTO alert_search (rowid, message, alert_text, weather_description)
+            SELECT h.id, h.message, s.alert_text, s.weather_description
+            FROM alert_history h LEFT JOIN alert_snapshots s ON s.hash = h.snapshot_hash
+        ''')
+    return True
+
+def decode_snapshot(payload):
+    """Decode a payload written by encode_snapshot (None stays None)."""
+    if payload is None:
+        return None
+    return json.loads(zlib.decompress(payload).decode('utf-8'))
+
+def _migrate_history_snapshots(c):
+    """Move JSON blobs embedded in older alert_history rows into the snapshot store."""
+    c.execute('SELECT id, weather_data FROM alert_history WHERE weather_data IS NOT NULL')
+    rows = c.fetchall()
+    if not rows:
+        return
+    
+    snapshot_rows = {}
+    history_rows = []
+    for history_id, weather_json in rows:
+        try:
+            snapshot_row = _snapshot_row(json.loads(weather_json))
+        except (ValueError, AttributeError):
+            snapshot_row = None
+        if snapshot_row:
+            snapshot_rows[snapshot_row[0]] = snapshot_row
+        history_rows.append((snapshot_row[0] if snapshot_row else None, history_id))
+    
+    c.executemany(_INSERT_SNAPSHOT, snapshot_rows.values())
+    c.executemany('UPDATE alert_history SET snapshot_hash = ?, weather_data = NULL WHERE id = ?', history_rows)
+    print(f"Moved {len(history_rows)} alert snapshots into the snapshot store")
+
+def get_alert_snapshot(snapshot_hash):
+    """Fetch and decode one stored weather snapshot by hash."""
     try:
-        conn = sqlite3.connect(ALERTS_DB)
+        conn = connect(ALERTS_DB)
+        try:
+            row = conn.execute('SELECT payload FROM alert_snapshots WHERE hash = ?', (snapshot_hash,)).fetchone()
+            return decode_snapshot(row[0]) if row else None
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Error getting alert snapshot: {e}")
+        return None
+
+def add_alert_rule(city, country, alert_type, threshold_value, condition=">=",
+                   cooldown_minutes=DEFAULT_COOLDOWN_MINUTES, hysteresis=0):
+    """
+    Add a new weather alert rule.
+    After firing, a rule stays quiet until its condition clears by the hysteresis
+    margin or cooldown_minutes pass. The margin is in the units of threshold_value
+    for temperature rules, and a percentage of each built-in threshold for the
+    other types, whose conditions combine fields with different units.
+    """
+    try:
+        conn = connect(ALERTS_DB)
         c = conn.cursor()
-        created_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        created_date = datetime.now().strftime(DATE_FORMAT)
         
         # Insert new alert rule
         c.execute('''
-            INSERT INTO alert_rules (city, country, alert_type, threshold_value, condition, created_date)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (city, country, alert_type.value, threshold_value, condition, created_date))
+            INSERT INTO alert_rules (city, country, alert_type, threshold_value, condition, created_date,
+                                     cooldown_minutes, hysteresis)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (city, country, alert_type.value, threshold_value, condition, created_date,
+              cooldown_minutes, hysteresis))
         
         conn.commit()
+        invalidate_rule_index()
         print(f"Alert rule added for {city}: {alert_type.value} {condition} {threshold_value}")
         return True
         
@@ -91,16 +326,55 @@ def add_alert_rule(city, country, alert_type, threshold_value, condition=">="):
     finally:
         conn.close()
 
+def add_expression_rule(city, country, expression, severity=AlertSeverity.MEDIUM,
+                        cooldown_minutes=DEFAULT_COOLDOWN_MINUTES, hysteresis=0):
+    """
+    Add a custom rule written as an expression over snapshot fields, e.g.
+    "humidity <= 30 and wind_speed >= 20 for 2 readings". Comparisons combine
+    with and/or/not and parentheses; a trailing "for N readings" requires N
+    consecutive matching readings. The expression is validated before saving.
+    hysteresis is a percentage of each comparison's threshold.
+    """
+    try:
+        compile_expression(expression)
+    except ValueError as e:
+        print(f"Invalid alert expression: {e}")
+        return False
+    
+    try:
+        conn = connect(ALERTS_DB)
+        try:
+            c = conn.cursor()
+            created_date = datetime.now().strftime(DATE_FORMAT)
+        
+            c.execute('''
+                INSERT INTO alert_rules (city, country, alert_type, expression, severity, created_date,
+                                         cooldown_minutes, hysteresis)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (city, country, AlertType.CUSTOM.value, expression, severity.value, created_date,
+                  cooldown_minutes, hysteresis))
+        
+            conn.commit()
+            invalidate_rule_index()
+            print(f"Alert rule added for {city}: {expression}")
+            return True
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Error adding alert rule: {e}")
+        return False
+
 def remove_alert_rule(rule_id):
     """Remove an alert rule by ID."""
     try:
-        conn = sqlite3.connect(ALERTS_DB)
+        conn = connect(ALERTS_DB)
         c = conn.cursor()
         
         c.execute('DELETE FROM alert_rules WHERE id = ?', (rule_id,))
         
         if c.rowcount > 0:
             conn.commit()
+            invalidate_rule_index()
             print(f"Alert rule {rule_id} removed successfully")
             return True
         else:
@@ -113,34 +387,29 @@ def remove_alert_rule(rule_id):
     finally:
         conn.close()
 
+# Columns returned for each rule by get_alert_rules
+RULE_COLUMNS = [
+    'id', 'city', 'country', 'alert_type', 'threshold_value', 'condition', 'is_active',
+    'created_date', 'last_triggered', 'cooldown_minutes', 'hysteresis', 'armed',
+    'suppressed_count', 'last_triggered_at', 'expression', 'severity', 'streak', 'streak_observed_at'
+]
+
 def get_alert_rules(city=None):
     """Get all alert rules, optionally filtered by city."""
     try:
-        conn = sqlite3.connect(ALERTS_DB)
+        conn = connect(ALERTS_DB)
         c = conn.cursor()
         
+        query = f"SELECT {', '.join(RULE_COLUMNS)} FROM alert_rules WHERE is_active = 1"
         if city:
-            c.execute('SELECT * FROM alert_rules WHERE city = ? AND is_active = 1', (city,))
+            c.execute(query + ' AND city = ?', (city,))
         else:
-            c.execute('SELECT * FROM alert_rules WHERE is_active = 1')
+            c.execute(query)
         
         rules = c.fetchall()
         
         # Convert to list of dictionaries
-        return [
-            {
-                'id': row[0],
-                'city': row[1],
-                'country': row[2],
-                'alert_type': row[3],
-                'threshold_value': row[4],
-                'condition': row[5],
-                'is_active': row[6],
-                'created_date': row[7],
-                'last_triggered': row[8]
-            }
-            for row in rules
-        ]
+        return [dict(zip(RULE_COLUMNS, row)) for row in rules]
         
     except sqlite3.Error as e:
         print(f"Error getting alert rules: {e}")
@@ -148,227 +417,954 @@ def get_alert_rules(city=None):
     finally:
         conn.close()
 
+def invalidate_rule_index():
+    """Drop the in-memory rule index so the next check reloads rules from the database."""
+    global _rule_index
+    # Don't lose suppressed counts that only exist in memory
+    flush_alert_state()
+    with _rule_index_lock:
+        _rule_index = None
+
+def _valid_expression(rule):
+    """Compile a custom rule's expression up front; a broken one is skipped rather than failing every check."""
+    try:
+        compile_expression(rule['expression'])
+        return True
+    except ValueError as e:
+        print(f"Skipping alert rule {rule['id']}: {e}")
+        return False
+
+def _get_rule_index():
+    """Return the in-memory rule index, loading it from the database on first use."""
+    global _rule_index
+    with _rule_index_lock:
+        if _rule_index is None:
+            index = {}
+            for rule in get_alert_rules():
+                if rule['alert_type'] == AlertType.CUSTOM.value and not _valid_expression(rule):
+                    continue
+                country = rule['country'] or None
+                index.setdefault(rule['city'], {}).setdefault(country, {}).setdefault(rule['alert_type'], []).append(rule)
+            _rule_index = index
+        return _rule_index
+
+def get_indexed_rules(city, country=None, alert_type=None):
+    """
+    Look up active rules for a city from the in-memory index.
+    Rules without a country match any country; if country is None, rules for
+    every country of that city match (as get_alert_rules(city) does).
+    """
+    by_country = _get_rule_index().get(city)
+    if not by_country:
+        return []
+    
+    if country:
+        by_type_list = [by_country.get(country, {}), by_country.get(None, {})]
+    else:
+        by_type_list = list(by_country.values())
+    
+    rules = []
+    for by_type in by_type_list:
+        if alert_type is None:
+            for type_rules in by_type.values():
+                rules.extend(type_rules)
+        else:
+            rules.extend(by_type.get(alert_type, []))
+    return rules
+
+# Severity levels in increasing order; evaluators return an index into this list
+SEVERITY_LEVELS = [AlertSeverity.LOW, AlertSeverity.MEDIUM, AlertSeverity.HIGH, AlertSeverity.CRITICAL]
+LOW, MEDIUM, HIGH, CRITICAL = range(len(SEVERITY_LEVELS))
+
+# Per-type evaluation functions. predicate(get, rule, margin) and severity(get, rule) work both
+# on one snapshot (scalars) and on a batch (NumPy arrays): get(field, default) returns a value
+# or a column, and rule['threshold_value'] / rule['condition'] are scalars or per-row arrays.
+# margin loosens the thresholds so the predicate can tell when a condition has cleared by the
+# rule's hysteresis: in the rule's own units for threshold rules, and as a percentage of each
+# fixed threshold otherwise (so wind, hail and visibility each move by a sensible amount).
+# severity returns a SEVERITY_LEVELS index; message formats one alert.
+AlertEvaluator = namedtuple('AlertEvaluator', ['predicate', 'severity', 'message'])
+
+_CONDITION_OPERATORS = {
+    ">=": operator.ge,
+    "<=": operator.le,
+    ">": operator.gt,
+    "<": operator.lt,
+    "==": operator.eq
+}
+
+def _loosen(threshold, condition, margin):
+    """Move a threshold by margin in the direction that makes the condition easier to meet."""
+    if condition in (">=", ">"):
+        return threshold - margin
+    if condition in ("<=", "<"):
+        return threshold + margin
+    return threshold
+
+def _check_condition(value, threshold, condition, margin=0):
+    """Check if value meets the condition against threshold (element-wise for arrays)."""
+    if isinstance(condition, str):
+        compare = _CONDITION_OPERATORS.get(condition)
+        if compare is None:
+            return False
+        if condition == "==":
+            return abs(value - threshold) <= margin if np.any(margin) else value == threshold
+        return compare(value, _loosen(threshold, condition, margin))
+    
+    # Batch: one condition per element
+    condition = np.asarray(condition)
+    result = np.zeros(np.broadcast(value, threshold, condition, margin).shape, dtype=bool)
+    for symbol, compare in _CONDITION_OPERATORS.items():
+        selected = condition == symbol
+        if selected.any():
+            if symbol == "==":
+                result |= selected & (np.abs(value - threshold) <= margin)
+            else:
+                result |= selected & compare(value, _loosen(threshold, symbol, margin))
+    return result
+
+def _check_fixed(value, threshold, condition, margin=0):
+    """_check_condition against a built-in threshold, with margin as a percentage of that threshold."""
+    return _check_condition(value, threshold, condition, abs(threshold) * margin / 100)
+
+def _temperature_severity_level(temp, threshold):
+    """Severity level from how far temperature is past the threshold (<=5, <=10, <=20, more)."""
+    return np.digitize(np.abs(np.asarray(temp, dtype=float) - threshold), [5, 10, 20], right=True)
+
+def _get_temperature_severity(temp, threshold, is_high_alert):
+    """Determine severity based on how far temperature is from threshold."""
+    return SEVERITY_LEVELS[int(_temperature_severity_level(temp, threshold))]
+
+def _as_flag(value):
+    """Detection flags may arrive as bools, numbers or missing values."""
+    return np.asarray(value, dtype=bool) if value is not None else False
+
+def _severity_level(severity):
+    """SEVERITY_LEVELS index for a stored severity value (MEDIUM if unset)."""
+    try:
+        return SEVERITY_LEVELS.index(AlertSeverity(severity))
+    except ValueError:
+        return MEDIUM
+
+def _fixed(level):
+    """Severity function for alert types with a fixed severity."""
+    return lambda get, rule: level
+
+ALERT_EVALUATORS = {
+    AlertType.TEMPERATURE_HIGH.value: AlertEvaluator(
+        predicate=lambda get, rule, margin=0: _check_condition(get('temperature', 0), rule['threshold_value'], rule['condition'], margin),
+        severity=lambda get, rule: _temperature_severity_level(get('temperature', 0), rule['threshold_value']),
+        message=lambda get, rule: f"High temperature alert: {get('temperature', 0)}°F (threshold: {rule['threshold_value']}°F)"
+    ),
+    AlertType.TEMPERATURE_LOW.value: AlertEvaluator(
+        predicate=lambda get, rule, margin=0: _check_condition(get('temperature', 0), rule['threshold_value'], rule['condition'], margin),
+        severity=lambda get, rule: _temperature_severity_level(get('temperature', 0), rule['threshold_value']),
+        message=lambda get, rule: f"Low temperature alert: {get('temperature', 0)}°F (threshold: {rule['threshold_value']}°F)"
+    ),
+    # Severe thunderstorm
+    AlertType.STORM.value: AlertEvaluator(
+        predicate=lambda get, rule, margin=0: _check_fixed(get('wind_speed', 0), 58, ">=", margin) | _check_fixed(get('hail_size', 0), 1, ">=", margin),
+        severity=_fixed(CRITICAL),
+        message=lambda get, rule: f"Severe thunderstorm alert: Wind speed {get('wind_speed', 0)} mph, hail size {get('hail_size', 0)} inch"
+    ),
+    AlertType.TORNADO.value: AlertEvaluator(
+        predicate=lambda get, rule, margin=0: _as_flag(get('tornado_detected', False)),
+        severity=_fixed(CRITICAL),
+        message=lambda get, rule: "Tornado warning: Tornado detected or imminent"
+    ),
+    AlertType.HURRICANE.value: AlertEvaluator(
+        predicate=lambda get, rule, margin=0: _check_fixed(get('wind_speed', 0), 74, ">=", margin),
+        severity=_fixed(CRITICAL),
+        message=lambda get, rule: f"Hurricane warning: Sustained winds {get('wind_speed', 0)} mph"
+    ),
+    AlertType.TROPICAL_STORM.value: AlertEvaluator(
+        predicate=lambda get, rule, margin=0: _check_fixed(get('wind_speed', 0), 39, ">=", margin) & _check_fixed(get('wind_speed', 0), 73, "<=", margin),
+        severity=_fixed(HIGH),
+        message=lambda get, rule: f"Tropical storm warning: Sustained winds {get('wind_speed', 0)} mph"
+    ),
+    AlertType.BLIZZARD.value: AlertEvaluator(
+        predicate=lambda get, rule, margin=0: _check_fixed(get('visibility', 1), 0.25, "<=", margin) & _check_fixed(get('wind_speed', 0), 35, ">=", margin),
+        severity=_fixed(CRITICAL),
+        message=lambda get, rule: "Blizzard warning: Reduced visibility and high winds"
+    ),
+    AlertType.WINTER_STORM.value: AlertEvaluator(
+        predicate=lambda get, rule, margin=0: _check_fixed(get('snow_accumulation', 0), 5, ">=", margin) | _check_fixed(get('ice_accumulation', 0), 0.25, ">=", margin),
+        severity=_fixed(HIGH),
+        message=lambda get, rule: f"Winter storm warning: Snow {get('snow_accumulation', 0)} inches, ice {get('ice_accumulation', 0)} inches"
+    ),
+    # Excessive heat
+    AlertType.HEAT.value: AlertEvaluator(
+        predicate=lambda get, rule, margin=0: _check_fixed(get('heat_index', 0), 105, ">=", margin),
+        severity=_fixed(CRITICAL),
+        message=lambda get, rule: f"Excessive heat warning: Heat index {get('heat_index', 0)}°F"
+    ),
+    AlertType.FLOOD.value: AlertEvaluator(
+        predicate=lambda get, rule, margin=0: _as_flag(get('flood_detected', False)),
+        severity=_fixed(CRITICAL),
+        message=lambda get, rule: "Flood warning: Flooding detected or imminent"
+    ),
+    AlertType.FIRE_WEATHER.value: AlertEvaluator(
+        predicate=lambda get, rule, margin=0: _check_fixed(get('humidity', 100), 30, "<=", margin) & _check_fixed(get('wind_speed', 0), 20, ">=", margin),
+        severity=_fixed(HIGH),
+        message=lambda get, rule: "Fire weather warning: Low humidity and high winds"
+    ),
+    AlertType.AIR_QUALITY.value: AlertEvaluator(
+        predicate=lambda get, rule, margin=0: _check_fixed(get('aqi', 0), 100, ">=", margin),
+        severity=_fixed(MEDIUM),
+        message=lambda get, rule: f"Air quality alert: AQI {get('aqi', 0)}"
+    ),
+    # User-defined expression (compiled once and cached by text)
+    AlertType.CUSTOM.value: AlertEvaluator(
+        predicate=lambda get, rule, margin=0: compile_expression(rule['expression']).predicate(get, margin),
+        severity=lambda get, rule: _severity_level(rule.get('severity')),
+        message=lambda get, rule: f"Custom alert: {rule['expression']}"
+    )
+}
+
+# Alert types whose predicate depends on more than a rule's threshold/condition,
+# so batches evaluate them rule by rule instead of with per-row threshold arrays
+_PER_RULE_TYPES = {AlertType.CUSTOM.value}
+
+def _snapshot_getter(weather_data):
+    """get(field, default) over a single weather snapshot dict."""
+    def get(name, default):
+        value = weather_data.get(name)
+        return default if value is None else value
+    return get
+
+def get_indexed_rules_all():
+    """All active rules from the in-memory index, for batch evaluation."""
+    rules = []
+    for by_country in _get_rule_index().values():
+        for by_type in by_country.values():
+            for type_rules in by_type.values():
+                rules.extend(type_rules)
+    return rules
+
 def check_weather_alerts(weather_data):
     """Check current weather data against all active alert rules."""
     city = weather_data.get('city')
     if not city:
         return []
     
-    # Get all active rules for this city
-    rules = get_alert_rules(city)
-    triggered_alerts = []
-
+    # Get all active rules for this city from the in-memory index (no database round trip)
+    rules = get_indexed_rules(city, weather_data.get('country'))
+    get = _snapshot_getter(weather_data)
+    now = time.time()
+    observed_at = weather_data.get('observed_at')
+    
+    evaluated = []
     for rule in rules:
-        alert_triggered = False
-        alert_message = ""
-        severity = AlertSeverity.LOW
-
-        # Check temperature alerts
-        if rule['alert_type'] == AlertType.TEMPERATURE_HIGH.value:
-            temp = weather_data.get('temperature', 0)
-            if _check_condition(temp, rule['threshold_value'], rule['condition']):
-                alert_triggered = True
-                severity = _get_temperature_severity(temp, rule['threshold_value'], True)
-                alert_message = f"High temperature alert: {temp}°F (threshold: {rule['threshold_value']}°F)"
-        
-        elif rule['alert_type'] == AlertType.TEMPERATURE_LOW.value:
-            temp = weather_data.get('temperature', 0)
-            if _check_condition(temp, rule['threshold_value'], rule['condition']):
-                alert_triggered = True
-                severity = _get_temperature_severity(temp, rule['threshold_value'], False)
-                alert_message = f"Low temperature alert: {temp}°F (threshold: {rule['threshold_value']}°F)"
-        
-        # Check severe thunderstorm alerts
-        elif rule['alert_type'] == AlertType.STORM.value:
-            wind_speed = weather_data.get('wind_speed', 0)
-            hail_size = weather_data.get('hail_size', 0)
-            if _check_condition(wind_speed, 58, ">=") or _check_condition(hail_size, 1, ">="):
-                alert_triggered = True
-                severity = AlertSeverity.CRITICAL
-                alert_message = f"Severe thunderstorm alert: Wind speed {wind_speed} mph, hail size {hail_size} inch"
-
-        # Check tornado alerts
-        elif rule['alert_type'] == AlertType.TORNADO.value:
-            tornado_detected = weather_data.get('tornado_detected', False)
-            if tornado_detected:
-                alert_triggered = True
-                severity = AlertSeverity.CRITICAL
-                alert_message = "Tornado warning: Tornado detected or imminent"
-
-        # Check hurricane and tropical storm alerts
-        elif rule['alert_type'] == AlertType.HURRICANE.value:
-            wind_speed = weather_data.get('wind_speed', 0)
-            if _check_condition(wind_speed, 74, ">="):
-                alert_triggered = True
-                severity = AlertSeverity.CRITICAL
-                alert_message = f"Hurricane warning: Sustained winds {wind_speed} mph"
-
-        elif rule['alert_type'] == AlertType.TROPICAL_STORM.value:
-            wind_speed = weather_data.get('wind_speed', 0)
-            if _check_condition(wind_speed, 39, ">=") and _check_condition(wind_speed, 73, "<="):
-                alert_triggered = True
-                severity = AlertSeverity.HIGH
-                alert_message = f"Tropical storm warning: Sustained winds {wind_speed} mph"
-
-        # Check winter weather alerts
-        elif rule['alert_type'] == AlertType.BLIZZARD.value:
-            visibility = weather_data.get('visibility', 1)
-            wind_speed = weather_data.get('wind_speed', 0)
-            if _check_condition(visibility, 0.25, "<=") and _check_condition(wind_speed, 35, ">="):
-                alert_triggered = True
-                severity = AlertSeverity.CRITICAL
-                alert_message = "Blizzard warning: Reduced visibility and high winds"
-
-        elif rule['alert_type'] == AlertType.WINTER_STORM.value:
-            snow_accumulation = weather_data.get('snow_accumulation', 0)
-            ice_accumulation = weather_data.get('ice_accumulation', 0)
-            if _check_condition(snow_accumulation, 5, ">=") or _check_condition(ice_accumulation, 0.25, ">="):
-                alert_triggered = True
-                severity = AlertSeverity.HIGH
-                alert_message = f"Winter storm warning: Snow {snow_accumulation} inches, ice {ice_accumulation} inches"
-
-        # Check heat alerts
-        elif rule['alert_type'] == AlertType.HEAT.value:
-            heat_index = weather_data.get('heat_index', 0)
-            if _check_condition(heat_index, 105, ">="):
-                alert_triggered = True
-                severity = AlertSeverity.CRITICAL
-                alert_message = f"Excessive heat warning: Heat index {heat_index}°F"
-
-        # Check flood alerts
-        elif rule['alert_type'] == AlertType.FLOOD.value:
-            flood_detected = weather_data.get('flood_detected', False)
-            if flood_detected:
-                alert_triggered = True
-                severity = AlertSeverity.CRITICAL
-                alert_message = "Flood warning: Flooding detected or imminent"
-
-        # Check fire weather alerts
-        elif rule['alert_type'] == AlertType.FIRE_WEATHER.value:
-            humidity = weather_data.get('humidity', 100)
-            wind_speed = weather_data.get('wind_speed', 0)
-            if _check_condition(humidity, 30, "<=") and _check_condition(wind_speed, 20, ">="):
-                alert_triggered = True
-                severity = AlertSeverity.HIGH
-                alert_message = "Fire weather warning: Low humidity and high winds"
-
-        # Check air quality alerts
-        elif rule['alert_type'] == AlertType.AIR_QUALITY.value:
-            aqi = weather_data.get('aqi', 0)
-            if _check_condition(aqi, 100, ">="):
-                alert_triggered = True
-                severity = AlertSeverity.MEDIUM
-                alert_message = f"Air quality alert: AQI {aqi}"
-
-        # If alert was triggered, record it
-        if alert_triggered:
+        evaluator = ALERT_EVALUATORS.get(rule['alert_type'])
+        if evaluator is not None:
+            evaluated.append((rule, evaluator, bool(evaluator.predicate(get, rule))))
+    
+    def cleared(rule, evaluator, active):
+        # Only a quiet (already fired) rule needs to know whether the condition cleared by its margin
+        return not active and not rule.get('armed', 1) and \
+            not evaluator.predicate(get, rule, rule.get('hysteresis') or 0)
+    
+    triggered_alerts = []
+    
+    def advance():
+        triggered_alerts.clear()
+        triggered = []
+        snapshot = None
+        for rule, evaluator, active in evaluated:
+            outcome = _advance_rule_state(rule, active, cleared(rule, evaluator, active), now, observed_at)
+            if outcome != 'fire':
+                continue
+            
+            # Alert was triggered, record it
             alert_data = {
                 'rule_id': rule['id'],
                 'city': city,
                 'alert_type': rule['alert_type'],
-                'severity': severity,
-                'message': alert_message,
-                'weather_data': weather_data
+                'severity': SEVERITY_LEVELS[int(evaluator.severity(get, rule))],
+                'message': evaluator.message(get, rule),
+                'weather_data': weather_data,
+                'triggered_at': rule['last_triggered_at']
             }
             triggered_alerts.append(alert_data)
             
-            # Save to alert history
-            _save_alert_to_history(alert_data)
-            
-            # Update last triggered time for the rule
-            _update_rule_last_triggered(rule['id'])
+            # Encode the snapshot once, however many rules it trips
+            if snapshot is None:
+                snapshot = _snapshot_row(weather_data)
+            triggered.append((rule, alert_data, snapshot))
+        return triggered
+    
+    # Suppressed repeats and streaks only change memory (flush_alert_state saves them), so
+    # re-rendering a city costs no disk round trip. Firing or re-arming a rule continues from
+    # its stored state, which another process may have moved on, and saves it with the alerts.
+    changing = [rule for rule, evaluator, active in evaluated
+                if _next_rule_state(rule, active, cleared(rule, evaluator, active), now, observed_at)[0]
+                in ('fire', 'rearm')]
+    if changing:
+        _advance_stored_state(changing, advance)
+    else:
+        advance()
+    _publish_alerts(triggered_alerts)
     
     return triggered_alerts
 
-def _check_condition(value, threshold, condition):
-    """Check if value meets the condition against threshold."""
-    if condition == ">=":
-        return value >= threshold
-    elif condition == "<=":
-        return value <= threshold
-    elif condition == ">":
-        return value > threshold
-    elif condition == "<":
-        return value < threshold
-    elif condition == "==":
-        return value == threshold
-    return False
+def _next_rule_state(rule, active, cleared, now, observed_at=None):
+    """
+    Apply cooldown and hysteresis to one evaluation of a rule, without changing it.
 
-def _get_temperature_severity(temp, threshold, is_high_alert):
-    """Determine severity based on how far temperature is from threshold."""
-    diff = abs(temp - threshold)
-    
-    if diff <= 5:
-        return AlertSeverity.LOW
-    elif diff <= 10:
-        return AlertSeverity.MEDIUM
-    elif diff <= 20:
-        return AlertSeverity.HIGH
-    else:
-        return AlertSeverity.CRITICAL
+    A rule fires when its condition is active and it is armed, or its cooldown
+    has expired. Firing disarms it; repeats while disarmed are only counted.
+    It re-arms once the condition has cleared, i.e. is false even with
+    thresholds loosened by the rule's hysteresis margin.
+    
+    Custom rules ending in "for N readings" are only active once N
+    consecutive readings matched. A reading is counted once: when observed_at
+    (the snapshot's observation time) is given, re-checking the same or an
+    older reading leaves the streak alone.
+    
+    Returns (outcome, changes): outcome is 'fire', 'suppress', 'rearm' or
+    None, and changes maps the rule fields to update to their new values
+    ('suppressed' marks one more suppressed repeat).
+    """
+    changes = {}
+    armed = rule.get('armed', 1)
+    armed = 1 if armed is None else armed
+    
+    if rule.get('expression'):
+        readings = compile_expression(rule['expression']).readings
+        counted_at = rule.get('streak_observed_at')
+        if readings > 1 and (observed_at is None or counted_at is None or observed_at > counted_at):
+            streak = (rule.get('streak') or 0) + 1 if active else 0
+            if streak != rule.get('streak') or observed_at is not None:
+                changes['streak'] = streak
+                changes['streak_observed_at'] = observed_at
+        if readings > 1:
+            active = changes.get('streak', rule.get('streak') or 0) >= readings
+    
+    if active:
+        cooldown_minutes = rule.get('cooldown_minutes')
+        if cooldown_minutes is None:
+            cooldown_minutes = DEFAULT_COOLDOWN_MINUTES
+        last_triggered_at = rule.get('last_triggered_at')
+        
+        if armed or last_triggered_at is None or now - last_triggered_at >= cooldown_minutes * 60:
+            changes['armed'] = 0
+            changes['last_triggered_at'] = now
+            changes['last_triggered'] = datetime.fromtimestamp(now).strftime(DATE_FORMAT)
+            return 'fire', changes
+        
+        changes['suppressed'] = 1
+        return 'suppress', changes
+    
+    if cleared and not armed:
+        changes['armed'] = 1
+        return 'rearm', changes
+    return None, changes
+
+def _advance_rule_state(rule, active, cleared, now, observed_at=None):
+    """
+    Move a rule's in-memory state on by one evaluation (see _next_rule_state)
+    and mark it to be saved. Returns 'fire', 'suppress', 'rearm' or None.
+    """
+    with _rule_state_lock:
+        outcome, changes = _next_rule_state(rule, active, cleared, now, observed_at)
+        if not changes:
+            return outcome
+        
+        if changes.pop('suppressed', 0):
+            rule['suppressed_count'] = (rule.get('suppressed_count') or 0) + 1
+            # Saved as an increment, so counts from other processes add up instead of overwriting
+            rule['unsaved_suppressed'] = rule.get('unsaved_suppressed', 0) + 1
+        if outcome in ('fire', 'rearm'):
+            rule['unsaved_arming'] = True
+        rule.update(changes)
+        _mark_rule_dirty(rule)
+        return outcome
+
+def _mark_rule_dirty(rule):
+    """Remember that a rule's in-memory state must be written back."""
+    with _rule_state_lock:
+        _dirty_rules[rule['id']] = rule
+
+def _take_dirty_rules():
+    """(rules, state rows) for every dirty rule, read together so no half-applied update is saved."""
+    with _rule_state_lock:
+        rules = list(_dirty_rules.values())
+        _dirty_rules.clear()
+        rows = _rule_state_rows(rules)
+        for rule in rules:
+            rule['unsaved_suppressed'] = 0
+            rule['unsaved_arming'] = False
+        return rules, rows
+
+def _restore_dirty_rules(rules, rows):
+    """Put back rules taken by _take_dirty_rules whose state could not be written."""
+    counter_rows, arming_rows = rows
+    arming_ids = {row[-1] for row in arming_rows}
+    with _rule_state_lock:
+        for rule, row in zip(rules, counter_rows):
+            rule['unsaved_suppressed'] = rule.get('unsaved_suppressed', 0) + row['suppressed']
+            rule['unsaved_arming'] = rule.get('unsaved_arming') or rule['id'] in arming_ids
+            _mark_rule_dirty(rule)
+
+def _rule_state_rows(rules):
+    """(counter rows for every rule, arming rows for the rules that fired or re-armed)."""
+    counter_rows = [
+        {'id': rule['id'], 'suppressed': rule.get('unsaved_suppressed', 0), 'streak': rule.get('streak') or 0,
+         'observed_at': rule.get('streak_observed_at')}
+        for rule in rules
+    ]
+    arming_rows = [
+        (rule.get('armed', 1), rule.get('last_triggered'), rule.get('last_triggered_at'), rule['id'])
+        for rule in rules if rule.get('unsaved_arming')
+    ]
+    return counter_rows, arming_rows
+
+# Suppressed repeats are added to the stored count and a streak only replaces one counted at an
+# older reading, so a process that never re-read the rule doesn't overwrite another's counting
+_UPDATE_RULE_COUNTERS = '''
+    UPDATE alert_rules
+    SET suppressed_count = COALESCE(suppressed_count, 0) + :suppressed,
+        streak = CASE WHEN :observed_at IS NULL OR streak_observed_at IS NULL
+                           OR :observed_at >= streak_observed_at
+                      THEN :streak ELSE streak END,
+        streak_observed_at = CASE WHEN :observed_at IS NULL OR streak_observed_at IS NULL
+                                       OR :observed_at >= streak_observed_at
+                                  THEN :observed_at ELSE streak_observed_at END
+    WHERE id = :id
+'''
+
+# Firing and re-arming are decided on state loaded in the same transaction, so they can overwrite
+_UPDATE_RULE_ARMING = '''
+    UPDATE alert_rules SET armed = ?, last_triggered = ?, last_triggered_at = ? WHERE id = ?
+'''
+
+# Rule columns that evaluation changes (the rest only change through add/remove)
+_RULE_STATE_COLUMNS = ['armed', 'suppressed_count', 'streak', 'streak_observed_at', 'last_triggered',
+                       'last_triggered_at']
+# Rules read per query, well below SQLite's limit on bound variables
+_RULE_ID_CHUNK_SIZE = 500
+
+def _write_rule_state(conn, rows):
+    """Write state rows from _take_dirty_rules within the caller's transaction."""
+    counter_rows, arming_rows = rows
+    conn.executemany(_UPDATE_RULE_COUNTERS, counter_rows)
+    conn.executemany(_UPDATE_RULE_ARMING, arming_rows)
+
+def _load_rule_state(conn, rules):
+    """
+    Replace the in-memory state of rules with what is stored, keeping what
+    this process has not written yet: suppressions (added to the stored
+    count), a fire or re-arm, and a streak counted at a newer reading.
+    """
+    ids = list({rule['id'] for rule in rules})
+    rows = []
+    for start in range(0, len(ids), _RULE_ID_CHUNK_SIZE):
+        chunk = ids[start:start + _RULE_ID_CHUNK_SIZE]
+        rows.extend(conn.execute(
+            f"SELECT id, {', '.join(_RULE_STATE_COLUMNS)} FROM alert_rules "
+            f"WHERE id IN ({', '.join('?' for _ in chunk)})", chunk
+        ).fetchall())
+    
+    stored = {row[0]: dict(zip(_RULE_STATE_COLUMNS, row[1:])) for row in rows}
+    with _rule_state_lock:
+        for rule in rules:
+            state = stored.get(rule['id'])
+            if state is None:
+                continue
+            state['suppressed_count'] = (state['suppressed_count'] or 0) + rule.get('unsaved_suppressed', 0)
+            if rule.get('unsaved_arming'):
+                for name in ('armed', 'last_triggered', 'last_triggered_at'):
+                    del state[name]
+            counted_at, stored_at = rule.get('streak_observed_at'), state['streak_observed_at']
+            if rule['id'] in _dirty_rules and counted_at is not None and (stored_at is None or counted_at > stored_at):
+                del state['streak'], state['streak_observed_at']
+            rule.update(state)
+
+def _advance_stored_state(rules, advance):
+    """
+    Run advance() as one read-modify-write of the stored state of rules.
 
-def _save_alert_to_history(alert_data):
-    """Save triggered alert to history table."""
+    advance() moves rules on with _advance_rule_state and returns the
+    (rule, alert_data, snapshot) list it triggered. Within a single write
+    transaction the rules' stored state is loaded, advanced, and saved along
+    with the triggered alerts, so processes evaluating the same rules (the
+    GUI and a headless alert monitor) take turns instead of overwriting each
+    other's arming, streaks and trigger times. If the database can't be
+    read, advance() runs on the in-memory state, which flush_alert_state
+    saves later. Returns what advance() triggered.
+    """
     try:
-        conn = sqlite3.connect(ALERTS_DB)
-        c = conn.cursor()
-        triggered_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        conn = connect(ALERTS_DB)
+    except sqlite3.Error as e:
+        print(f"Error opening alert rule state: {e}")
+        return advance()
+    
+    triggered = None
+    taken = None
+    try:
+        retry_on_busy(lambda: conn.execute('BEGIN IMMEDIATE'))
+        try:
+            _load_rule_state(conn, rules)
+            triggered = advance()
+            taken = _take_dirty_rules()
+            _write_triggered_alerts(conn, triggered)
+            _write_rule_state(conn, taken[1])
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    except sqlite3.Error as e:
+        print(f"Error saving triggered alerts: {e}")
+        if taken is not None:
+            _restore_dirty_rules(*taken)
+        if triggered is None:
+            triggered = advance()
+    finally:
+        conn.close()
+    return triggered
+
+def flush_alert_state():
+    """Write pending rule state (e.g. suppressed repeat counts) back to the database."""
+    rules, rows = _take_dirty_rules()
+    if not rules:
+        return
+    
+    def write():
+        conn = connect(ALERTS_DB)
+        try:
+            with immediate_transaction(conn):
+                _write_rule_state(conn, rows)
+        finally:
+            conn.close()
+    
+    try:
+        retry_on_busy(write)
+    except sqlite3.Error as e:
+        print(f"Error saving alert rule state: {e}")
+        _restore_dirty_rules(rules, rows)
+
+def _column(columns, name, default, size):
+    """A full-length column from a batch, with missing columns/values replaced by the default."""
+    values = columns.get(name)
+    if values is None:
+        return np.full(size, default)
+    values = np.asarray(values)
+    if values.dtype.kind == 'f':
+        values = np.where(np.isnan(values), default, values)
+    elif values.dtype.kind == 'O':
+        values = np.array([default if value is None else value for value in values])
+    return values
+
+def _pair_rules_with_rows(columns, rules):
+    """
+    Pair every rule with the rows of its city (and compatible country) without a
+    per-rule loop: rows are grouped by city once, then each rule's group is
+    expanded with np.repeat. Returns (rule_index, row_index) arrays.
+    """
+    cities = np.asarray(columns['city']).astype(str)
+    unique_cities, inverse = np.unique(cities, return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    counts = np.bincount(inverse, minlength=len(unique_cities))
+    starts = np.cumsum(counts) - counts
+    
+    # Locate each rule's city among the batch cities
+    rule_cities = np.array([str(rule['city']) for rule in rules])
+    codes = np.minimum(np.searchsorted(unique_cities, rule_cities), len(unique_cities) - 1)
+    rule_counts = np.where(unique_cities[codes] == rule_cities, counts[codes], 0)
+    
+    # Expand each rule into one pair per row of its city
+    rule_index = np.repeat(np.arange(len(rules)), rule_counts)
+    offsets = np.arange(len(rule_index)) - np.repeat(np.cumsum(rule_counts) - rule_counts, rule_counts)
+    row_index = order[np.repeat(starts[codes], rule_counts) + offsets]
+    
+    # Rules with a country only match rows from that country (or rows without one)
+    if 'country' in columns:
+        row_countries = np.array(['' if country is None else str(country) for country in columns['country']])[row_index]
+        rule_countries = np.array([rule['country'] or '' for rule in rules])[rule_index]
+        keep = (rule_countries == '') | (row_countries == '') | (row_countries == rule_countries)
+        rule_index = rule_index[keep]
+        row_index = row_index[keep]
+    
+    return rule_index, row_index
+
+def _needs_every_reading(rule):
+    """True for custom rules that count consecutive matching readings."""
+    return bool(rule.get('expression')) and compile_expression(rule['expression']).readings > 1
+
+def evaluate_rules_batch(columns, rules=None, track_state=False):
+    """
+    Evaluate alert rules against a columnar block of snapshots.
+
+    columns maps field names (city, country, temperature, wind_speed, humidity,
+    visibility, ...) to equal-length sequences or NumPy arrays. Every rule is
+    paired with the rows of its city, and each alert type is then evaluated for
+    all of its (rule, row) pairs in one vectorized pass (custom expression rules
+    in one pass per rule).
+
+    Returns (rules, hits) where hits holds equal-length arrays: 'rule' (index
+    into rules), 'row' (index into columns) and 'level' (SEVERITY_LEVELS index).
+    With track_state, hits also holds 'idle_rule'/'idle_row'/'idle_cleared':
+    non-matching pairs the rule state machine needs to see - for rules that are
+    quiet or fire in this batch, or count consecutive readings - and whether
+    each one cleared by the rule's hysteresis.
+    """
+    if rules is None:
+        rules = get_indexed_rules_all()
+    size = len(columns['city'])
+    empty = {key: np.array([], dtype=int) for key in ('rule', 'row', 'level', 'idle_rule', 'idle_row')}
+    empty['idle_cleared'] = np.array([], dtype=bool)
+    if not rules or size == 0:
+        return rules, empty
+    
+    pair_rules, pair_rows = _pair_rules_with_rows(columns, rules)
+    thresholds = np.array([rule['threshold_value'] if rule['threshold_value'] is not None else np.nan
+                           for rule in rules], dtype=float)
+    conditions = np.array([rule['condition'] or '' for rule in rules], dtype=object)
+    alert_types = np.array([rule['alert_type'] for rule in rules])
+    pair_types = alert_types[pair_rules]
+    if track_state:
+        margins = np.array([rule.get('hysteresis') or 0 for rule in rules], dtype=float)
+    
+    hit_rules, hit_rows, hit_levels = [], [], []
+    idle_rules, idle_rows, idle_cleared = [], [], []
+    
+    def evaluate(evaluator, rule_index, row_index, rule_arg, margin):
+        """Evaluate one group of pairs and collect its hits (and idle pairs)."""
+        gathered = {}
         
-        c.execute('''
-            INSERT INTO alert_history (city, alert_type, severity, message, triggered_date, weather_data)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
+        def get(name, default):
+            key = (name, default)
+            if key not in gathered:
+                gathered[key] = _column(columns, name, default, size)[row_index]
+            return gathered[key]
+        
+        mask = np.broadcast_to(np.asarray(evaluator.predicate(get, rule_arg), dtype=bool), row_index.shape)
+        levels = np.broadcast_to(np.asarray(evaluator.severity(get, rule_arg)), row_index.shape)
+        hit_rules.append(rule_index[mask])
+        hit_rows.append(row_index[mask])
+        hit_levels.append(levels[mask])
+        
+        if track_state:
+            near = np.broadcast_to(np.asarray(evaluator.predicate(get, rule_arg, margin), dtype=bool), row_index.shape)
+            idle_rules.append(rule_index[~mask])
+            idle_rows.append(row_index[~mask])
+            idle_cleared.append(~near[~mask])
+    
+    for alert_type in np.unique(pair_types):
+        evaluator = ALERT_EVALUATORS.get(alert_type)
+        if evaluator is None:
+            continue
+        
+        selected = pair_types == alert_type
+        rule_index = pair_rules[selected]
+        row_index = pair_rows[selected]
+        
+        if alert_type in _PER_RULE_TYPES:
+            # Each rule has its own predicate; still vectorized over that rule's rows
+            for position in np.unique(rule_index):
+                own = rule_index == position
+                margin = margins[position] if track_state else 0
+                evaluate(evaluator, rule_index[own], row_index[own], rules[position], margin)
+        else:
+            rule_arrays = {'threshold_value': thresholds[rule_index], 'condition': conditions[rule_index]}
+            evaluate(evaluator, rule_index, row_index, rule_arrays, margins[rule_index] if track_state else 0)
+    
+    if not hit_rules:
+        return rules, empty
+    hits = {
+        'rule': np.concatenate(hit_rules),
+        'row': np.concatenate(hit_rows),
+        'level': np.concatenate(hit_levels).astype(int)
+    }
+    
+    if track_state:
+        idle_rule_index = np.concatenate(idle_rules)
+        # Idle rows only matter for rules that are quiet now, fire somewhere in this batch,
+        # or need an unbroken run of matching readings
+        relevant = np.array([rule.get('armed', 1) == 0 or _needs_every_reading(rule) for rule in rules], dtype=bool)
+        relevant[hits['rule']] = True
+        keep = relevant[idle_rule_index]
+        hits['idle_rule'] = idle_rule_index[keep]
+        hits['idle_row'] = np.concatenate(idle_rows)[keep]
+        hits['idle_cleared'] = np.concatenate(idle_cleared)[keep]
+    return rules, hits
+
+def _row_snapshot(columns, row):
+    """Rebuild one snapshot dict from a row of a columnar batch."""
+    snapshot = {}
+    for name, values in columns.items():
+        value = values[row]
+        snapshot[name] = value.item() if isinstance(value, np.generic) else value
+    return snapshot
+
+def snapshots_to_columns(snapshots):
+    """
+    Turn a list of snapshot dicts into the columnar form batch evaluation takes.
+    Nested values (alerts, wind, ...) are left out; missing values become None.
+    """
+    names = []
+    for snapshot in snapshots:
+        for name, value in snapshot.items():
+            if name not in names and not isinstance(value, (dict, list, tuple)):
+                names.append(name)
+    return {name: [snapshot.get(name) for snapshot in snapshots] for name in names}
+
+def check_weather_alerts_batch(columns):
+    """
+    Check a columnar block of snapshots (e.g. after a bulk refresh) against all
+    active rules in one vectorized pass, recording triggered alerts like
+    check_weather_alerts does. Returns the triggered alerts, each with its 'row'.
+    Rows with an 'observed_at' (epoch seconds) are judged at that time, so a
+    backfill of history sees cooldowns expire between readings.
+    """
+    rules, hits = evaluate_rules_batch(columns, track_state=True)
+    now = time.time()
+    observed = _column(columns, 'observed_at', np.nan, len(columns['city'])).astype(float)
+    row_times = np.where(np.isnan(observed), now, observed)
+    triggered_alerts = []
+    
+    # Walk hits and clears in time (then row) order so cooldown/hysteresis see readings in sequence
+    events = [(row, 0, rule_position, level) for rule_position, row, level in
+              zip(hits['rule'].tolist(), hits['row'].tolist(), hits['level'].tolist())]
+    events += [(row, 1, rule_position, cleared) for rule_position, row, cleared in
+               zip(hits['idle_rule'].tolist(), hits['idle_row'].tolist(), hits['idle_cleared'].tolist())]
+    events.sort(key=lambda event: (row_times[event[0]], event[:3]))
+    if not events:
+        return []
+    
+    def advance():
+        triggered_alerts.clear()
+        triggered = []
+        # Each row's snapshot is rebuilt and encoded once, however many rules it trips
+        snapshots = {}
+        for row, kind, rule_position, detail in events:
+            rule = rules[rule_position]
+            # detail is the severity level of a hit, or whether an idle pair cleared
+            outcome = _advance_rule_state(rule, kind == 0, kind == 1 and detail, float(row_times[row]),
+                                          None if np.isnan(observed[row]) else float(observed[row]))
+            if outcome != 'fire':
+                continue
+            
+            if row not in snapshots:
+                weather_data = _row_snapshot(columns, row)
+                snapshots[row] = (weather_data, _snapshot_row(weather_data))
+            weather_data, snapshot = snapshots[row]
+            
+            alert_data = {
+                'rule_id': rule['id'],
+                'city': weather_data.get('city'),
+                'alert_type': rule['alert_type'],
+                'severity': SEVERITY_LEVELS[detail],
+                'message': ALERT_EVALUATORS[rule['alert_type']].message(_snapshot_getter(weather_data), rule),
+                'weather_data': weather_data,
+                'row': int(row),
+                'triggered_at': rule['last_triggered_at']
+            }
+            triggered_alerts.append(alert_data)
+            triggered.append((rule, alert_data, snapshot))
+        return triggered
+    
+    # One read-modify-write transaction for the whole batch, starting from the stored state
+    # another process may have moved on since the index was loaded
+    _advance_stored_state([rules[position] for position in sorted({event[2] for event in events})], advance)
+    _publish_alerts(triggered_alerts)
+    
+    return triggered_alerts
+
+def add_alert_listener(callback):
+    """
+    Call callback(alerts) with every list of newly triggered alerts, on the
+    evaluating thread. Listeners must return quickly (hand off, don't deliver).
+    """
+    if callback not in _alert_listeners:
+        _alert_listeners.append(callback)
+
+def remove_alert_listener(callback):
+    if callback in _alert_listeners:
+        _alert_listeners.remove(callback)
+
+def _publish_alerts(alerts):
+    if not alerts:
+        return
+    for callback in list(_alert_listeners):
+        try:
+            callback(alerts)
+        except Exception as e:
+            print(f"Error in alert listener: {e}")
+
+def _write_triggered_alerts(conn, triggered):
+    """
+    Insert everything one evaluation triggered within the caller's transaction.
+    triggered is a list of (rule, alert_data, snapshot) where snapshot is the
+    alert_snapshots row from _snapshot_row, encoded once per evaluation and
+    shared by its alerts.
+    """
+    history_rows = [
+        (
             alert_data['city'],
             alert_data['alert_type'],
             alert_data['severity'].value,
             alert_data['message'],
-            triggered_date,
-            json.dumps(alert_data['weather_data'])
-        ))
-        
-        conn.commit()
-        
-    except sqlite3.Error as e:
-        print(f"Error saving alert to history: {e}")
-    finally:
-        conn.close()
+            # A batch can fire one rule more than once, so each alert keeps its own time
+            datetime.fromtimestamp(alert_data['triggered_at']).strftime(DATE_FORMAT),
+            int(alert_data['triggered_at']),
+            snapshot[0]
+        )
+        for rule, alert_data, snapshot in triggered
+    ]
+    # Identical snapshots are stored once
+    snapshot_rows = list({snapshot[0]: snapshot for _, _, snapshot in triggered}.values())
+    conn.executemany(_INSERT_SNAPSHOT, snapshot_rows)
+    conn.executemany('''
+        INSERT INTO alert_history (city, alert_type, severity, message, triggered_date,
+                                   triggered_at, snapshot_hash)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', history_rows)
+
+def get_alert_history(city=None, limit=50, include_weather=False):
+    """
+    Get the most recent alert history, optionally filtered by city.
+    Rows carry the snapshot_hash of their weather snapshot; the snapshot itself is
+    only fetched and decoded when include_weather is True (or via get_alert_snapshot).
+    """
+    history, _ = query_alert_history(city=city, limit=limit, include_weather=include_weather)
+    return history
 
-def _update_rule_last_triggered(rule_id):
-    """Update the last triggered time for an alert rule."""
+def query_alert_history(city=None, alert_type=None, severity=None, start=None, end=None,
+                        limit=50, cursor=None, include_weather=False):
+    """
+    Page through alert history, newest first.
+
+    Filters are optional: city, alert_type (AlertType or its value), severity
+    (AlertSeverity or its value) and a start/end time range (datetime or epoch
+    seconds, inclusive). Pass the returned cursor back to get the next page; it
+    is None after the last page. Pages are found by seeking an index on
+    (triggered_at, id), so each costs the same however far back it is.
+
+    Returns (history, next_cursor).
+    """
+    conditions = []
+    params = []
+    if city:
+        conditions.append('h.city = ?')
+        params.append(city)
+    if alert_type:
+        conditions.append('h.alert_type = ?')
+        params.append(alert_type.value if isinstance(alert_type, AlertType) else alert_type)
+    if severity:
+        conditions.append('h.severity = ?')
+        params.append(severity.value if isinstance(severity, AlertSeverity) else severity)
+    if start is not None:
+        conditions.append('h.triggered_at >= ?')
+        params.append(int(start.timestamp()) if isinstance(start, datetime) else int(start))
+    if end is not None:
+        conditions.append('h.triggered_at <= ?')
+        params.append(int(end.timestamp()) if isinstance(end, datetime) else int(end))
+    if cursor is not None:
+        conditions.append('(h.triggered_at, h.id) < (?, ?)')
+        params.extend(cursor)
+    
+    columns = 'h.id, h.city, h.alert_type, h.severity, h.message, h.triggered_date, h.triggered_at, h.snapshot_hash'
+    join = ''
+    if include_weather:
+        columns += ', s.payload'
+        join = 'LEFT JOIN alert_snapshots s ON s.hash = h.snapshot_hash'
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    
     try:
-        conn = sqlite3.connect(ALERTS_DB)
-        c = conn.cursor()
-        last_triggered = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        conn = connect(ALERTS_DB)
+        try:
+            c = conn.cursor()
+            c.execute(f'''
+                SELECT {columns} FROM alert_history h
+                {join}
+                {where}
+                ORDER BY h.triggered_at DESC, h.id DESC
+                LIMIT ?
+            ''', params + [limit])
         
-        c.execute('UPDATE alert_rules SET last_triggered = ? WHERE id = ?', (last_triggered, rule_id))
-        conn.commit()
+            history = []
+            for row in c.fetchall():
+                entry = {
+                    'id': row[0],
+                    'city': row[1],
+                    'alert_type': row[2],
+                    'severity': row[3],
+                    'message': row[4],
+                    'triggered_date': row[5],
+                    'triggered_at': row[6],
+                    'snapshot_hash': row[7]
+                }
+                if include_weather:
+                    entry['weather_data'] = decode_snapshot(row[8])
+                history.append(entry)
         
+            next_cursor = None
+            if len(history) == limit:
+                next_cursor = (history[-1]['triggered_at'], history[-1]['id'])
+            return history, next_cursor
+        finally:
+            conn.close()
     except sqlite3.Error as e:
-        print(f"Error updating rule last triggered: {e}")
-    finally:
-        conn.close()
+        print(f"Error getting alert history: {e}")
+        return [], None
+
+def _fts_query(text):
+    """Turn free text into an FTS5 query matching rows that contain every word (as literal terms)."""
+    terms = [term.replace('"', '""') for term in text.split()]
+    return ' '.join(f'"{term}"' for term in terms)
 
-def get_alert_history(city=None, limit=50):
-    """Get alert history, optionally filtered by city."""
+def search_alert_history(query, city=None, alert_type=None, limit=20, newest_first=False):
+    """
+    Keyword search over alert messages, alert event/sender/description text and
+    weather descriptions, best matches first. Every word must match (stemmed,
+    so "flooding" finds "flood"). Each result is a history row (as from
+    query_alert_history) plus a 'snippet' with matches in [brackets].
+    Ranking scores every match, so for very common words newest_first (which
+    streams matches from the index in id order) is much faster.
+    Falls back to a LIKE scan if SQLite lacks FTS5.
+    """
+    if not query or not query.strip():
+        return []
+    
+    filters = ''
+    params = []
+    if city:
+        filters += ' AND h.city = ?'
+        params.append(city)
+    if alert_type:
+        filters += ' AND h.alert_type = ?'
+        params.append(alert_type.value if isinstance(alert_type, AlertType) else alert_type)
+    columns = 'h.id, h.city, h.alert_type, h.severity, h.message, h.triggered_date, h.triggered_at, h.snapshot_hash'
+    
     try:
-        conn = sqlite3.connect(ALERTS_DB)
-        c = conn.cursor()
-        
-        if city:
-            c.execute('''
-                SELECT * FROM alert_history 
-                WHERE city = ? 
-                ORDER BY triggered_date DESC 
+        conn = connect(ALERTS_DB)
+        try:
+            rows = conn.execute(f'''
+                SELECT {columns}, snippet(alert_search, -1, '[', ']', '...', 12)
+                FROM alert_search JOIN alert_history h ON h.id = alert_search.rowid
+                WHERE alert_search MATCH ?{filters}
+                ORDER BY {'alert_search.rowid DESC' if newest_first else 'rank'}
                 LIMIT ?
-            ''', (city, limit))
-        else:
-            c.execute('''
-                SELECT * FROM alert_history 
-                ORDER BY triggered_date DESC 
+            ''', [_fts_query(query)] + params + [limit]).fetchall()
+        except sqlite3.OperationalError as e:
+            if 'alert_search' not in str(e) and 'fts5' not in str(e):
+                raise
+            # No FTS5: every word must appear in one of the text columns
+            conditions = []
+            like_params = []
+            for term in query.split():
+                conditions.append('(h.message LIKE ? OR s.alert_text LIKE ? OR s.weather_description LIKE ?)')
+                like_params.extend([f'%{term}%'] * 3)
+            rows = conn.execute(f'''
+                SELECT {columns}, h.message
+                FROM alert_history h LEFT JOIN alert_snapshots s ON s.hash = h.snapshot_hash
+                WHERE {' AND '.join(conditions)}{filters}
+                ORDER BY h.triggered_at DESC, h.id DESC
                 LIMIT ?
-            ''', (limit,))
-        
-        history = c.fetchall()
+            ''', like_params + params + [limit]).fetchall()
+        finally:
+            conn.close()
         
         return [
             {
@@ -378,43 +1374,70 @@ def get_alert_history(city=None, limit=50):
                 'severity': row[3],
                 'message': row[4],
                 'triggered_date': row[5],
-                'weather_data': json.loads(row[6]) if row[6] else None
+                'triggered_at': row[6],
+                'snapshot_hash': row[7],
+                'snippet': row[8]
             }
-            for row in history
+            for row in rows
         ]
-        
     except sqlite3.Error as e:
-        print(f"Error getting alert history: {e}")
+        print(f"Error searching alert history: {e}")
         return []
-    finally:
-        conn.close()
 
-def clear_old_alerts(days_old=30):
-    """Clear alert history older than specified days."""
+def _delete_chunk(query, params):
+    """Run one bounded DELETE in its own write transaction and return the rows removed."""
+    def delete():
+        conn = connect(ALERTS_DB)
+        try:
+            with immediate_transaction(conn):
+                return conn.execute(query, params).rowcount
+        finally:
+            conn.close()
+    
+    return retry_on_busy(delete)
+
+def clear_old_alerts(days_old=30, chunk_size=RETENTION_CHUNK_SIZE):
+    """
+    Clear alert history older than specified days.
+    Rows are removed oldest first in chunks of chunk_size, each in its own short
+    transaction, so other writers are never blocked for the whole purge.
+    """
+    cutoff = int((datetime.now() - timedelta(days=days_old)).timestamp())
+    deleted_count = 0
+    
     try:
-        conn = sqlite3.connect(ALERTS_DB)
-        c = conn.cursor()
-        cutoff_date = (datetime.now() - timedelta(days=days_old)).strftime('%Y-%m-%d %H:%M:%S')
-        
-        c.execute('DELETE FROM alert_history WHERE triggered_date < ?', (cutoff_date,))
-        deleted_count = c.rowcount
-        conn.commit()
+        while True:
+            deleted = _delete_chunk('''
+                DELETE FROM alert_history WHERE id IN (
+                    SELECT id FROM alert_history WHERE triggered_at < ?
+                    ORDER BY triggered_at LIMIT ?
+                )
+            ''', (cutoff, chunk_size))
+            deleted_count += deleted
+            if deleted < chunk_size:
+                break
         
-        print(f"Cleared {deleted_count} old alert records")
-        return deleted_count
+        # Drop snapshots no remaining alert refers to
+        while _delete_chunk('''
+            DELETE FROM alert_snapshots WHERE hash IN (
+                SELECT hash FROM alert_snapshots s
+                WHERE NOT EXISTS (SELECT 1 FROM alert_history h WHERE h.snapshot_hash = s.hash)
+                LIMIT ?
+            )
+        ''', (chunk_size,)) == chunk_size:
+            pass
         
     except sqlite3.Error as e:
         print(f"Error clearing old alerts: {e}")
-        return 0
-    finally:
-        conn.close()
+    
+    print(f"Cleared {deleted_count} old alert records")
+    return deleted_count
 
-# Initialize the alerts database when this module is imported
-init_alerts_db()
 
 # Example usage and testing
 if __name__ == "__main__":
     print("Testing weather alerts...")
+    init_alerts_db()
     
     # Add some example alert rules
     add_alert_rule("New York", "US", AlertType.TEMPERATURE_HIGH, 90.0, ">=")
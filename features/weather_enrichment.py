@@ -0,0 +1,157 @@
+import re
+
+import numpy as np
+
+# Millimetres per inch (One Call reports precipitation in mm, even with imperial units)
+MM_PER_INCH = 25.4
+# Inches of snow per inch of liquid water (the usual 10:1 rule of thumb)
+SNOW_RATIO = 10
+# Rain at or below this temperature (°F) is counted as freezing rain / ice
+FREEZING_F = 32
+
+# Derived metric -> snapshot fields it is computed from (batch callers fetch these)
+DERIVED_INPUTS = {
+    'heat_index': ['temperature', 'humidity'],
+    'wind_chill': ['temperature', 'wind_speed'],
+}
+
+# "hail up to 1.75 inches", "1 inch hail", "quarter size hail" ...
+_HAIL_INCHES = re.compile(r'(\d+(?:\.\d+)?)\s*(?:inch|inches|in\.?)\s+hail|hail[^.]*?(\d+(?:\.\d+)?)\s*(?:inch|inches|in\b)',
+                          re.IGNORECASE)
+# Common hail size names (NWS) in inches
+_HAIL_NAMES = {'pea': 0.25, 'penny': 0.75, 'quarter': 1.0, 'ping pong': 1.5, 'golf ball': 1.75,
+               'tennis ball': 2.5, 'baseball': 2.75, 'softball': 4.0}
+
+def heat_index(temperature, humidity):
+    """
+    NWS heat index (°F) from temperature (°F) and relative humidity (%).
+    Uses Steadman's simple formula below ~80°F and the Rothfusz regression,
+    with the NWS low/high humidity adjustments, above it. Works on scalars
+    and NumPy arrays alike.
+    """
+    t = np.asarray(temperature, dtype=float)
+    rh = np.asarray(humidity, dtype=float)
+
+    simple = 0.5 * (t + 61.0 + (t - 68.0) * 1.2 + rh * 0.094)
+    regression = (-42.379 + 2.04901523 * t + 10.14333127 * rh - 0.22475541 * t * rh
+                  - 6.83783e-3 * t * t - 5.481717e-2 * rh * rh + 1.22874e-3 * t * t * rh
+                  + 8.5282e-4 * t * rh * rh - 1.99e-6 * t * t * rh * rh)
+
+    dry = (rh < 13) & (t >= 80) & (t <= 112)
+    regression = regression - np.where(dry, (13 - rh) / 4 * np.sqrt(np.clip(17 - np.abs(t - 95), 0, None) / 17), 0)
+    humid = (rh > 85) & (t >= 80) & (t <= 87)
+    regression = regression + np.where(humid, (rh - 85) / 10 * (87 - t) / 5, 0)
+
+    # The regression only applies once the simple estimate (averaged with T) reaches 80°F
+    result = np.where((simple + t) / 2 >= 80, regression, simple)
+    return result.item() if result.ndim == 0 else result
+
+def wind_chill(temperature, wind_speed):
+    """
+    NWS wind chill (°F) from temperature (°F) and wind speed (mph). Defined only
+    at or below 50°F with wind of at least 3 mph; elsewhere it is the temperature.
+    """
+    t = np.asarray(temperature, dtype=float)
+    v = np.asarray(wind_speed, dtype=float)
+    factor = np.power(np.clip(v, 0, None), 0.16)
+    chill = 35.74 + 0.6215 * t - 35.75 * factor + 0.4275 * t * factor
+    result = np.where((t <= 50) & (v >= 3), chill, t)
+    return result.item() if result.ndim == 0 else result
+
+def accumulations(hourly_temperature, hourly_rain, hourly_snow):
+    """
+    Expected snow and ice accumulation (inches) from hourly forecasts.
+    Inputs are mm per hour (temperature in °F) along the last axis, so one
+    forecast is a 1-D array and a batch of forecasts is 2-D. Snow converts at
+    SNOW_RATIO; rain counts as ice when it falls at or below freezing.
+    Returns (snow, ice).
+    """
+    temperature = np.asarray(hourly_temperature, dtype=float)
+    rain = np.nan_to_num(np.asarray(hourly_rain, dtype=float))
+    snow = np.nan_to_num(np.asarray(hourly_snow, dtype=float))
+
+    snow_inches = snow.sum(axis=-1) / MM_PER_INCH * SNOW_RATIO
+    ice_inches = np.where(temperature <= FREEZING_F, rain, 0).sum(axis=-1) / MM_PER_INCH
+    if snow_inches.ndim == 0:
+        return round(snow_inches.item(), 2), round(ice_inches.item(), 2)
+    return np.round(snow_inches, 2), np.round(ice_inches, 2)
+
+def _hail_size(text):
+    """Largest hail size (inches) mentioned in alert text, or 0."""
+    sizes = [float(inches) for match in _HAIL_INCHES.findall(text) for inches in match if inches]
+    lowered = text.lower()
+    sizes += [size for name, size in _HAIL_NAMES.items() if f'{name} size hail' in lowered]
+    return max(sizes, default=0)
+
+def alert_flags(alerts):
+    """
+    Flags and hail size from One Call alert events:
+    {'tornado_detected', 'flood_detected', 'hail_size'}.
+    """
+    flags = {'tornado_detected': False, 'flood_detected': False, 'hail_size': 0}
+    for alert in alerts or []:
+        event = (alert.get('event') or '').lower()
+        text = f"{alert.get('event') or ''}. {alert.get('description') or ''}"
+        if 'tornado' in event:
+            flags['tornado_detected'] = True
+        if 'flood' in event:
+            flags['flood_detected'] = True
+        flags['hail_size'] = max(flags['hail_size'], _hail_size(text))
+    return flags
+
+def enrich_snapshot(data):
+    """
+    Add derived metrics to one fetched snapshot (in place, and returned):
+    heat_index, wind_chill, snow_accumulation and ice_accumulation over the
+    hourly forecast, and hazard flags from the alert events. Values already
+    present (e.g. from another source) are kept. The hourly list itself is
+    dropped once summarized, so saved views and alert snapshots stay small.
+    """
+    derived = {}
+    if data.get('temperature') is not None and data.get('humidity') is not None:
+        derived['heat_index'] = round(heat_index(data['temperature'], data['humidity']))
+    if data.get('temperature') is not None and data.get('wind_speed') is not None:
+        derived['wind_chill'] = round(wind_chill(data['temperature'], data['wind_speed']))
+
+    hourly = data.pop('hourly', None) or []
+    if hourly:
+        snow, ice = accumulations(
+            [np.nan if hour.get('temp') is None else hour['temp'] for hour in hourly],
+            [hour.get('rain') or 0 for hour in hourly],
+            [hour.get('snow') or 0 for hour in hourly]
+        )
+        derived['snow_accumulation'] = snow
+        derived['ice_accumulation'] = ice
+
+    derived.update(alert_flags(data.get('alerts')))
+
+    for name, value in derived.items():
+        if data.get(name) is None:
+            data[name] = value
+    return data
+
+def enrich_columns(columns):
+    """
+    Batch counterpart of enrich_snapshot for columnar history (dicts of arrays,
+    as evaluate_rules_batch takes): adds heat_index and wind_chill columns
+    where their inputs are present. Returns the same dict.
+
+    Only these two can be derived from stored history: snow/ice accumulation
+    and the hazard flags need the hourly forecast and alert events, which the
+    weather table doesn't keep. Backtested rules on those fields never match;
+    snapshots enriched with enrich_snapshot (e.g. by the alert monitor) have them.
+    """
+    for name, inputs in DERIVED_INPUTS.items():
+        if name in columns or not all(field in columns for field in inputs):
+            continue
+        columns[name] = _DERIVED_FUNCTIONS[name](*(_float_column(columns[field]) for field in inputs))
+    return columns
+
+def _float_column(values):
+    """A column as floats, with missing values (None) as NaN."""
+    values = np.asarray(values)
+    if values.dtype.kind == 'O':
+        values = np.array([np.nan if value is None else value for value in values], dtype=float)
+    return values.astype(float)
+
+_DERIVED_FUNCTIONS = {'heat_index': heat_index, 'wind_chill': wind_chill}
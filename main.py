@@ -1,9 +1,10 @@
-import tkinter as tk
-from tkinter import messagebox
-from src.gui import WeatherApp
-
 # Main entry point for the weather app
 def main():
+    # Imported here, not at module level: CSV parser worker processes are spawned and
+    # re-import this module, and they must not load the whole GUI to do so
+    import tkinter as tk
+    from src.gui import WeatherApp
+    
     # Create the main Tkinter window
     root = tk.Tk()
     root.title("Weather App")
@@ -17,4 +18,4 @@ def main():
     root.mainloop()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
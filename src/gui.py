@@ -13,7 +13,9 @@ import sys
 import os
 from dotenv import load_dotenv
 import requests
-from datetime import datetime, timedelta
+import queue
+import threading
+from datetime import date, datetime, timedelta
 
 # Load environment variables from .env file
 load_dotenv()
@@ -25,10 +27,16 @@ if not API_KEY:
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from src.weather_api import fetch_weather_data, fetch_5day_forecast
-from data.storage import load_weather_data, save_weather_data
+from data.storage import (
+    init_db, load_weather_data, save_weather_data, load_last_view, save_last_view, start_spool_drainer
+)
 from src.utils import format_wind_info, format_humidity
-from features.favorite_cities import add_favorite_city, get_favorite_cities, is_favorite_city, remove_favorite_city
-from features.weather_alert import check_weather_alerts, add_alert_rule, init_alerts_db
+from features.favorite_cities import (
+    add_favorite_city, get_favorite_cities, init_favorites_db, is_favorite_city, remove_favorite_city
+)
+from features.weather_alert import check_weather_alerts, add_alert_rule, init_alerts_db, flush_alert_state
+from features.weather_enrichment import enrich_snapshot
+from features.notifications import start_notifications, stop_notifications
 from features.team_feature import CitySuggestionApp
 
 
@@ -38,6 +46,9 @@ USE_MOCK = False
 if USE_MOCK:
     from data.mock_weather import get_mock_weather_data
 
+# How often (ms) the main thread checks for a finished background refresh
+REFRESH_POLL_MS = 200
+
 class WeatherApp:
     def __init__(self, root):
         self.root = root
@@ -61,12 +72,30 @@ class WeatherApp:
         self.root.grid_columnconfigure(1, weight=2)  # Main content
         self.root.grid_columnconfigure(2, weight=1)  # Right frame
 
-        # Initialize the alerts database
+        # Create or migrate the databases (done here rather than on import, so processes
+        # that only import these modules, such as CSV parser workers, don't touch them)
+        init_db()
+        init_favorites_db()
         init_alerts_db()
+
+        # Replay any writes that were spooled while the database was unavailable
+        start_spool_drainer()
+        
+        # Deliver triggered alerts (desktop, log file, ...) off the main thread
+        start_notifications()
+        
+        # Save alert rule state (suppressed counts, arming) that only lives in memory on exit
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # Initialize variables
         self.city_var = tk.StringVar()
         self.current_city_data = None
+        self.current_alerts = []
+        # True while the display shows a cached snapshot rather than fresh API data
+        self.is_stale = False
+        self.stale_since = None
+        # Bumped on every user search so late background refreshes don't overwrite newer views
+        self.view_generation = 0
 
         # UPDATED - Larger, better fonts
         self.large_font = font.Font(family="Helvetica", size=72, weight="bold")  # Temperature
@@ -166,6 +195,15 @@ class WeatherApp:
         self.create_forecast_section()
         self.right_frame_utilities()  
 
+        # Paint the last view immediately (works offline), then refresh it in the background
+        self.show_last_weather()
+
+    def on_close(self):
+        """Write pending alert state and deliver queued notifications before the window closes."""
+        flush_alert_state()
+        stop_notifications()
+        self.root.destroy()
+
     def create_main_weather_display(self):
         self.main_frame = tk.Frame(self.root, bg="#6db3f2")
         self.main_frame.grid(row=1, column=0, columnspan=2, sticky="nsew", padx=20, pady=20)
@@ -198,6 +236,10 @@ class WeatherApp:
         self.country_label = tk.Label(self.main_frame, text="", font=("Helvetica", 20), bg="#6db3f2", fg="white")
         self.country_label.grid(row=4, column=0, pady=(0, 20), sticky="ew")
 
+        # Data freshness status (shown when painting cached data or while offline)
+        self.status_label = tk.Label(self.main_frame, text="", font=("Helvetica", 12), bg="#6db3f2", fg="#ffe08a")
+        self.status_label.grid(row=5, column=0, pady=(0, 10), sticky="ew")
+
     def create_temperature_section(self):
         self.temp_frame = tk.Frame(self.root, bg="#6db3f2")
         self.temp_frame.grid(row=2, column=0, columnspan=2, sticky="nsew", padx=80, pady=15)
@@ -236,9 +278,6 @@ class WeatherApp:
             card = self.create_forecast_card(self.forecast_frame, i)
             self.forecast_cards.append(card)
 
-        # Load last weather data if available
-        self.show_last_weather()
-
     def create_forecast_card(self, parent, day_offset):
         card_font = font.Font(family="Helvetica", size=16, weight="bold")
         temp_font = font.Font(family="Helvetica", size=14, weight="bold")
@@ -282,6 +321,9 @@ class WeatherApp:
         if not city:
             self.city_label.config(text="Enter a city name")
             return
+        
+        # Any background refresh still in flight is now outdated
+        self.view_generation += 1
             
         try:
             data = fetch_weather_data(city)
@@ -295,7 +337,8 @@ class WeatherApp:
                     data['forecast'] = []
                 
                 self.display_weather(data)
-                save_weather_data(data)
+                # Spool the write; the background drainer commits it, so a locked database never blocks the UI
+                save_weather_data(data, defer=True)
             else:
                 # Clear display if city not found or API error
                 self.city_label.config(text="City not found or API error")
@@ -307,8 +350,9 @@ class WeatherApp:
             print(f"Error fetching weather: {e}")
             self.city_label.config(text="Error fetching weather data")
 
-    def display_weather(self, data):
+    def display_weather(self, data, cached_alerts=None, stale_since=None):
         # Update main weather display with current data
+        # cached_alerts/stale_since are set when painting a saved snapshot instead of fresh data
         self.city_label.config(text=f"{data['city']}")
         self.temp_label.config(text=f"{data['temperature']}°F")
         self.desc_label.config(text=f"{data['description'].capitalize()}")
@@ -379,28 +423,92 @@ class WeatherApp:
         self.update_right_frame_cards(data)
 
         # Check for weather alerts and update the card
-        self.update_weather_alerts(data)
+        self.update_weather_alerts(data, cached_alerts)
 
         # Update moon phase
         self.update_moon_phase()
 
+        # Mark stale data clearly, and snapshot fresh views for the next cold start
+        self.is_stale = stale_since is not None
+        self.stale_since = stale_since
+        if self.is_stale:
+            self.show_stale_status(stale_since)
+        else:
+            self.status_label.config(text="")
+            save_last_view(data, self.current_alerts)
+
     def show_last_weather(self):
-        # Load and display the most recently saved weather data
+        # Paint the last rendered view without touching the network, then refresh it in the background
         try:
-            data = load_weather_data()
-            if data:
-                # Automatically fetch the latest forecast for the loaded city
-                try:
-                    forecast = fetch_5day_forecast(data['city'])
-                    data['forecast'] = forecast if forecast else []
-                except Exception as e:
-                    print(f"Forecast unavailable for last city: {e}")
-                    data['forecast'] = []
-                
-                self.display_weather(data)
+            view = load_last_view()
+            if view:
+                data = view['data']
+                self.display_weather(data, cached_alerts=view['alerts'], stale_since=view['saved_at'])
+            else:
+                # No snapshot yet (first run after upgrade) - fall back to the last database row
+                data = load_weather_data()
+                if not data:
+                    return
+                data['forecast'] = []
+                self.display_weather(data, cached_alerts=[], stale_since=0)
+            
+            self.refresh_weather_async(data['city'])
         except Exception as e:
             print(f"Error loading last weather data: {e}")
 
+    def show_stale_status(self, stale_since, offline=False):
+        """Show when the displayed (cached) data was last updated."""
+        if stale_since:
+            saved_text = datetime.fromtimestamp(stale_since).strftime('%b %d, %I:%M %p')
+            status = f"Showing saved data from {saved_text}"
+        else:
+            status = "Showing saved data"
+        if offline:
+            status = f"⚠️ Offline - {status}"
+        else:
+            status = f"{status} - refreshing..."
+        self.status_label.config(text=status)
+
+    def refresh_weather_async(self, city):
+        """Fetch fresh weather for a city on a worker thread and repaint when it arrives."""
+        generation = self.view_generation
+        result_queue = queue.Queue()
+
+        def worker():
+            try:
+                data = fetch_weather_data(city)
+                if data:
+                    forecast = fetch_5day_forecast(city)
+                    data['forecast'] = forecast if forecast else []
+                result_queue.put(data)
+            except Exception as e:
+                print(f"Background refresh failed for {city}: {e}")
+                result_queue.put(None)
+
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(REFRESH_POLL_MS, self._poll_refresh, result_queue, generation)
+
+    def _poll_refresh(self, result_queue, generation):
+        """Apply a finished background refresh on the Tk main thread."""
+        try:
+            data = result_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(REFRESH_POLL_MS, self._poll_refresh, result_queue, generation)
+            return
+        
+        # The user searched for something else while we were fetching
+        if generation != self.view_generation:
+            return
+        
+        if not data:
+            # Still offline - keep the cached view, but say so
+            if self.is_stale:
+                self.show_stale_status(self.stale_since, offline=True)
+            return
+        
+        self.display_weather(data)
+        save_weather_data(data, defer=True)
+
     def get_city_input(self):
         """Get the city name from the input field."""
         return self.city_var.get().strip()
@@ -627,6 +735,11 @@ class WeatherApp:
         self.moon_next_label = tk.Label(self.moon_frame, text="Next full moon: In 29 days", font=("Helvetica", 9), bg="#2c2c2c", fg="gray")
         self.moon_next_label.grid(row=4, column=0, padx=10, pady=(0, 8))
 
+        # Click the card for this month's moon calendar
+        for widget in (self.moon_frame, self.moon_phase_label, self.moon_name_label,
+                       self.moon_illumination_label, self.moon_next_label):
+            widget.bind("<Button-1>", lambda event: self.show_moon_calendar())
+
         # UV INDEX CARD (NEW - Add in row 3, column 1)
         self.uv_frame = tk.Frame(self.right_frame, bg="#2c2c2c", relief="solid", bd=1)
         self.uv_frame.grid(row=2, column=1, sticky="nsew", padx=card_padx, pady=card_pady)
@@ -649,16 +762,21 @@ class WeatherApp:
 
         # Bind moon phase update to the weather data fetch
         self.original_display_weather = self.display_weather
-        def display_weather_with_moon(data):
-            self.original_display_weather(data)
+        def display_weather_with_moon(data, *args, **kwargs):
+            self.original_display_weather(data, *args, **kwargs)
             self.update_moon_phase()  # Update moon phase after weather data is displayed
         self.display_weather = display_weather_with_moon
 
     def update_moon_phase(self):
-        """Update the moon phase card with current moon data."""
+        """Update the moon phase card with current moon data (recomputed once per day)."""
         try:
             from features.moon_phase import get_moon_data, get_next_full_moon
             
+            # Called on every weather display, but the card only changes with the date
+            today = date.today()
+            if getattr(self, 'moon_phase_date', None) == today:
+                return
+            
             moon_data = get_moon_data()
             next_full = get_next_full_moon()
             
@@ -669,7 +787,7 @@ class WeatherApp:
                 self.moon_illumination_label.config(text=f"{moon_data['illumination']}% illuminated")
                 
                 # Format next full moon date
-                days_until_full = (next_full - datetime.now()).days
+                days_until_full = (next_full.date() - today).days
                 if days_until_full == 0:
                     next_full_text = "Today"
                 elif days_until_full == 1:
@@ -678,6 +796,7 @@ class WeatherApp:
                     next_full_text = f"In {days_until_full} days"
                 
                 self.moon_next_label.config(text=f"Next full moon: {next_full_text}")
+                self.moon_phase_date = today
             
         except ImportError:
             # Fallback if moon_phase module has issues
@@ -687,6 +806,47 @@ class WeatherApp:
                 self.moon_illumination_label.config(text="-- % illuminated")
                 self.moon_next_label.config(text="Next full moon: --")
 
+    def show_moon_calendar(self, year=None, month=None):
+        """Show this month's moon phases (clicking the moon card opens it)."""
+        from features.moon_phase import moon_calendar
+        
+        today = date.today()
+        year, month = year or today.year, month or today.month
+        days = moon_calendar(year, month)
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Moon Calendar")
+        dialog.configure(bg="#2c2c2c")
+        dialog.resizable(False, False)
+        dialog.transient(self.root)
+        
+        tk.Label(dialog, text=f"🌙 {days[0]['date']:%B %Y}", font=("Helvetica", 16, "bold"),
+                 bg="#2c2c2c", fg="white").grid(row=0, column=0, columnspan=7, pady=(12, 8))
+        for column, name in enumerate(["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]):
+            tk.Label(dialog, text=name, font=("Helvetica", 9), bg="#2c2c2c", fg="gray", width=6).grid(row=1, column=column)
+        
+        offset = days[0]['date'].weekday()
+        for position, day in enumerate(days, offset):
+            # Principal phases are highlighted; today is marked
+            color = "#f1c40f" if day['event'] else ("#4a90e2" if day['date'] == today else "white")
+            tk.Label(dialog, text=f"{day['date'].day}\n{day['emoji']}", font=("Helvetica", 11), bg="#2c2c2c",
+                     fg=color, width=6).grid(row=2 + position // 7, column=position % 7, pady=2)
+        
+        events = [f"{day['date'].day}: {day['event']}" for day in days if day['event']]
+        tk.Label(dialog, text="   ".join(events), font=("Helvetica", 9), bg="#2c2c2c",
+                 fg="gray").grid(row=9, column=0, columnspan=7, pady=(8, 4))
+        
+        def show_other_month(step):
+            dialog.destroy()
+            other_year, other_month = divmod((year * 12 + month - 1) + step, 12)
+            self.show_moon_calendar(other_year, other_month + 1)
+        
+        nav = tk.Frame(dialog, bg="#2c2c2c")
+        nav.grid(row=10, column=0, columnspan=7, pady=(0, 12))
+        tk.Button(nav, text="◀", command=lambda: show_other_month(-1)).pack(side=tk.LEFT, padx=5)
+        tk.Button(nav, text="Close", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
+        tk.Button(nav, text="▶", command=lambda: show_other_month(1)).pack(side=tk.LEFT, padx=5)
+
     def add_custom_alert(self, city, country, alert_type, threshold_value, condition=">="):
         """Add a custom weather alert rule."""
         success = add_alert_rule(city, country, alert_type, threshold_value, condition)
@@ -695,31 +855,40 @@ class WeatherApp:
         else:
             messagebox.showerror("Error", "Failed to add alert rule.")
 
-    def update_weather_alerts(self, data):
+    def update_weather_alerts(self, data, cached_alerts=None):
         """Update the weather alerts card with actual alert data from One Call API."""
         if not hasattr(self, 'alert_title_label'):
             return
         
-        # Get alerts from the API data
-        api_alerts = data.get('alerts', [])
-        
-        # Also check your custom alert rules
-        custom_alerts = check_weather_alerts(data)
+        if cached_alerts is not None:
+            # Painting a saved snapshot - reuse its alerts instead of re-triggering rules
+            all_alerts = cached_alerts
+        else:
+            # Get alerts from the API data
+            api_alerts = data.get('alerts', [])
+            
+            # Also check your custom alert rules (on heat index, snow/ice, hazard flags, ...)
+            custom_alerts = check_weather_alerts(enrich_snapshot(data))
+            
+            # Combine both types of alerts, normalized to what the card displays
+            all_alerts = []
+            for alert in api_alerts + custom_alerts:
+                # Handle API alerts vs custom alerts differently
+                if 'event' in alert:  # API alert
+                    title = alert.get('event', 'Weather Alert')
+                    description = alert.get('description', 'No details available')
+                else:  # Custom alert
+                    title = alert.get('alert_type', 'Weather Alert').replace('_', ' ').title()
+                    description = alert.get('message', 'No details available')
+                all_alerts.append({'title': title, 'description': description})
         
-        # Combine both types of alerts
-        all_alerts = api_alerts + custom_alerts
+        self.current_alerts = all_alerts
         
         if all_alerts and len(all_alerts) > 0:
             # Display the first (most important) alert
             first_alert = all_alerts[0]
-            
-            # Handle API alerts vs custom alerts differently
-            if 'event' in first_alert:  # API alert
-                title = first_alert.get('event', 'Weather Alert')
-                description = first_alert.get('description', 'No details available')
-            else:  # Custom alert
-                title = first_alert.get('alert_type', 'Weather Alert').replace('_', ' ').title()
-                description = first_alert.get('message', 'No details available')
+            title = first_alert.get('title', 'Weather Alert')
+            description = first_alert.get('description', 'No details available')
             
             # Update alert title - show count if multiple alerts
             if len(all_alerts) > 1:
@@ -868,6 +1037,7 @@ class WeatherApp:
                 self.temp_label.configure(bg=colors['bg'], fg=colors['text'])
                 self.desc_label.configure(bg=colors['bg'], fg=colors['text'])
                 self.country_label.configure(bg=colors['bg'], fg=colors['text'])
+                self.status_label.configure(bg=colors['bg'])
             
             # Update temperature section
             if hasattr(self, 'temp_frame'):
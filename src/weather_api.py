@@ -1,19 +1,89 @@
 import requests
 import os
+import threading
+import time
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 
 load_dotenv()
 API_KEY = os.getenv('OPENWEATHER_API_KEY')
 
+# Seconds a One Call response is reused before it is fetched again
+CACHE_TTL = int(os.getenv('WEATHER_CACHE_TTL', 300))
+# Geocoding results hardly ever change
+GEOCODE_CACHE_TTL = 24 * 60 * 60
+# Sustained API calls per second and the burst allowed on top (free tier: 60 calls/minute)
+API_RATE_PER_SECOND = float(os.getenv('WEATHER_API_RATE', 1.0))
+API_BURST = 10
+# Seconds before an unanswered request is abandoned
+REQUEST_TIMEOUT = 15
+
+class TokenBucket:
+    """Thread-safe token bucket: acquire() blocks until a request may be sent."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# Shared by every caller in the process: the GUI, the alert monitor, ...
+_rate_limiter = TokenBucket(API_RATE_PER_SECOND, API_BURST)
+# {key: (expires_at, value)}
+_fetch_cache = {}
+_fetch_cache_lock = threading.Lock()
+
+def clear_fetch_cache():
+    """Forget cached API responses, e.g. to force a fresh fetch."""
+    with _fetch_cache_lock:
+        _fetch_cache.clear()
+
+def _cached(key, ttl, fetch):
+    """Return a cached value for key, calling fetch() when it is missing or expired."""
+    now = time.monotonic()
+    with _fetch_cache_lock:
+        entry = _fetch_cache.get(key)
+        if entry and entry[0] > now:
+            return entry[1]
+    
+    value = fetch()
+    # Failures (None/empty) are not cached, so the next call retries
+    if value:
+        with _fetch_cache_lock:
+            _fetch_cache[key] = (now + ttl, value)
+    return value
+
+def _api_get(url):
+    """GET an API URL once the shared rate limiter allows it; raises on HTTP errors."""
+    _rate_limiter.acquire()
+    response = requests.get(url, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+def _fetch_onecall(lat, lon):
+    """Raw One Call response for a location, shared by current weather, forecast and alerts."""
+    url = f"https://api.openweathermap.org/data/3.0/onecall?lat={lat}&lon={lon}&appid={API_KEY}&units=imperial"
+    return _cached(('onecall', round(lat, 4), round(lon, 4)), CACHE_TTL, lambda: _api_get(url))
+
 def get_coordinates(city):
     """Get latitude and longitude for a city using Geocoding API"""
     geocoding_url = f"http://api.openweathermap.org/geo/1.0/direct?q={city}&limit=1&appid={API_KEY}"
     
     try:
-        response = requests.get(geocoding_url)
-        response.raise_for_status()
-        data = response.json()
+        data = _cached(('geocode', city.strip().lower()), GEOCODE_CACHE_TTL, lambda: _api_get(geocoding_url))
         
         if data:
             location = data[0]
@@ -36,13 +106,8 @@ def fetch_weather_data(city):
         return None
     
     # Use One Call API 3.0
-    url = f"https://api.openweathermap.org/data/3.0/onecall?lat={lat}&lon={lon}&appid={API_KEY}&units=imperial"
-    
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        raw_data = response.json()
+        raw_data = _fetch_onecall(lat, lon)
         current = raw_data['current']
         daily = raw_data['daily'][0]  # Today's daily data
         
@@ -68,10 +133,23 @@ def fetch_weather_data(city):
             'dew_point': round(current.get('dew_point', 0)),
             'sunrise': current.get('sunrise'),
             'sunset': current.get('sunset'),
+            # When the reading was taken (epoch seconds); repeated fetches of one reading share it
+            'observed_at': current.get('dt'),
             
             # Weather alerts (if any)
             'alerts': raw_data.get('alerts', []),
             
+            # Next 24 hours of temperature and precipitation (mm), for snow/ice accumulation
+            'hourly': [
+                {
+                    'dt': hour.get('dt'),
+                    'temp': hour.get('temp'),
+                    'rain': hour.get('rain', {}).get('1h', 0),
+                    'snow': hour.get('snow', {}).get('1h', 0)
+                }
+                for hour in raw_data.get('hourly', [])[:24]
+            ],
+            
             # Wind data formatted
             'wind': {
                 'speed': current.get('wind_speed', 0),
@@ -92,7 +170,7 @@ def fetch_weather_data(city):
         
     except requests.exceptions.HTTPError as e:
         print(f"HTTP Error: {e}")
-        print(f"Response: {response.text}")
+        print(f"Response: {e.response.text if e.response is not None else ''}")
         return None
     except Exception as e:
         print(f"Error fetching weather data: {e}")
@@ -107,13 +185,8 @@ def fetch_5day_forecast(city):
         return []
     
     # Use One Call API 3.0
-    url = f"https://api.openweathermap.org/data/3.0/onecall?lat={lat}&lon={lon}&appid={API_KEY}&units=imperial"
-    
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        raw_data = response.json()
+        raw_data = _fetch_onecall(lat, lon)
         daily_data = raw_data['daily'][1:6]  # Skip today, get next 5 days
         
         forecast = []
@@ -155,13 +228,8 @@ def fetch_5day_forecast(city):
 
 def get_weather_alerts(lat, lon):
     """Get weather alerts for specific coordinates"""
-    url = f"https://api.openweathermap.org/data/3.0/onecall?lat={lat}&lon={lon}&appid={API_KEY}&units=imperial"
-    
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        raw_data = response.json()
+        raw_data = _fetch_onecall(lat, lon)
         alerts = raw_data.get('alerts', [])
         
         formatted_alerts = []
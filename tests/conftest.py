@@ -0,0 +1,24 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Make the project packages (data, features, src) importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def pytest_sessionstart(session):
+    # Modules create their databases in the working directory, so run from a
+    # scratch directory instead of the project's data files
+    os.chdir(tempfile.mkdtemp(prefix='weather-app-tests-'))
+
+@pytest.fixture
+def alerts_db(tmp_path, monkeypatch):
+    """A fresh alerts database and empty in-memory rule state. Returns its path."""
+    from features import weather_alert
+    path = str(tmp_path / 'alerts.db')
+    monkeypatch.setattr(weather_alert, 'ALERTS_DB', path)
+    monkeypatch.setattr(weather_alert, '_rule_index', None)
+    monkeypatch.setattr(weather_alert, '_dirty_rules', {})
+    weather_alert.init_alerts_db()
+    return path
@@ -0,0 +1,36 @@
+import sqlite3
+
+import pytest
+
+from features import alert_backtest
+from features.alert_backtest import backtest, iter_history_columns, proposed_rule
+from features.weather_alert import AlertType
+
+@pytest.fixture
+def history_db(tmp_path, monkeypatch):
+    path = str(tmp_path / 'weather.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE weather (city TEXT, country TEXT, observed_at INTEGER, temperature REAL, humidity REAL)')
+    conn.executemany('INSERT INTO weather VALUES (?, ?, ?, ?, ?)', [
+        ('Denver', 'US', 1000, 95, 20),
+        ('Denver', 'US', 2000, 70, 50),
+        ('Reno', 'US', 3000, 98, 10),
+    ])
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(alert_backtest, 'DB_NAME', path)
+    return path
+
+def test_malformed_expression_is_rejected():
+    with pytest.raises(ValueError):
+        proposed_rule('Denver', None, AlertType.CUSTOM, expression='humidity <=')
+
+def test_proposed_expression_counts_matching_readings(history_db):
+    [report] = backtest([proposed_rule('Denver', None, AlertType.CUSTOM, expression='temperature >= 90')])
+    assert report['hits'] == 1
+    assert report['first_triggered'].timestamp() == 1000
+
+def test_city_filter_handles_more_cities_than_bound_variables(history_db):
+    cities = [f"City {i}" for i in range(40000)] + ['Reno']
+    chunks = list(iter_history_columns(cities=cities, metrics=['temperature']))
+    assert [list(chunk['city']) for chunk in chunks] == [['Reno']]
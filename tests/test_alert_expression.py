@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from features.alert_expression import _Parser, compile_expression
+
+def getter(snapshot):
+    def get(name, default):
+        value = snapshot.get(name)
+        return default if value is None else value
+    return get
+
+def matches(text, snapshot, margin=0):
+    return bool(compile_expression(text).predicate(getter(snapshot), margin))
+
+@pytest.mark.parametrize('text, tree', [
+    ('humidity <= 30', ('compare', '<=', 'humidity', 30.0)),
+    ('30 >= humidity', ('compare', '<=', 'humidity', 30.0)),
+    ('temperature > -5.5', ('compare', '>', 'temperature', -5.5)),
+    ('temperature != .5', ('compare', '!=', 'temperature', 0.5)),
+    ('temperature > dew_point', ('fields', '>', 'temperature', 'dew_point')),
+    ('tornado_detected', ('flag', 'tornado_detected')),
+    ('a > 1 or b > 2 and c > 3', ('or', ('compare', '>', 'a', 1.0),
+                                  ('and', ('compare', '>', 'b', 2.0), ('compare', '>', 'c', 3.0)))),
+    ('(a > 1 or b > 2) and c > 3', ('and', ('or', ('compare', '>', 'a', 1.0), ('compare', '>', 'b', 2.0)),
+                                    ('compare', '>', 'c', 3.0))),
+    ('not not flood_detected', ('not', ('not', ('flag', 'flood_detected')))),
+    ('A > 1 AND NOT b', ('and', ('compare', '>', 'A', 1.0), ('not', ('flag', 'b')))),
+])
+def test_parse_tree(text, tree):
+    assert _Parser(text).parse() == (tree, 1)
+
+@pytest.mark.parametrize('text, readings', [
+    ('wind_speed >= 20', 1),
+    ('wind_speed >= 20 for 1 reading', 1),
+    ('wind_speed >= 20 for 3 readings', 3),
+    ('wind_speed >= 20 FOR 2 Readings', 2),
+])
+def test_reading_count(text, readings):
+    assert compile_expression(text).readings == readings
+
+@pytest.mark.parametrize('text, message', [
+    ('', 'empty'),
+    ('   ', 'empty'),
+    ('humidity <=', 'Expected a field or number at position 11'),
+    ('humidity 30', 'Expected end at position 9'),
+    ('30 > 20', 'has no field'),
+    ('30', 'Expected a comparison operator'),
+    ('(humidity < 30', "Expected ) at position 14, found 'end of expression'"),
+    ('humidity < 30)', "Expected end at position 13, found ')'"),
+    ('humidity < 30 and', 'Expected a field or number'),
+    ('humidity < 30 for readings', 'Expected number'),
+    ('humidity < 30 for 0 readings', 'positive whole number'),
+    ('humidity < 30 for 1.5 readings', 'positive whole number'),
+    ('humidity < 30 for 2', "Expected 'readings'"),
+    ('humidity < 30 for 2 hours', "Expected 'readings'"),
+    ('humidity = 30', "Unexpected character '=' at position 9"),
+    ('humidity < 30 & wind > 2', "Unexpected character '&' at position 14"),
+    ('humidity < - wind', 'Expected number'),
+])
+def test_malformed_expressions(text, message):
+    with pytest.raises(ValueError, match=message.replace('(', r'\(').replace(')', r'\)')):
+        compile_expression(text)
+
+def test_evaluates_one_snapshot():
+    text = 'humidity <= 30 and (wind_speed >= 20 or gusting) and not flood_detected'
+    assert matches(text, {'humidity': 25, 'wind_speed': 22})
+    assert matches(text, {'humidity': 25, 'wind_speed': 5, 'gusting': True})
+    assert not matches(text, {'humidity': 25, 'wind_speed': 22, 'flood_detected': True})
+    assert not matches(text, {'humidity': 35, 'wind_speed': 22})
+    assert compile_expression(text).fields == {'humidity', 'wind_speed', 'gusting', 'flood_detected'}
+
+def test_missing_values_fail_comparisons_except_not_equal():
+    assert not matches('humidity <= 30', {})
+    assert not matches('humidity > 30', {})
+    assert matches('humidity != 30', {})
+
+def test_compares_two_fields():
+    assert matches('temperature > dew_point', {'temperature': 50, 'dew_point': 40})
+    assert not matches('temperature > dew_point', {'temperature': 40, 'dew_point': 40})
+
+def test_evaluates_columns():
+    predicate = compile_expression('temperature >= 90 or humidity < 20').predicate
+    columns = {'temperature': np.array([95, 80, 80, np.nan]), 'humidity': np.array([50, 10, 50, 10])}
+    result = predicate(lambda name, default: columns.get(name, np.full(4, default)))
+    assert result.tolist() == [True, True, False, True]
+
+def test_margin_is_a_percentage_of_each_threshold():
+    # 10% loosens wind (>= 20) by 2 mph and humidity (<= 30) by 3 points
+    text = 'wind_speed >= 20 and humidity <= 30'
+    assert not matches(text, {'wind_speed': 18.5, 'humidity': 30})
+    assert matches(text, {'wind_speed': 18.5, 'humidity': 30}, margin=10)
+    assert matches(text, {'wind_speed': 20, 'humidity': 32.5}, margin=10)
+    assert not matches(text, {'wind_speed': 20, 'humidity': 33.5}, margin=10)
+
+def test_margin_tightens_negated_conditions():
+    # Loosening "not (x > 100)" means x may go a little above 100
+    assert not matches('not aqi > 100', {'aqi': 105})
+    assert matches('not aqi > 100', {'aqi': 105}, margin=10)
+
+def test_compiled_expressions_are_cached():
+    assert compile_expression('humidity <= 30') is compile_expression('humidity <= 30')
@@ -0,0 +1,85 @@
+import pytest
+
+from features import weather_alert
+from features.weather_alert import AlertType, connect, query_alert_history, search_alert_history
+
+pytestmark = pytest.mark.usefixtures('alerts_db')
+
+def insert_history(rows):
+    """Insert (city, message, triggered_at) rows directly; returns their ids."""
+    conn = connect(weather_alert.ALERTS_DB)
+    ids = []
+    for city, message, triggered_at in rows:
+        c = conn.execute('''
+            INSERT INTO alert_history (city, alert_type, severity, message, triggered_date, triggered_at)
+            VALUES (?, 'temperature_high', 'medium', ?, '', ?)
+        ''', (city, message, triggered_at))
+        ids.append(c.lastrowid)
+    conn.commit()
+    conn.close()
+    return ids
+
+def all_pages(limit, **filters):
+    pages = []
+    cursor = None
+    while True:
+        page, cursor = query_alert_history(limit=limit, cursor=cursor, **filters)
+        pages.append([entry['id'] for entry in page])
+        if cursor is None:
+            return pages
+
+def test_pages_across_equal_timestamps_without_duplicates_or_gaps():
+    # Runs of identical timestamps straddle the page boundaries
+    times = [100, 100, 100, 100, 200, 200, 300, 300, 300, 300, 300]
+    ids = insert_history([('Denver', f"alert {i}", t) for i, t in enumerate(times)])
+    expected = [i for _, i in sorted(zip(times, ids), reverse=True)]
+
+    for limit in (1, 2, 3, 4, 5, 11, 20):
+        pages = all_pages(limit)
+        flat = [i for page in pages for i in page]
+        assert flat == expected
+        assert all(len(page) <= limit for page in pages)
+
+def test_filters_apply_to_every_page():
+    insert_history([('Denver', 'a', 100), ('Reno', 'b', 100), ('Denver', 'c', 100), ('Denver', 'd', 50)])
+    pages = all_pages(2, city='Denver', start=60)
+    assert [len(page) for page in pages] == [2, 0]
+    assert {entry['city'] for entry in query_alert_history(city='Denver')[0]} == {'Denver'}
+
+def test_inserted_alerts_are_searchable():
+    insert_history([('Denver', 'Red flag warning in effect', 100), ('Reno', 'Heat advisory', 200)])
+    results = search_alert_history('red flag')
+    assert [result['city'] for result in results] == ['Denver']
+    assert '[red]' in results[0]['snippet'].lower()
+    # Stemmed: "flooding" finds "flood"
+    insert_history([('Miami', 'Coastal flood watch', 300)])
+    assert [result['city'] for result in search_alert_history('flooding')] == ['Miami']
+
+def test_deleted_alerts_leave_the_index():
+    [kept, removed] = insert_history([('Denver', 'Heat advisory', 100), ('Reno', 'Heat advisory', 200)])
+    conn = connect(weather_alert.ALERTS_DB)
+    conn.execute('DELETE FROM alert_history WHERE id = ?', (removed,))
+    conn.commit()
+    conn.close()
+    assert [result['id'] for result in search_alert_history('heat')] == [kept]
+
+def test_snapshot_text_is_searchable():
+    weather_alert.add_alert_rule('Denver', None, AlertType.TEMPERATURE_HIGH, 90, '>=')
+    weather_alert.check_weather_alerts({
+        'city': 'Denver', 'temperature': 95, 'description': 'scattered thunderstorms',
+        'alerts': [{'event': 'Red Flag Warning', 'description': 'Critical fire weather conditions'}]
+    })
+    assert len(search_alert_history('thunderstorm')) == 1
+    assert len(search_alert_history('critical fire')) == 1
+    assert search_alert_history('tornado') == []
+
+def test_search_falls_back_to_like_without_the_index():
+    insert_history([('Denver', 'Red flag warning', 100), ('Reno', 'Heat advisory', 200)])
+    conn = connect(weather_alert.ALERTS_DB)
+    for trigger in ('alert_search_insert', 'alert_search_delete', 'alert_search_update'):
+        conn.execute(f'DROP TRIGGER {trigger}')
+    conn.execute('DROP TABLE alert_search')
+    conn.commit()
+    conn.close()
+    assert [result['city'] for result in search_alert_history('flag')] == ['Denver']
+    assert search_alert_history('flag heat') == []
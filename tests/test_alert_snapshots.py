@@ -0,0 +1,107 @@
+import json
+import sqlite3
+
+import pytest
+
+from features import weather_alert
+from features.weather_alert import (
+    AlertType, connect, decode_snapshot, encode_snapshot, get_alert_history, get_alert_snapshot,
+    search_alert_history
+)
+
+SNAPSHOT = {'city': 'Denver', 'temperature': 95, 'description': 'clear sky', 'alerts': []}
+
+def count(table):
+    conn = connect(weather_alert.ALERTS_DB)
+    try:
+        return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    finally:
+        conn.close()
+
+def test_snapshot_hash_ignores_key_order():
+    reordered = dict(reversed(list(SNAPSHOT.items())))
+    assert encode_snapshot(SNAPSHOT)[0] == encode_snapshot(reordered)[0]
+    assert encode_snapshot(SNAPSHOT)[0] != encode_snapshot(dict(SNAPSHOT, temperature=96))[0]
+    assert decode_snapshot(encode_snapshot(SNAPSHOT)[1]) == SNAPSHOT
+
+@pytest.mark.usefixtures('alerts_db')
+def test_identical_snapshots_are_stored_once():
+    weather_alert.add_alert_rule('Denver', None, AlertType.TEMPERATURE_HIGH, 90, '>=')
+    weather_alert.add_alert_rule('Denver', None, AlertType.TEMPERATURE_HIGH, 80, '>=')
+    # Two rules fire on one snapshot, then the same reading fires again once re-armed
+    assert len(weather_alert.check_weather_alerts(dict(SNAPSHOT))) == 2
+    weather_alert.check_weather_alerts(dict(SNAPSHOT, temperature=50))
+    assert len(weather_alert.check_weather_alerts(dict(SNAPSHOT))) == 2
+    weather_alert.check_weather_alerts(dict(SNAPSHOT, temperature=97))
+
+    assert count('alert_history') == 4
+    assert count('alert_snapshots') == 1
+    history = get_alert_history(include_weather=True)
+    assert {entry['snapshot_hash'] for entry in history} == {encode_snapshot(SNAPSHOT)[0]}
+    assert history[0]['weather_data'] == SNAPSHOT
+    assert get_alert_snapshot(history[0]['snapshot_hash']) == SNAPSHOT
+    assert get_alert_snapshot('missing') is None
+
+def test_reader_reports_a_database_it_cannot_open(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(weather_alert, 'ALERTS_DB', str(tmp_path / 'missing' / 'alerts.db'))
+    assert get_alert_snapshot('abc') is None
+    assert weather_alert.query_alert_history() == ([], None)
+    assert search_alert_history('heat') == []
+    assert 'unable to open database' in capsys.readouterr().out
+
+def create_baseline_db(path, weather_rows):
+    """An alerts database as the app wrote it before snapshots were stored separately."""
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE alert_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, city TEXT NOT NULL, country TEXT,
+            alert_type TEXT NOT NULL, threshold_value REAL, condition TEXT,
+            is_active BOOLEAN DEFAULT 1, created_date TEXT, last_triggered TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE alert_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, city TEXT NOT NULL, alert_type TEXT NOT NULL,
+            severity TEXT NOT NULL, message TEXT NOT NULL, triggered_date TEXT, weather_data TEXT
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO alert_rules (city, country, alert_type, threshold_value, condition, created_date)
+        VALUES ('Denver', 'US', 'temperature_high', 90, '>=', '2024-07-01 12:00:00')
+    ''')
+    conn.executemany('''
+        INSERT INTO alert_history (city, alert_type, severity, message, triggered_date, weather_data)
+        VALUES ('Denver', 'temperature_high', 'medium', ?, ?, ?)
+    ''', weather_rows)
+    conn.commit()
+    conn.close()
+
+def test_migrates_a_baseline_database(tmp_path, monkeypatch):
+    path = str(tmp_path / 'weather_alerts.db')
+    storm = dict(SNAPSHOT, description='severe thunderstorms')
+    create_baseline_db(path, [
+        ('High temperature alert', '2024-07-01 12:00:00', json.dumps(SNAPSHOT)),
+        ('High temperature alert', '2024-07-01 13:00:00', json.dumps(SNAPSHOT)),
+        ('Storm alert', '2024-07-02 12:00:00', json.dumps(storm)),
+        ('Unreadable snapshot', 'not a date', '{broken'),
+    ])
+    monkeypatch.setattr(weather_alert, 'ALERTS_DB', path)
+    monkeypatch.setattr(weather_alert, '_rule_index', None)
+    weather_alert.init_alerts_db()
+    # A second run finds nothing left to migrate
+    weather_alert.init_alerts_db()
+
+    conn = sqlite3.connect(path)
+    rows = conn.execute('SELECT message, weather_data, snapshot_hash, triggered_at FROM alert_history ORDER BY id').fetchall()
+    conn.close()
+    assert all(weather_data is None for _, weather_data, _, _ in rows)
+    assert rows[0][2] == rows[1][2] == encode_snapshot(SNAPSHOT)[0]
+    assert rows[2][2] == encode_snapshot(storm)[0]
+    assert rows[3][2] is None
+    assert count('alert_snapshots') == 2
+    assert rows[0][3] is not None and rows[3][3] is None
+
+    assert get_alert_snapshot(rows[2][2]) == storm
+    assert [entry['message'] for entry in search_alert_history('thunderstorm')] == ['Storm alert']
+    rule = weather_alert.get_alert_rules()[0]
+    assert (rule['armed'], rule['cooldown_minutes'], rule['streak']) == (1, weather_alert.DEFAULT_COOLDOWN_MINUTES, 0)
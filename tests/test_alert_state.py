@@ -0,0 +1,156 @@
+import pytest
+
+from features import weather_alert
+from features.weather_alert import AlertType, _advance_rule_state
+
+pytestmark = pytest.mark.usefixtures('alerts_db')
+
+def make_rule(**state):
+    rule = {'id': 1, 'armed': 1, 'cooldown_minutes': 60, 'suppressed_count': 0, 'last_triggered_at': None,
+            'expression': None, 'streak': 0, 'streak_observed_at': None}
+    rule.update(state)
+    return rule
+
+def test_fires_once_then_suppresses_repeats():
+    rule = make_rule()
+    assert _advance_rule_state(rule, True, False, 1000) == 'fire'
+    assert rule['armed'] == 0 and rule['last_triggered_at'] == 1000
+    assert _advance_rule_state(rule, True, False, 1060) == 'suppress'
+    assert _advance_rule_state(rule, True, False, 1120) == 'suppress'
+    assert rule['suppressed_count'] == 2
+    assert rule['last_triggered_at'] == 1000
+
+def test_fires_again_once_cooldown_expires():
+    rule = make_rule(cooldown_minutes=10)
+    assert _advance_rule_state(rule, True, False, 0) == 'fire'
+    assert _advance_rule_state(rule, True, False, 599) == 'suppress'
+    assert _advance_rule_state(rule, True, False, 600) == 'fire'
+    assert rule['last_triggered_at'] == 600
+
+def test_rearms_only_when_cleared_by_the_margin():
+    rule = make_rule()
+    assert _advance_rule_state(rule, True, False, 0) == 'fire'
+    # Inactive but still within the hysteresis margin: stays quiet
+    assert _advance_rule_state(rule, False, False, 60) is None
+    assert rule['armed'] == 0
+    assert _advance_rule_state(rule, False, True, 120) == 'rearm'
+    assert rule['armed'] == 1
+    # Re-armed, so the next match fires even inside the cooldown
+    assert _advance_rule_state(rule, True, False, 180) == 'fire'
+
+def test_armed_rule_ignores_clears():
+    rule = make_rule()
+    assert _advance_rule_state(rule, False, True, 0) is None
+    assert weather_alert._dirty_rules == {}
+
+def test_streak_needs_consecutive_readings():
+    rule = make_rule(expression='temperature >= 90 for 3 readings')
+    assert _advance_rule_state(rule, True, False, 0, observed_at=100) is None
+    assert _advance_rule_state(rule, True, False, 0, observed_at=200) is None
+    assert _advance_rule_state(rule, False, False, 0, observed_at=300) is None
+    assert rule['streak'] == 0
+    outcomes = [_advance_rule_state(rule, True, False, 0, observed_at=t) for t in (400, 500, 600)]
+    assert outcomes == [None, None, 'fire']
+
+def test_streak_counts_each_reading_once():
+    rule = make_rule(expression='temperature >= 90 for 2 readings')
+    for _ in range(3):
+        assert _advance_rule_state(rule, True, False, 0, observed_at=100) is None
+    assert rule['streak'] == 1
+    assert _advance_rule_state(rule, True, False, 0, observed_at=50) is None
+    assert _advance_rule_state(rule, True, False, 0, observed_at=200) == 'fire'
+
+def test_check_weather_alerts_saves_state_and_history():
+    weather_alert.add_alert_rule('Denver', None, AlertType.TEMPERATURE_HIGH, 90, '>=', hysteresis=5)
+    snapshot = {'city': 'Denver', 'temperature': 95}
+    assert len(weather_alert.check_weather_alerts(dict(snapshot))) == 1
+    assert weather_alert.check_weather_alerts(dict(snapshot)) == []
+    # 87 is below 90 but within the 5 degree margin, 84 clears it
+    assert weather_alert.check_weather_alerts(dict(snapshot, temperature=87)) == []
+    assert weather_alert.get_alert_rules()[0]['armed'] == 0
+    weather_alert.check_weather_alerts(dict(snapshot, temperature=84))
+    assert weather_alert.get_alert_rules()[0]['armed'] == 1
+    assert len(weather_alert.check_weather_alerts(dict(snapshot))) == 1
+
+    weather_alert.flush_alert_state()
+    rule = weather_alert.get_alert_rules()[0]
+    assert rule['suppressed_count'] == 1
+    assert len(weather_alert.get_alert_history()) == 2
+
+def test_batch_uses_each_rows_time_for_cooldown():
+    weather_alert.add_alert_rule('Denver', None, AlertType.TEMPERATURE_HIGH, 90, '>=', cooldown_minutes=60)
+    columns = {'city': ['Denver'] * 5, 'temperature': [95] * 5,
+               'observed_at': [0, 1800, 3600, 5400, 7200]}
+    alerts = weather_alert.check_weather_alerts_batch(columns)
+    assert [alert['row'] for alert in alerts] == [0, 2, 4]
+    history = weather_alert.get_alert_history()
+    assert sorted(entry['triggered_at'] for entry in history) == [0, 3600, 7200]
+
+def test_fixed_threshold_margin_scales_per_field():
+    # Fire weather: humidity <= 30 and wind >= 20; a 10% margin is 3 points of humidity, 2 mph of wind
+    weather_alert.add_alert_rule('Reno', None, AlertType.FIRE_WEATHER, None, None, hysteresis=10)
+    columns = {'city': ['Reno'] * 4, 'humidity': [20, 32, 34, 20], 'wind_speed': [25, 25, 25, 25],
+               'observed_at': [0, 60, 120, 180]}
+    alerts = weather_alert.check_weather_alerts_batch(columns)
+    assert [alert['row'] for alert in alerts] == [0, 3]
+
+def test_state_advanced_by_another_process_is_picked_up():
+    weather_alert.add_alert_rule('Denver', None, AlertType.TEMPERATURE_HIGH, 90, '>=')
+    snapshot = {'city': 'Denver', 'temperature': 95}
+    # Another process loaded the rule before this one fired it
+    stale_rules = [dict(rule) for rule in weather_alert.get_alert_rules()]
+    assert len(weather_alert.check_weather_alerts(dict(snapshot))) == 1
+    weather_alert.check_weather_alerts(dict(snapshot))
+    weather_alert.flush_alert_state()
+
+    weather_alert._rule_index = {'Denver': {None: {AlertType.TEMPERATURE_HIGH.value: stale_rules}}}
+    assert weather_alert.check_weather_alerts(dict(snapshot)) == []
+    weather_alert.flush_alert_state()
+    assert weather_alert.get_alert_rules()[0]['suppressed_count'] == 2
+
+def test_repeat_checks_stay_in_memory(monkeypatch):
+    weather_alert.add_alert_rule('Denver', None, AlertType.TEMPERATURE_HIGH, 90, '>=')
+    snapshot = {'city': 'Denver', 'temperature': 95}
+    assert len(weather_alert.check_weather_alerts(dict(snapshot))) == 1
+
+    def no_connect(path):
+        raise AssertionError("suppressed repeat opened the database")
+
+    monkeypatch.setattr(weather_alert, 'connect', no_connect)
+    for _ in range(3):
+        assert weather_alert.check_weather_alerts(dict(snapshot)) == []
+    assert weather_alert.get_indexed_rules('Denver')[0]['suppressed_count'] == 3
+
+def test_flushing_counts_does_not_overwrite_another_processes_arming():
+    weather_alert.add_alert_rule('Denver', None, AlertType.TEMPERATURE_HIGH, 90, '>=')
+    snapshot = {'city': 'Denver', 'temperature': 95}
+    weather_alert.check_weather_alerts(dict(snapshot))
+    # Another process re-arms the rule while this one still holds it disarmed in memory
+    conn = weather_alert.connect(weather_alert.ALERTS_DB)
+    conn.execute('UPDATE alert_rules SET armed = 1')
+    conn.commit()
+    conn.close()
+
+    assert weather_alert.check_weather_alerts(dict(snapshot)) == []
+    weather_alert.flush_alert_state()
+    rule = weather_alert.get_alert_rules()[0]
+    assert rule['armed'] == 1
+    assert rule['suppressed_count'] == 1
+
+def test_streak_saved_by_a_stale_process_keeps_the_newer_count():
+    weather_alert.add_expression_rule('Denver', None, 'temperature >= 90 for 3 readings')
+    reading = {'city': 'Denver', 'temperature': 95}
+    weather_alert.check_weather_alerts(dict(reading, observed_at=100))
+    weather_alert.flush_alert_state()
+    # Another process has since counted two newer readings
+    conn = weather_alert.connect(weather_alert.ALERTS_DB)
+    conn.execute('UPDATE alert_rules SET streak = 3, streak_observed_at = 300')
+    conn.commit()
+    conn.close()
+
+    rule = weather_alert.get_indexed_rules('Denver')[0]
+    rule['streak'], rule['streak_observed_at'] = 1, 50
+    weather_alert._mark_rule_dirty(rule)
+    weather_alert.flush_alert_state()
+    stored = weather_alert.get_alert_rules()[0]
+    assert (stored['streak'], stored['streak_observed_at']) == (3, 300)
@@ -0,0 +1,72 @@
+import sqlite3
+import time
+
+import pytest
+
+from data import db
+from data.db import connect, max_busy_wait, retry_on_busy
+
+def test_worst_case_write_wait_is_bounded():
+    # Driver-level waiting and application-level retries must not multiply into minutes
+    assert max_busy_wait() < 20
+    assert db.BUSY_TIMEOUT <= 2
+
+def test_write_against_a_held_lock_gives_up_within_the_bound(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, 'BUSY_TIMEOUT', 0.1)
+    path = str(tmp_path / 'locked.db')
+    holder = connect(path)
+    holder.execute('CREATE TABLE t (x INTEGER)')
+    holder.commit()
+    holder.execute('BEGIN EXCLUSIVE')
+
+    def write():
+        conn = connect(path)
+        try:
+            conn.execute('INSERT INTO t VALUES (1)')
+            conn.commit()
+        finally:
+            conn.close()
+
+    attempts, base_delay = 3, 0.01
+    started = time.monotonic()
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            retry_on_busy(write, attempts=attempts, base_delay=base_delay)
+    finally:
+        holder.rollback()
+        holder.close()
+    elapsed = time.monotonic() - started
+    # Small allowance for connection setup and scheduling
+    assert elapsed <= max_busy_wait(attempts, base_delay) + 0.5
+    assert elapsed >= attempts * 0.1 * 0.5
+
+def test_write_succeeds_once_the_lock_is_released(tmp_path):
+    path = str(tmp_path / 'free.db')
+    conn = connect(path)
+    conn.execute('CREATE TABLE t (x INTEGER)')
+    conn.commit()
+    calls = []
+
+    def write():
+        calls.append(1)
+        if len(calls) < 3:
+            raise sqlite3.OperationalError('database is locked')
+        conn.execute('INSERT INTO t VALUES (1)')
+        conn.commit()
+        return 'done'
+
+    assert retry_on_busy(write, base_delay=0.001) == 'done'
+    assert len(calls) == 3
+    assert conn.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 1
+    conn.close()
+
+def test_other_errors_are_not_retried():
+    calls = []
+
+    def write():
+        calls.append(1)
+        raise sqlite3.OperationalError('no such table: t')
+
+    with pytest.raises(sqlite3.OperationalError):
+        retry_on_busy(write, base_delay=0.001)
+    assert len(calls) == 1
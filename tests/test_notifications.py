@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+
+from features.notifications import NotificationDispatcher, NotificationSink
+
+def alert(city, message='Heat'):
+    return {'rule_id': 1, 'city': city, 'alert_type': 'temperature_high', 'severity': 'high', 'message': message}
+
+class RecordingSink(NotificationSink):
+    name = 'recording'
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+        self.delivered = []
+
+    def send(self, alerts):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise OSError("sink unavailable")
+        self.delivered.append([payload['city'] for payload in alerts])
+
+def run(sink, batches, pause=0.0, **options):
+    """Submit batches of alerts to a fresh dispatcher and wait for it to deliver them."""
+    options.setdefault('digest_window', 0.2)
+    options.setdefault('retry_base_delay', 0.01)
+    dispatcher = NotificationDispatcher([sink], **options).start()
+    for batch in batches:
+        dispatcher.submit(batch)
+        time.sleep(pause)
+    dispatcher.stop()
+    return dispatcher
+
+def test_sink_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        NotificationSink()
+
+def test_burst_is_delivered_as_one_digest():
+    sink = RecordingSink()
+    run(sink, [[alert('Denver')], [alert('Reno'), alert('Miami')]])
+    assert sink.delivered == [['Denver', 'Reno', 'Miami']]
+
+def test_digest_is_capped_and_spaced_alerts_are_sent_apart():
+    sink = RecordingSink()
+    run(sink, [[alert(city) for city in 'ABCDE']], digest_max=2)
+    assert sink.delivered == [['A', 'B'], ['C', 'D'], ['E']]
+
+    sink = RecordingSink()
+    run(sink, [[alert('A')], [alert('B')]], pause=0.15, digest_window=0.05)
+    assert sink.delivered == [['A'], ['B']]
+
+def test_failed_delivery_is_retried():
+    sink = RecordingSink(failures=2)
+    run(sink, [[alert('Denver')]], retry_attempts=3)
+    assert sink.calls == 3
+    assert sink.delivered == [['Denver']]
+
+def test_delivery_gives_up_after_the_last_attempt():
+    sink = RecordingSink(failures=10)
+    run(sink, [[alert('Denver')]], retry_attempts=3)
+    assert sink.calls == 3
+    assert sink.delivered == []
+
+def test_full_queue_drops_instead_of_blocking():
+    dispatcher = NotificationDispatcher([RecordingSink()], queue_size=2)
+    started = time.monotonic()
+    dispatcher.submit([alert(str(i)) for i in range(5)])
+    assert time.monotonic() - started < 1
+    assert dispatcher.dropped == 3
+
+def test_drops_are_counted_across_threads():
+    dispatcher = NotificationDispatcher([RecordingSink()], queue_size=1)
+    threads = [threading.Thread(target=dispatcher.submit, args=([alert(str(i)) for i in range(500)],))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert dispatcher.dropped == 8 * 500 - 1
+
+def test_backed_up_sink_drops_digests():
+    release = threading.Event()
+
+    class BlockedSink(RecordingSink):
+        def send(self, alerts):
+            release.wait(5)
+            super().send(alerts)
+
+    sink = BlockedSink()
+    dispatcher = NotificationDispatcher([sink], queue_size=1, digest_window=0.01).start()
+    for i in range(4):
+        dispatcher.submit([alert(str(i))])
+        time.sleep(0.1)
+    # One digest is being sent and one waits in the sink's queue; the rest are dropped
+    assert dispatcher.dropped == 2
+    release.set()
+    dispatcher.stop()
+    assert sink.delivered == [['0'], ['1']]
@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+from data import spool
+from data.spool import RECORD_HEADER, append_record, drain, pending_count, read_records, scan_records
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'spool.bin')
+
+def append_all(path, count):
+    for i in range(count):
+        assert append_record({'n': i}, path=path)
+
+def test_records_round_trip(path):
+    append_all(path, 3)
+    assert read_records(path) == [{'n': 0}, {'n': 1}, {'n': 2}]
+    assert pending_count(path) == 3
+
+def test_scan_resyncs_past_a_corrupt_record(path):
+    append_all(path, 3)
+    with open(path, 'rb') as f:
+        buffer = bytearray(f.read())
+    # Flip a payload byte of the middle record so its CRC no longer matches
+    first_length = RECORD_HEADER.unpack_from(buffer, 0)[0]
+    second = RECORD_HEADER.size + first_length
+    buffer[second + RECORD_HEADER.size + 2] ^= 0xFF
+
+    records, corrupt = scan_records(bytes(buffer))
+    assert records == [{'n': 0}, {'n': 2}]
+    second_length = RECORD_HEADER.unpack_from(buffer, second)[0]
+    assert corrupt == [(second, second + RECORD_HEADER.size + second_length)]
+
+def test_torn_tail_is_dropped_not_reported(path):
+    append_all(path, 2)
+    with open(path, 'ab') as f:
+        f.write(RECORD_HEADER.pack(100, 0) + b'{"n":')
+    records, corrupt = scan_records(open(path, 'rb').read())
+    assert records == [{'n': 0}, {'n': 1}]
+    assert corrupt == []
+
+def test_drain_quarantines_corrupt_bytes(path):
+    append_all(path, 2)
+    with open(path, 'ab') as f:
+        f.write(b'garbage that is not a record')
+    append_record({'n': 2}, path=path)
+
+    applied = []
+    assert drain(applied.extend, path=path) == 3
+    assert applied == [{'n': 0}, {'n': 1}, {'n': 2}]
+    assert open(path + '.corrupt', 'rb').read() == b'garbage that is not a record'
+    assert pending_count(path) == 0
+
+def test_failed_batch_stays_spooled_for_the_next_drain(path):
+    append_all(path, 5)
+    applied = []
+
+    def apply_batch(batch):
+        if batch[0]['n'] == 2:
+            raise OSError("database unavailable")
+        applied.extend(batch)
+
+    assert drain(apply_batch, batch_size=2, path=path) == 2
+    assert applied == [{'n': 0}, {'n': 1}]
+    assert pending_count(path) == 3
+
+    # Records appended meanwhile are replayed after the ones left over
+    append_record({'n': 5}, path=path)
+    assert drain(applied.extend, batch_size=2, path=path) == 3
+    assert drain(applied.extend, batch_size=2, path=path) == 1
+    assert applied == [{'n': i} for i in range(6)]
+    assert not os.path.exists(spool._draining_path(path))
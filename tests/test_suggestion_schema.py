@@ -0,0 +1,166 @@
+import json
+import zipfile
+
+import pandas as pd
+import pytest
+
+from features import suggestion_data
+from features.suggestion_data import detect_schema, parse_city_table, sniff_delimiter
+
+ROWS = [('Oslo', 30.5, 80), ('Cairo', 95.0, 20), ('Lima', 68.25, 75)]
+
+def csv_text(sep=',', header=('city', 'temperature', 'humidity'), rows=ROWS):
+    lines = [sep.join(header)] + [sep.join(str(value) for value in row) for row in rows]
+    return '\n'.join(lines) + '\n'
+
+def write_archive(path, members):
+    with zipfile.ZipFile(path, 'w') as archive:
+        for name, text in members.items():
+            archive.writestr(name, text)
+    return str(path)
+
+@pytest.fixture
+def detections(monkeypatch):
+    """Members whose layout was detected (rather than taken from the schema cache)."""
+    detected = []
+    real_read_csv = pd.read_csv
+
+    def counting_read_csv(*args, **kwargs):
+        if 'nrows' in kwargs:
+            detected.append(args[0].name)
+        return real_read_csv(*args, **kwargs)
+
+    monkeypatch.setattr(suggestion_data.pd, 'read_csv', counting_read_csv)
+    return detected
+
+def test_detect_schema_prefers_keyword_order():
+    sample = pd.DataFrame({
+        'low': [40.0, 50.0], 'name': ['Oslo', 'Lima'], 'high': [60.0, 70.0],
+        'city': ['Oslo', 'Lima'], 'temp': [50.0, 60.0]
+    })
+    schema = detect_schema(sample)
+    assert schema['city'] == 'city'
+    assert schema['temperature'] == 'temp'
+
+def test_detect_schema_matches_header_variants():
+    sample = pd.DataFrame({
+        ' City Name ': ['Oslo', 'Lima'], 'Avg Temperature (F)': [30.5, 68.0],
+        'Wind_Speed': [5.0, 3.0], 'LAT': [59.9, -12.0], 'Lng': [10.7, -77.0]
+    })
+    assert detect_schema(sample) == {
+        'city': ' City Name ', 'temperature': 'Avg Temperature (F)', 'humidity': None,
+        'wind_speed': 'Wind_Speed', 'precipitation': None, 'latitude': 'LAT', 'longitude': 'Lng'
+    }
+
+def test_detect_schema_checks_column_contents():
+    sample = pd.DataFrame({
+        # A numeric "name" column is an id, not the city
+        'name_id': [1, 2], 'location': ['Oslo', 'Lima'],
+        # A text "temp" column is a label, not a reading
+        'temp_unit': ['F', 'F'], 'daily high': [30.5, 68.0],
+        # Coordinates only match whole names ("population" contains "lat")
+        'population': [700000, 10000000]
+    })
+    schema = detect_schema(sample)
+    assert schema['city'] == 'location'
+    assert schema['temperature'] == 'daily high'
+    assert schema['latitude'] is None
+
+def test_detect_schema_unusable_files():
+    assert detect_schema(pd.DataFrame({'city': ['Oslo'], 'country': ['Norway']})) == {}
+    assert detect_schema(pd.DataFrame({'station': ['A1'], 'temp': [30.5]})) == {}
+    assert detect_schema(pd.DataFrame()) == {}
+
+@pytest.mark.parametrize('sep', [',', ';', '\t', '|'])
+def test_sniff_delimiter(sep):
+    assert sniff_delimiter(csv_text(sep)) == sep
+
+def test_sniff_delimiter_falls_back_to_comma():
+    assert sniff_delimiter('') == ','
+    assert sniff_delimiter('city\nOslo\n') == ','
+
+def test_sniff_delimiter_ignores_quoted_commas():
+    text = 'city;temperature\n"Portland, OR";55.5\n"Portland, ME";48.0\n"Austin, TX";80.0\n'
+    assert sniff_delimiter(text) == ';'
+
+@pytest.mark.parametrize('sep', [',', ';', '\t', '|'])
+def test_parse_delimiter_variants(tmp_path, sep):
+    path = write_archive(tmp_path / 'cities.zip', {'weather.csv': csv_text(sep)})
+    table = parse_city_table(path, workers=1)
+    assert list(table['city']) == ['Oslo', 'Cairo', 'Lima']
+    assert list(table['temperature']) == [30.5, 95.0, 68.25]
+    assert list(table['humidity']) == [80.0, 20.0, 75.0]
+
+def test_parse_sniffs_only_whole_lines(tmp_path, monkeypatch):
+    # The read stops mid-row; the partial line must not change the verdict
+    monkeypatch.setattr(suggestion_data, 'SNIFF_BYTES', len(csv_text(';')) - 3)
+    path = write_archive(tmp_path / 'cities.zip', {'weather.csv': csv_text(';')})
+    assert list(parse_city_table(path, workers=1)['city']) == ['Oslo', 'Cairo', 'Lima']
+
+def test_schemas_are_cached_by_fingerprint(tmp_path, detections):
+    members = {'a.csv': csv_text(), 'b.csv': csv_text(';'), 'notes.csv': 'id,comment\n1,hello\n'}
+    path = write_archive(tmp_path / 'v1.zip', members)
+    parse_city_table(path, workers=1)
+    assert sorted(detections) == ['a.csv', 'b.csv', 'notes.csv']
+
+    with open(tmp_path / suggestion_data.SCHEMA_CACHE_FILE, encoding='utf-8') as f:
+        cached = json.load(f)
+    assert cached['version'] == suggestion_data.LAYOUT_VERSION
+    assert len(cached['schemas']) == 3
+    # The unusable file is remembered as such
+    assert {} in cached['schemas'].values()
+
+    # A new archive version in the same directory: nothing is detected again
+    detections.clear()
+    table = parse_city_table(write_archive(tmp_path / 'v2.zip', members), workers=1)
+    assert detections == []
+    assert len(table) == 6
+
+def test_changed_member_is_detected_again(tmp_path, detections):
+    parse_city_table(write_archive(tmp_path / 'v1.zip', {'a.csv': csv_text(), 'b.csv': csv_text()}), workers=1)
+
+    # b.csv gains a column, so its content fingerprint changes
+    changed = csv_text(header=('city', 'temperature', 'humidity', 'precip'),
+                       rows=[row + (1.5,) for row in ROWS])
+    detections.clear()
+    table = parse_city_table(write_archive(tmp_path / 'v2.zip', {'a.csv': csv_text(), 'b.csv': changed}),
+                             workers=1)
+    assert detections == ['b.csv']
+    assert table['precipitation'].notna().sum() == 3
+
+    # a.csv and the old b.csv had the same content, so one entry each for old and new content
+    with open(tmp_path / suggestion_data.SCHEMA_CACHE_FILE, encoding='utf-8') as f:
+        assert len(json.load(f)['schemas']) == 2
+
+def test_unusable_member_is_read_once_it_changes(tmp_path, detections):
+    parse_city_table(write_archive(tmp_path / 'v1.zip', {'a.csv': 'id,comment\n1,hello\n'}), workers=1)
+
+    detections.clear()
+    table = parse_city_table(write_archive(tmp_path / 'v2.zip', {'a.csv': csv_text()}), workers=1)
+    assert detections == ['a.csv']
+    assert len(table) == 3
+
+def test_cache_from_another_layout_version_is_ignored(tmp_path, detections):
+    members = {'a.csv': csv_text()}
+    path = write_archive(tmp_path / 'v1.zip', members)
+    with zipfile.ZipFile(path) as archive:
+        fingerprint = suggestion_data.member_fingerprint(archive.getinfo('a.csv'))
+    # A stale verdict (made under other keywords) would hide a usable file
+    cache_path = tmp_path / suggestion_data.SCHEMA_CACHE_FILE
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': 'old', 'schemas': {fingerprint: {}}}, f)
+
+    table = parse_city_table(path, workers=1)
+    assert detections == ['a.csv']
+    assert len(table) == 3
+    with open(cache_path, encoding='utf-8') as f:
+        cached = json.load(f)
+    assert cached['version'] == suggestion_data.LAYOUT_VERSION
+    assert cached['schemas'][fingerprint]['city'] == 'city'
+
+def test_unreadable_cache_is_ignored(tmp_path, detections):
+    with open(tmp_path / suggestion_data.SCHEMA_CACHE_FILE, 'w', encoding='utf-8') as f:
+        f.write('{not json')
+    table = parse_city_table(write_archive(tmp_path / 'v1.zip', {'a.csv': csv_text()}), workers=1)
+    assert detections == ['a.csv']
+    assert len(table) == 3
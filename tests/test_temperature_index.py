@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+
+from features.suggestion_data import TemperatureIndex
+
+@pytest.fixture
+def index():
+    frame = pd.DataFrame({
+        'city': ['Oslo', 'Cairo', 'Lima', 'Denver', 'Miami', 'Quito'],
+        'temperature': [30.0, 95.0, 68.0, 55.0, 85.0, 60.0],
+    })
+    return TemperatureIndex(frame)
+
+def cities(frame):
+    return list(frame['city'])
+
+def test_in_range_is_inclusive_and_sorted(index):
+    assert cities(index.in_range(55, 68)) == ['Denver', 'Quito', 'Lima']
+    assert cities(index.in_range(high=55)) == ['Oslo', 'Denver']
+    assert cities(index.in_range(low=85)) == ['Miami', 'Cairo']
+    assert len(index.in_range()) == len(index) == 6
+
+def test_in_range_empty(index):
+    assert index.in_range(70, 80).empty
+    assert index.in_range(100, 120).empty
+    # An inverted range is empty rather than an error
+    assert index.in_range(80, 40).empty
+
+def test_closest_orders_by_distance(index):
+    nearest = index.closest(62, k=3)
+    assert cities(nearest) == ['Quito', 'Lima', 'Denver']
+    assert list(nearest['relevance']) == [2, 6, 7]
+
+def test_closest_with_empty_range(index):
+    assert index.closest(75, k=3, low=70, high=80).empty
+    assert index.closest(75, k=0).empty
+
+def test_closest_target_outside_the_data(index):
+    assert cities(index.closest(-20, k=2)) == ['Oslo', 'Denver']
+    assert cities(index.closest(150, k=2)) == ['Cairo', 'Miami']
+
+def test_closest_target_outside_the_requested_range(index):
+    # The window must stay inside low..high however far away the target is
+    assert cities(index.closest(0, k=2, low=60, high=90)) == ['Quito', 'Lima']
+    assert cities(index.closest(200, k=2, low=50, high=70)) == ['Lima', 'Quito']
+
+def test_closest_with_k_larger_than_the_matches(index):
+    assert cities(index.closest(62, k=10, low=55, high=68)) == ['Quito', 'Lima', 'Denver']
+    assert len(index.closest(62, k=100)) == 6
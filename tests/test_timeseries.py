@@ -0,0 +1,180 @@
+import math
+import random
+import sqlite3
+import struct
+
+import pytest
+
+from data import timeseries
+from data.timeseries import BitReader, BitWriter, decode_block, encode_block
+
+def _bits(value):
+    """Exact bit pattern, so NaN and -0.0 compare as themselves."""
+    return struct.pack('>d', value)
+
+def assert_round_trip(timestamps, values):
+    payload = encode_block(timestamps, values)
+    decoded_timestamps, decoded_values = decode_block(payload, len(timestamps))
+    assert decoded_timestamps == [int(ts) for ts in timestamps]
+    assert [_bits(value) for value in decoded_values] == [_bits(float(value)) for value in values]
+    return payload
+
+def test_bit_writer_and_reader_round_trip_fields():
+    fields = [(1, 1), (0, 1), (5, 3), (0, 7), (127, 7), (2 ** 64 - 1, 64), (0, 64), (12345, 17)]
+    writer = BitWriter()
+    for value, width in fields:
+        writer.write(value, width)
+    writer.write_flags('1101')
+    payload = writer.to_bytes()
+    assert len(payload) == math.ceil((sum(width for _, width in fields) + 4) / 8)
+
+    reader = BitReader(payload)
+    assert [reader.read(width) for _, width in fields] == [value for value, _ in fields]
+    assert [reader.read_bit() for _ in range(4)] == ['1', '1', '0', '1']
+
+def test_empty_block():
+    assert encode_block([], []) == b''
+    assert decode_block(b'', 0) == ([], [])
+
+def test_single_point():
+    assert_round_trip([1700000000], [72.5])
+
+def test_regular_series_compresses():
+    timestamps = [1700000000 + 300 * i for i in range(timeseries.BLOCK_SIZE)]
+    values = [70.0 + (i // 10) * 0.5 for i in range(timeseries.BLOCK_SIZE)]
+    payload = assert_round_trip(timestamps, values)
+    # A raw point is 16 bytes; steady polling of a slow metric should cost a small fraction of that
+    assert len(payload) < 16 * len(timestamps) / 4
+
+@pytest.mark.parametrize('dod', [0, 1, -1, -63, 64, 65, -64, 255, 256, -255, -256, 2047, 2048, -2047, -2048,
+                                 10 ** 6, -10 ** 6])
+def test_every_delta_of_delta_bucket(dod):
+    # Steady 60s spacing, then one jump of dod, then steady again (a second dod of -dod)
+    timestamps = [1000, 1060, 1120, 1180 + dod, 1240 + dod, 1300 + dod]
+    assert_round_trip(timestamps, [1.0] * len(timestamps))
+
+def test_timestamps_going_backwards():
+    assert_round_trip([5000, 4000, 4500, 1, 10 ** 10], [1.0, 2.0, 3.0, 4.0, 5.0])
+
+@pytest.mark.parametrize('values', [
+    [0.0, 0.0, 0.0, 0.0],
+    [0.0, -0.0, 0.0, -0.0],
+    [1.0, float('nan'), 1.0, float('inf'), float('-inf')],
+    [5e-324, 1.7976931348623157e308, -5e-324, 1.0],
+    # XOR with no leading or trailing zero bits (all 64 bits meaningful)
+    [struct.unpack('>d', bytes.fromhex('0000000000000001'))[0],
+     struct.unpack('>d', bytes.fromhex('8000000000000000'))[0],
+     struct.unpack('>d', bytes.fromhex('fffffffffffffffe'))[0]],
+    # Leading zeros beyond 31 are clamped to 31
+    [1.0, struct.unpack('>d', struct.pack('>Q', struct.unpack('>Q', struct.pack('>d', 1.0))[0] ^ 1))[0], 1.0],
+])
+def test_special_values(values):
+    assert_round_trip([1000 + 60 * i for i in range(len(values))], values)
+
+def test_random_series():
+    generator = random.Random(28)
+    for _ in range(50):
+        count = generator.randint(1, timeseries.BLOCK_SIZE)
+        timestamp = generator.randint(0, 2 ** 40)
+        timestamps = []
+        for _ in range(count):
+            timestamps.append(timestamp)
+            timestamp += generator.choice([60, 60, 60, 300, generator.randint(-5000, 5000)])
+        values = [generator.choice([generator.uniform(-100, 120), round(generator.uniform(0, 100), 1), 42.0])
+                  for _ in range(count)]
+        assert_round_trip(timestamps, values)
+
+def test_query_range_reads_back_appended_and_bulk_loaded_points(tmp_path, monkeypatch):
+    monkeypatch.setattr(timeseries, 'TS_DB', str(tmp_path / 'series.db'))
+    monkeypatch.setattr(timeseries, 'BLOCK_SIZE', 4)
+    timeseries.init_ts_db()
+
+    timeseries.append_snapshots([('Denver', 1000 + 60 * i, {'temperature': 50.0 + i, 'humidity': None})
+                                 for i in range(10)])
+    timeseries.bulk_load('Boston', 'temperature', [(2000 + 60 * i, 30.0 + i) for i in range(10)])
+
+    assert timeseries.query_range('Denver', 'temperature') == [(1000 + 60 * i, 50.0 + i) for i in range(10)]
+    assert timeseries.query_range('Denver', 'humidity') == []
+    assert timeseries.query_range('Boston', 'temperature', start=2120, end=2300) == \
+        [(2000 + 60 * i, 30.0 + i) for i in range(2, 6)]
+    assert timeseries.query_range('Boston', 'temperature', min_value=37.5) == \
+        [(2000 + 60 * i, 30.0 + i) for i in range(8, 10)]
+    assert timeseries.storage_stats()['points'] == 20
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(timeseries, 'TS_DB', str(tmp_path / 'series.db'))
+    monkeypatch.setattr(timeseries, 'BLOCK_SIZE', 4)
+    timeseries.init_ts_db()
+
+def blocks(city, metric):
+    conn = sqlite3.connect(timeseries.TS_DB)
+    rows = conn.execute('SELECT count, sealed, min_value, max_value FROM ts_blocks WHERE city = ? AND metric = ? '
+                        'ORDER BY id', (city, metric)).fetchall()
+    conn.close()
+    return rows
+
+def test_appends_keep_the_tail_raw_until_full(store, monkeypatch):
+    encoded = []
+    real_encode = timeseries.encode_block
+    monkeypatch.setattr(timeseries, 'encode_block', lambda timestamps, values: encoded.append(len(timestamps))
+                        or real_encode(timestamps, values))
+
+    for i in range(6):
+        timeseries.append_snapshot('Denver', 1000 + 60 * i, {'temperature': 50.0 - i})
+    # Only the full block was compressed, once
+    assert encoded == [4]
+    assert blocks('Denver', 'temperature') == [(4, 1, 47.0, 50.0), (2, 0, 45.0, 46.0)]
+    assert timeseries.query_range('Denver', 'temperature') == [(1000 + 60 * i, 50.0 - i) for i in range(6)]
+    assert timeseries.query_range('Denver', 'temperature', start=1250, max_value=45.5) == [(1300, 45.0)]
+
+def test_out_of_order_point_seals_the_open_tail(store):
+    timeseries.append_snapshots([('Denver', ts, {'temperature': value})
+                                 for ts, value in [(1000, 1.0), (1060, 2.0), (900, 3.0), (1120, 4.0)]])
+    assert [row[:2] for row in blocks('Denver', 'temperature')] == [(2, 1), (2, 0)]
+    assert timeseries.query_range('Denver', 'temperature') == [(900, 3.0), (1000, 1.0), (1060, 2.0), (1120, 4.0)]
+
+def test_bulk_load_twice_stores_points_once(store):
+    points = [(2000 + 60 * i, 30.0 + i) for i in range(10)]
+    timeseries.bulk_load('Boston', 'temperature', points)
+    timeseries.bulk_load('Boston', 'temperature', points)
+    assert timeseries.query_range('Boston', 'temperature') == points
+    assert timeseries.storage_stats()['points'] == 10
+
+def test_bulk_load_over_live_appends(store):
+    # Live appends before, inside and after the backfilled range
+    timeseries.append_snapshots([('Boston', ts, {'temperature': 0.0}) for ts in (1000, 2000, 2060, 2090)])
+    timeseries.append_snapshots([('Boston', 9000, {'temperature': 0.0})])
+    timeseries.bulk_load('Boston', 'temperature', [(2000 + 60 * i, 30.0 + i) for i in range(5)] + [(2060, 99.0)])
+
+    assert timeseries.query_range('Boston', 'temperature') == \
+        [(1000, 0.0), (2000, 30.0), (2060, 99.0), (2120, 32.0), (2180, 33.0), (2240, 34.0), (9000, 0.0)]
+    # Other series are untouched
+    timeseries.append_snapshots([('Boston', 2000, {'humidity': 40.0})])
+    timeseries.bulk_load('Boston', 'temperature', [(2000, 30.0)])
+    assert timeseries.query_range('Boston', 'humidity') == [(2000, 40.0)]
+
+    # Appending carries on after the backfill
+    timeseries.append_snapshots([('Boston', 9060, {'temperature': 1.0})])
+    assert timeseries.query_range('Boston', 'temperature', start=9000) == [(9000, 0.0), (9060, 1.0)]
+
+def test_init_adds_the_sealed_column_to_an_old_store(store):
+    conn = sqlite3.connect(timeseries.TS_DB)
+    conn.execute('DROP TABLE ts_blocks')
+    conn.execute('''
+        CREATE TABLE ts_blocks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, city TEXT NOT NULL, metric TEXT NOT NULL,
+            start_ts INTEGER NOT NULL, end_ts INTEGER NOT NULL, count INTEGER NOT NULL,
+            min_value REAL, max_value REAL, payload BLOB NOT NULL
+        )
+    ''')
+    conn.execute('INSERT INTO ts_blocks (city, metric, start_ts, end_ts, count, min_value, max_value, payload) '
+                 'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                 ('Denver', 'temperature', 1000, 1060, 2, 1.0, 2.0, encode_block([1000, 1060], [1.0, 2.0])))
+    conn.commit()
+    conn.close()
+
+    timeseries.init_ts_db()
+    timeseries.append_snapshot('Denver', 1120, {'temperature': 3.0})
+    assert timeseries.query_range('Denver', 'temperature') == [(1000, 1.0), (1060, 2.0), (1120, 3.0)]
+    assert [row[:2] for row in blocks('Denver', 'temperature')] == [(2, 1), (1, 0)]
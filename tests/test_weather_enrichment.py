@@ -0,0 +1,96 @@
+import math
+
+import numpy as np
+import pytest
+
+from features.weather_enrichment import (
+    accumulations, alert_flags, enrich_columns, enrich_snapshot, heat_index, wind_chill
+)
+
+def rothfusz(t, rh):
+    """The unadjusted NWS regression, to isolate the humidity adjustments."""
+    return (-42.379 + 2.04901523 * t + 10.14333127 * rh - 0.22475541 * t * rh
+            - 6.83783e-3 * t * t - 5.481717e-2 * rh * rh + 1.22874e-3 * t * t * rh
+            + 8.5282e-4 * t * rh * rh - 1.99e-6 * t * t * rh * rh)
+
+# (temperature °F, relative humidity %, heat index from the NWS heat index chart)
+NWS_HEAT_INDEX = [
+    (80, 40, 80), (90, 50, 95), (90, 60, 100), (90, 70, 106), (96, 65, 121),
+    (100, 40, 109), (100, 50, 118), (104, 40, 119), (86, 90, 105),
+]
+
+@pytest.mark.parametrize('temperature, humidity, expected', NWS_HEAT_INDEX)
+def test_heat_index_matches_nws_chart(temperature, humidity, expected):
+    assert round(heat_index(temperature, humidity)) == expected
+
+def test_heat_index_below_80_uses_the_simple_formula():
+    assert heat_index(70, 50) == pytest.approx(0.5 * (70 + 61 + 2 * 1.2 + 50 * 0.094))
+
+def test_heat_index_low_humidity_adjustment():
+    adjustment = (13 - 10) / 4 * math.sqrt((17 - abs(100 - 95)) / 17)
+    assert heat_index(100, 10) == pytest.approx(rothfusz(100, 10) - adjustment)
+    # Only applies between 80 and 112°F
+    assert heat_index(115, 10) == pytest.approx(rothfusz(115, 10))
+    assert heat_index(100, 13) == pytest.approx(rothfusz(100, 13))
+
+def test_heat_index_high_humidity_adjustment():
+    adjustment = (90 - 85) / 10 * (87 - 85) / 5
+    assert heat_index(85, 90) == pytest.approx(rothfusz(85, 90) + adjustment)
+    # Only applies up to 87°F
+    assert heat_index(88, 90) == pytest.approx(rothfusz(88, 90))
+
+def test_heat_index_on_arrays():
+    result = heat_index(np.array([90, 100]), np.array([50, 40]))
+    assert np.round(result).tolist() == [95, 109]
+
+# (temperature °F, wind mph, wind chill from the NWS wind chill chart)
+NWS_WIND_CHILL = [(40, 5, 36), (30, 10, 21), (5, 20, -15), (0, 15, -19), (-10, 30, -39)]
+
+@pytest.mark.parametrize('temperature, wind_speed, expected', NWS_WIND_CHILL)
+def test_wind_chill_matches_nws_chart(temperature, wind_speed, expected):
+    assert round(wind_chill(temperature, wind_speed)) == expected
+
+def test_wind_chill_outside_its_range_is_the_temperature():
+    assert wind_chill(55, 20) == 55
+    assert wind_chill(20, 2) == 20
+
+def test_accumulations():
+    snow, ice = accumulations([20, 30, 40], [0, 25.4, 25.4], [2.54, 2.54, 0])
+    assert (snow, ice) == (2.0, 1.0)
+    snow, ice = accumulations([[20, 40], [40, 40]], [[25.4, 25.4], [25.4, 0]], [[0, 0], [np.nan, 25.4]])
+    assert snow.tolist() == [0.0, 10.0]
+    assert ice.tolist() == [1.0, 0.0]
+
+@pytest.mark.parametrize('description, size', [
+    ("Hail up to 1.75 inches in diameter", 1.75),
+    ("1 inch hail possible", 1.0),
+    ("Quarter size hail reported", 1.0),
+    ("Golf ball size hail and 2.5 inch hail", 2.5),
+    ("Small hail. Rain totals of 2 inches", 0),
+    ("Damaging winds", 0),
+])
+def test_hail_size_from_alert_text(description, size):
+    assert alert_flags([{'event': 'Severe Thunderstorm Warning', 'description': description}])['hail_size'] == size
+
+def test_alert_flags():
+    flags = alert_flags([{'event': 'Tornado Warning'}, {'event': 'Flash Flood Watch'}])
+    assert flags == {'tornado_detected': True, 'flood_detected': True, 'hail_size': 0}
+    assert alert_flags(None) == {'tornado_detected': False, 'flood_detected': False, 'hail_size': 0}
+
+def test_enrich_snapshot_summarizes_and_drops_hourly():
+    data = {'temperature': 90, 'humidity': 50, 'wind_speed': 5, 'heat_index': 120,
+            'hourly': [{'temp': 30, 'rain': 25.4}, {'temp': 28, 'snow': 2.54}]}
+    enrich_snapshot(data)
+    assert 'hourly' not in data
+    # Values that were already there are kept
+    assert data['heat_index'] == 120
+    assert data['wind_chill'] == 90
+    assert (data['snow_accumulation'], data['ice_accumulation']) == (1.0, 1.0)
+
+def test_enrich_columns_adds_derived_columns_only():
+    columns = enrich_columns({'temperature': np.array([90.0, 0.0]), 'humidity': [50, None],
+                              'wind_speed': np.array([5.0, 15.0])})
+    assert np.round(columns['heat_index'][:1]).tolist() == [95]
+    assert math.isnan(columns['heat_index'][1])
+    assert np.round(columns['wind_chill']).tolist() == [90, -19]
+    assert 'snow_accumulation' not in columns